@@ -1,5 +1,4 @@
 from .pypath import (
-    iter_submodules
+    lazy_exports
 )
-for mod in iter_submodules():
-    exec("from ." + mod + " import *")
+lazy_exports(globals())
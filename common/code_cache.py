@@ -0,0 +1,139 @@
+__all__ = [
+    "compile_cached"
+  , "code_cache_path"
+  , "code_names"
+]
+
+from hashlib import (
+    sha1
+)
+from marshal import (
+    dump,
+    load
+)
+from os import (
+    environ,
+    getpid,
+    makedirs,
+    remove,
+    stat
+)
+from os.path import (
+    abspath,
+    expanduser,
+    isfile,
+    join
+)
+from types import (
+    CodeType
+)
+
+try:
+    from importlib.util import (
+        MAGIC_NUMBER
+    )
+except ImportError: # Py2
+    from imp import (
+        get_magic
+    )
+    MAGIC_NUMBER = get_magic()
+
+try:
+    from os import (
+        replace
+    )
+except ImportError: # Py2
+    from os import (
+        rename
+    )
+
+    def replace(src, dst):
+        if isfile(dst):
+            remove(dst)
+        rename(src, dst)
+
+
+# Directory for code objects of scripts compiled by `compile_cached`. Empty
+# value disables the cache.
+CODE_CACHE_DIR = environ.get("QDT_CODE_CACHE", join(
+    environ.get("XDG_CACHE_HOME") or join(expanduser("~"), ".cache"),
+    "qdt",
+    "code"
+))
+
+
+def _bytes(s):
+    return s if isinstance(s, bytes) else s.encode("utf-8")
+
+
+def code_cache_path(filename):
+    "Path to cached code of the file."
+
+    h = sha1(_bytes(abspath(filename)) + b"\0" + _bytes(filename))
+    return join(CODE_CACHE_DIR, h.hexdigest() + ".code")
+
+
+def _file_key(filename):
+    st = stat(filename)
+    try:
+        mtime = st.st_mtime_ns
+    except AttributeError: # Py2
+        mtime = st.st_mtime
+    return (filename, abspath(filename), st.st_size, mtime)
+
+
+def compile_cached(filename):
+    """ Compiles the script like `compile` in "exec" mode does. Code is
+cached like Python caches modules in `__pycache__`. Cached code is used when
+interpreter version, size and modification time of the file are same.
+    """
+
+    if not CODE_CACHE_DIR:
+        with open(filename, "rb") as f:
+            return compile(f.read(), filename, "exec")
+
+    key = _file_key(filename)
+    cache_path = code_cache_path(filename)
+
+    try:
+        with open(cache_path, "rb") as f:
+            if f.read(len(MAGIC_NUMBER)) == MAGIC_NUMBER:
+                if load(f) == key:
+                    return load(f)
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        pass
+
+    with open(filename, "rb") as f:
+        code = compile(f.read(), filename, "exec")
+
+    # A failure to cache is not an error.
+    try:
+        try:
+            makedirs(CODE_CACHE_DIR)
+        except OSError:
+            pass # exists
+
+        tmp_path = "%s.%d.tmp" % (cache_path, getpid())
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC_NUMBER)
+            dump(key, f)
+            dump(code, f)
+        replace(tmp_path, cache_path)
+    except (IOError, OSError):
+        pass
+
+    return code
+
+
+def code_names(code):
+    """ Names (globals, attributes...) used by the code object and code
+objects nested in it (functions, classes, ...).
+    """
+
+    names = set()
+    stack = [code]
+    while stack:
+        code = stack.pop()
+        names.update(code.co_names)
+        stack.extend(c for c in code.co_consts if isinstance(c, CodeType))
+    return names
@@ -106,12 +106,11 @@ class CodeWriter(object):
         """
 
         if self.new_line:
-            self.w.write(self.s.prefix)
-            self.w.write(self.s.current_indent)
+            s = self.s
+            self.w.write(s.prefix + s.current_indent + suffix + "\n")
         else:
             self.new_line = True
-
-        self.w.write(suffix + "\n")
+            self.w.write(suffix + "\n")
 
     def write(self, string = ""):
         """ Appends :string: to current line.
@@ -122,8 +121,8 @@ class CodeWriter(object):
         except _empty_ last line.
         """
 
-        lines = string.split("\n")
-        if len(lines) > 1:
+        if "\n" in string:
+            lines = string.split("\n")
             for l in lines[:-1]:
                 self.line(l)
             string = lines[-1]
@@ -131,11 +130,11 @@ class CodeWriter(object):
                 return
 
         if self.new_line:
-            self.w.write(self.s.prefix)
-            self.w.write(self.s.current_indent)
+            s = self.s
+            self.w.write(s.prefix + s.current_indent + string)
             self.new_line = False
-
-        self.w.write(string)
+        else:
+            self.w.write(string)
 
     def join(self, delim, items, out_method):
         "Prints items that are separated by a delimiter."
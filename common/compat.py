@@ -5,12 +5,17 @@ __all__ = [
   , "characters"
   , "HelpFormatter"
   , "uname"
+  , "has_fork"
+  , "fork_pool"
 ]
 
 from .pypath import (
     abspath,
     pythonpath
 )
+from .code_cache import (
+    compile_cached
+)
 from os.path import (
     dirname
 )
@@ -29,12 +34,37 @@ from argparse import (
     _CountAction,
     _StoreConstAction
 )
+from multiprocessing import (
+    Pool
+)
+import os
+
+try:
+    from multiprocessing import (
+        get_context
+    )
+except ImportError: # Py2, `Pool` forks on POSIX
+    get_context = None
+
+
+# Forked processes inherit the state of the parent (loaded modules, caches,
+# global variables...). Other start methods do not.
+has_fork = hasattr(os, "fork")
+
+
+def fork_pool(jobs):
+    "Returns `Pool` of forked processes. `fork` must be supported."
+
+    if get_context is None:
+        return Pool(jobs)
+    return get_context("fork").Pool(jobs)
 
 
 def execfile(filename, globals = None, locals = None):
     """ Cross Python wrapper for `exec`. Py2's `execfile` analogue.
 Preservers file name for the script (`__file__`), a debugger and an exception
-traceback. Executes the script as "__main__".
+traceback. Executes the script as "__main__". Compiled code is cached, see
+`compile_cached`.
 
 Notes:
  *  Using same `dict` for globals and locals of `execfile` allows a script to
@@ -42,8 +72,7 @@ Notes:
     spaces (custom functions, classes, ...) _without_ `global` declaration.
     """
 
-    with open(filename, "rb") as f:
-        content = f.read()
+    code = compile_cached(filename)
 
     if globals is None:
         globals = {}
@@ -53,8 +82,6 @@ Notes:
 
     file_path = abspath(dirname(filename))
 
-    code = compile(content, filename, "exec")
-
     with pythonpath(file_path):
         exec(code, globals, locals)
 
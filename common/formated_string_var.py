@@ -4,16 +4,28 @@ __all__ = [
   , "as_variable"
 ]
 
-from six.moves.tkinter import (
-    Variable as TkVariable,
-    StringVar
-)
 from .variable import (
     Variable
 )
+from six import (
+    PY3
+)
+import sys
+
+
+# Tk is only used if it's imported by the program (a GUI). Tk variables
+# cannot exist otherwise. Importing Tk is long and it can be absent.
+TK_MODULE = "tkinter" if PY3 else "Tkinter"
 
+def tk_module():
+    return sys.modules.get(TK_MODULE)
 
-variables = (Variable, TkVariable)
+
+def variable_types():
+    tk = tk_module()
+    if tk is None:
+        return (Variable,)
+    return (Variable, tk.Variable)
 
 
 def as_variable(*args):
@@ -25,6 +37,7 @@ of non-`Variable` `args` cannot be accounted.
 
     def create_variable(f):
         var = Variable()
+        variables = variable_types()
 
         def _on_arg_changed(*_):
             "When an arg changed, this function updates var using f"
@@ -74,6 +87,12 @@ class FormatVar(Variable):
         # TODO: move that mechanics elsewhere making `FormatVar` Tk
         # independent.
 
+        tk = tk_module()
+        if tk is None:
+            return do_format
+
+        StringVar = tk.StringVar
+
         # Initial setting
         ret = StringVar(value = do_format.get())
 
@@ -1,14 +1,25 @@
 __all__ = [
     "GGB_IBY"
-  , "CommitDesc"
+  , "CommitGraph"
   , "iter_chunks"
   , "git_diff2delta_intervals"
   , "fast_repo_clone"
+  , "GitTree"
 ]
 
 from collections import (
     namedtuple
 )
+from array import (
+    array
+)
+from binascii import (
+    hexlify,
+    unhexlify
+)
+from struct import (
+    Struct
+)
 from re import (
     compile
 )
@@ -19,9 +30,32 @@ from tempfile import (
     mkdtemp
 )
 from os.path import (
-    join
+    join,
+    isfile
+)
+from os import (
+    getpid,
+    remove
+)
+from subprocess import (
+    Popen,
+    PIPE
 )
 
+try:
+    from os import (
+        replace
+    )
+except ImportError: # Py2
+    from os import (
+        rename
+    )
+
+    def replace(src, dst):
+        if isfile(dst):
+            remove(dst)
+        rename(src, dst)
+
 
 # Iterations Between Yields of Git Graph Building task
 GGB_IBY = 100
@@ -90,98 +124,243 @@ def git_diff2delta_intervals(diff):
     return intervals
 
 
-class CommitDesc(object):
-    def __init__(self, sha, parents, children):
-        self.sha = sha
-        self.parents = parents
-        self.children = children
+class CommitGraph(object):
+    """ Git commit graph in compact array form.
 
-        # serial number according to the topological sorting
-        self.num = None
+Commits are numbered according to the topological sorting (parents before
+children). A number is the index of the commit in the arrays below.
+
+:shas: list of SHA1 of commits
+:index: SHA1 -> commit number
+:parents, children: concatenated lists of commit numbers, edges of commit `i`
+    are in `parents[parent_offsets[i]:parent_offsets[i + 1]]` and in
+    `children[child_offsets[i]:child_offsets[i + 1]]` respectively
+
+The graph can be saved to a file and extended with new commits later.
+    """
+
+    def __init__(self):
+        self.shas = []
+        self.index = {}
+        self.parent_offsets = array("i", [0])
+        self.parents = array("i")
+        self.child_offsets = array("i", [0])
+        self.children = array("i")
+
+    def __len__(self):
+        return len(self.shas)
+
+    def __contains__(self, sha):
+        return sha in self.index
+
+    def iter_parents(self, i):
+        offsets = self.parent_offsets
+        return iter(self.parents[offsets[i]:offsets[i + 1]])
+
+    def iter_children(self, i):
+        offsets = self.child_offsets
+        return iter(self.children[offsets[i]:offsets[i + 1]])
+
+    def iter_heads(self):
+        "Numbers of commits without children."
+        offsets = self.child_offsets
+        for i in range(len(self.shas)):
+            if offsets[i] == offsets[i + 1]:
+                yield i
+
+    def count_ancestors(self, commits):
+        """ Counts commits by subsets of `commits` (numbers) they are
+ancestors of. A commit is an ancestor of itself. Single pass over the graph.
+
+:returns: {mask : count}, bit `i` of `mask` is set if the counted commits
+    are ancestors of `commits[i]`. Zero mask is not counted.
+        """
+
+        masks = {}
+        for i, c in enumerate(commits):
+            masks[c] = masks.get(c, 0) | (1 << i)
+
+        counts = {}
+        if not masks:
+            return counts
+
+        offsets = self.parent_offsets
+        parents = self.parents
+
+        # Children are numbered after parents.
+        for c in range(max(masks), -1, -1):
+            m = masks.pop(c, 0)
+            if not m:
+                continue
+
+            counts[m] = counts.get(m, 0) + 1
+
+            for p in parents[offsets[c]:offsets[c + 1]]:
+                masks[p] = masks.get(p, 0) | m
+
+        return counts
+
+    def co_build(self, repo):
+        """ Builds the graph of all commits reachable from any reference using
+single `git rev-list` pass. A non-empty graph is extended with commits which
+are not reachable from its heads. New commits get next numbers.
+        """
+        shas = self.shas
+
+        proc = Popen(
+            [
+                "git", "--git-dir", repo.git_dir, "rev-list",
+                "--topo-order", "--reverse", "--parents", "--all", "--stdin"
+            ],
+            stdin = PIPE,
+            stdout = PIPE
+        )
+
+        # Commits of the graph are ancestors of its heads.
+        proc.stdin.write(b"".join(
+            b"^" + shas[i].encode("ascii") + b"\n" for i in self.iter_heads()
+        ))
+        proc.stdin.close()
+
+        index = self.index
+        parent_offsets = self.parent_offsets
+        parents = self.parents
 
-    @classmethod
-    def co_build_git_graph(klass, repo, commit_desc_nodes):
         # iterations to yield
         i2y = GGB_IBY
 
-        # n is serial number according to the topology sorting
-        n = 0
-        # to_enum is used during topological sorting
-        # it contains commit to enumerate
-        to_enum = None
-        # build_stack contains edges represented by tuples
-        # (parent, child), where parent is instance of
-        # git.Commit, child is instance of QemuCommitDesc
-        build_stack = []
-        for head in repo.references:
-            # skip processed heads
-            if head.commit.hexsha in commit_desc_nodes:
-                continue
+        try:
+            for line in proc.stdout:
+                line = line.split()
+                sha = line[0].decode("ascii")
 
-            head_desc = klass(head.commit.hexsha, [], [])
-            commit_desc_nodes[head.commit.hexsha] = head_desc
-            # add edges connected to head being processed
-            for p in head.commit.parents:
-                build_stack.append((p, head_desc))
-
-            while build_stack:
-                parent, child_commit_desc = build_stack.pop()
-
-                try:
-                    parent_desc = commit_desc_nodes[parent.hexsha]
-                except KeyError:
-                    parent_desc = klass(parent.hexsha, [], [])
-                    commit_desc_nodes[parent.hexsha] = parent_desc
-
-                    if parent.parents:
-                        for p in parent.parents:
-                            build_stack.append((p, parent_desc))
-                    else:
-                        # current edge parent is an elder commit in the tree,
-                        # that is why we should enumerate starting from it
-                        to_enum = parent_desc
-                else:
-                    # the existence of parent_desc means that parent has been
-                    # enumerated before. Hence, we starts enumeration from
-                    # it's child
-                    to_enum = child_commit_desc
-                finally:
-                    parent_desc.children.append(child_commit_desc)
-                    child_commit_desc.parents.append(parent_desc)
+                for p in line[1:]:
+                    try:
+                        parents.append(index[p.decode("ascii")])
+                    except KeyError:
+                        raise ValueError("Parent %s of commit %s is not "
+                            "listed before it" % (p.decode("ascii"), sha)
+                        )
+
+                index[sha] = len(shas)
+                shas.append(sha)
+                parent_offsets.append(len(parents))
 
                 if i2y <= 0:
                     yield True
                     i2y = GGB_IBY
                 else:
                     i2y -= 1
+        finally:
+            proc.stdout.close()
+            proc.wait()
+
+        if proc.returncode:
+            raise RuntimeError("git rev-list failed with code %d" % (
+                proc.returncode
+            ))
+
+        if len(self.child_offsets) == len(parent_offsets):
+            # no new commits
+            return
+
+        yield True
+
+        # Children lists are built by counting sort of (parent, child) edges.
+        n = len(shas)
+        child_offsets = array("i", [0]) * (n + 1)
+        for p in parents:
+            child_offsets[p + 1] += 1
+        for i in range(n):
+            child_offsets[i + 1] += child_offsets[i]
+
+        yield True
+
+        children = array("i", [0]) * len(parents)
+        fill = array("i", child_offsets[:n])
+        for c in range(n):
+            for p in parents[parent_offsets[c]:parent_offsets[c + 1]]:
+                children[fill[p]] = c
+                fill[p] += 1
+
+            if i2y <= 0:
+                yield True
+                i2y = GGB_IBY
+            else:
+                i2y -= 1
+
+        self.child_offsets = child_offsets
+        self.children = children
+
+    # File layout (native byte order, the file is a local cache):
+    #     magic, version, number of commits, number of edges
+    #     binary SHA1s
+    #     parent_offsets, parents, child_offsets, children ('i' arrays)
+
+    def save(self, path):
+        "Saves the graph to file. The file is replaced atomically."
+
+        n, e = len(self.shas), len(self.parents)
+
+        tmp_path = "%s.%d.tmp" % (path, getpid())
+        with open(tmp_path, "wb") as f:
+            f.write(commit_graph_header.pack(COMMIT_GRAPH_MAGIC,
+                COMMIT_GRAPH_VERSION, n, e
+            ))
+            f.write(unhexlify("".join(self.shas).encode("ascii")))
+            for a in (self.parent_offsets, self.parents, self.child_offsets,
+                self.children
+            ):
+                a.tofile(f)
+
+        replace(tmp_path, path)
+
+    @classmethod
+    def load(klass, path):
+        "Loads graph saved by `save`. Raises `ValueError` on bad file."
+
+        with open(path, "rb") as f:
+            header = f.read(commit_graph_header.size)
+            if len(header) != commit_graph_header.size:
+                raise ValueError("File is too short")
+
+            magic, version, n, e = commit_graph_header.unpack(header)
+            if magic != COMMIT_GRAPH_MAGIC:
+                raise ValueError("Not a commit graph file")
+            if version != COMMIT_GRAPH_VERSION:
+                raise ValueError("Commit graph version %u is not supported"
+                    % version
+                )
+
+            raw = f.read(20 * n)
+            if len(raw) != 20 * n:
+                raise ValueError("File is too short")
+            hexes = hexlify(raw).decode("ascii")
+
+            self = klass()
+            self.shas = shas = [hexes[i:i + 40] for i in range(0, 40 * n, 40)]
+            self.index = dict((sha, i) for i, sha in enumerate(shas))
 
-                # numbering is performed from the 'to_enum' to either a leaf
-                # commit or a commit just before a merge which have at least
-                # one parent without number (except the commit)
-                while to_enum is not None:
-                    e = to_enum
-                    to_enum = None
-                    # if the number of parents in the commit_desc_nodes
-                    # is equal to the number of parents in the repo,
-                    # then all parents were numbered (added) earlier
-                    # according to the graph building algorithm,
-                    # else we cannot assign number to the commit yet
-                    if len(e.parents) == len(repo.commit(e.sha).parents):
-                        e.num = n
-                        n = n + 1
-                        # according to the algorithm, only one child
-                        # have no number. Other children either have
-                        # been enumerated already or are not added yet
-                        for c in e.children:
-                            if c.num is None:
-                                to_enum = c
-                                break
-
-                    if i2y <= 0:
-                        yield True
-                        i2y = GGB_IBY
-                    else:
-                        i2y -= 1
+            try:
+                for name, size in (
+                    ("parent_offsets", n + 1),
+                    ("parents", e),
+                    ("child_offsets", n + 1),
+                    ("children", e)
+                ):
+                    a = array("i")
+                    a.fromfile(f, size)
+                    setattr(self, name, a)
+            except EOFError:
+                raise ValueError("File is too short")
+
+        return self
+
+
+COMMIT_GRAPH_MAGIC = b"QCG\x00"
+COMMIT_GRAPH_VERSION = 1
+
+commit_graph_header = Struct("=4sIII")
 
 
 def fast_repo_clone(repo, version = None, prefix = "repo"):
@@ -235,3 +414,124 @@ as fast as possible. A clone is neither honest nor independent, so be careful.
         git.submodule("update", "--init", "--recursive")
 
     return new_repo
+
+
+class GitCatFile(object):
+    """ Reads objects from Git object store using single `git cat-file --batch`
+process for all requests. The process is started on first request in each OS
+process (because of `fork`).
+    """
+
+    def __init__(self, git_dir):
+        self.git_dir = git_dir
+        self.proc = None
+        self.pid = None
+
+    def read(self, sha):
+        if self.pid != getpid():
+            self.proc = Popen(
+                ["git", "--git-dir", self.git_dir, "cat-file", "--batch"],
+                stdin = PIPE,
+                stdout = PIPE
+            )
+            self.pid = getpid()
+
+        proc = self.proc
+        proc.stdin.write(sha.encode("ascii") + b"\n")
+        proc.stdin.flush()
+
+        # "<sha> <type> <size>" or "<object> missing"
+        header = proc.stdout.readline().split()
+        if len(header) != 3:
+            raise IOError("Git object %s is missing" % sha)
+
+        size = int(header[2])
+        data = proc.stdout.read(size)
+        # trailing new line
+        proc.stdout.read(1)
+        return data
+
+    def close(self):
+        if self.proc is not None and self.pid == getpid():
+            self.proc.stdin.close()
+            self.proc.wait()
+        self.proc = None
+        self.pid = None
+
+
+class GitTree(object):
+    """ Files of a Git commit read directly from the object store, without
+checking out.
+
+:param paths: limits the tree to those folders/files
+
+Paths in the tree are relative to the repository root and are separated by
+"/". The tree can be mounted at `root` path (see `source.model.mount_tree`).
+    """
+
+    def __init__(self, repo, version, paths = None, root = None):
+        self.sha = repo.commit(version).hexsha
+        self.root = repo.working_tree_dir if root is None else root
+
+        args = ["-r", "-z", "--full-tree", self.sha]
+        if paths:
+            args.append("--")
+            args.extend(paths)
+
+        # path -> blob SHA1
+        self.blobs = blobs = {}
+        # folder path -> list of entry names
+        self.dirs = dirs = {"" : []}
+
+        for entry in repo.git.ls_tree(*args).split("\0"):
+            if not entry:
+                continue
+
+            info, path = entry.split("\t", 1)
+            _, obj_type, sha = info.split()
+            if obj_type != "blob":
+                # submodules
+                continue
+
+            blobs[path] = sha
+
+            # Register the path in all folders it's inside.
+            while path:
+                parts = path.rsplit("/", 1)
+                if len(parts) == 1:
+                    parent, name = "", parts[0]
+                else:
+                    parent, name = parts
+
+                if parent in dirs:
+                    dirs[parent].append(name)
+                    break
+
+                dirs[parent] = [name]
+                path = parent
+
+        self.cat_file = GitCatFile(repo.git_dir)
+
+    def isfile(self, path):
+        return path in self.blobs
+
+    def isdir(self, path):
+        return path in self.dirs
+
+    def listdir(self, path):
+        try:
+            return list(self.dirs[path])
+        except KeyError:
+            raise OSError("No such folder in Git tree: " + path)
+
+    def read(self, path):
+        "Returns file content (`bytes`)."
+        try:
+            sha = self.blobs[path]
+        except KeyError:
+            raise IOError("No such file in Git tree: " + path)
+
+        return self.cat_file.read(sha)
+
+    def close(self):
+        self.cat_file.close()
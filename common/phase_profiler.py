@@ -0,0 +1,125 @@
+__all__ = [
+    "PhaseProfiler"
+  , "Phase"
+]
+
+from json import (
+    dump
+)
+from time import (
+    time
+)
+import sys
+
+try:
+    from time import (
+        process_time
+    )
+except ImportError: # Py2
+    from time import (
+        clock as process_time
+    )
+
+try:
+    from resource import (
+        RUSAGE_SELF,
+        getrusage
+    )
+except ImportError: # Windows
+    getrusage = None
+
+
+def max_rss():
+    "Peak resident set size of the process, KiB (`None` if unknown)."
+    if getrusage is None:
+        return None
+    rss = getrusage(RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # bytes
+        rss >>= 10
+    return rss
+
+
+class Phase(object):
+    """ Measurements of a phase of `PhaseProfiler`.
+
+:wall: wall clock time, seconds. Note that time of other coroutines is
+    included if the phase yields.
+:cpu: CPU time of the process, seconds
+:max_rss_delta: growth of peak RSS during the phase, KiB
+:counts: {name: number} of processed objects, see `count`
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.wall = None
+        self.cpu = None
+        self.max_rss_delta = None
+        self.counts = {}
+
+    def count(self, name, value):
+        self.counts[name] = value
+
+    def __enter__(self):
+        self._rss0 = max_rss()
+        self._cpu0 = process_time()
+        self._wall0 = time()
+        return self
+
+    def __exit__(self, *_):
+        self.wall = time() - self._wall0
+        self.cpu = process_time() - self._cpu0
+        rss0 = self._rss0
+        if rss0 is not None:
+            self.max_rss_delta = max_rss() - rss0
+
+    def to_dict(self):
+        return dict(
+            name = self.name,
+            wall = self.wall,
+            cpu = self.cpu,
+            max_rss_delta = self.max_rss_delta,
+            counts = self.counts,
+        )
+
+
+class PhaseProfiler(object):
+    """ Records consequent phases of a long process. Usage:
+
+with profiler.phase("name") as p:
+    ...
+    p.count("objects", n)
+    """
+
+    def __init__(self):
+        self.phases = []
+
+    def phase(self, name):
+        p = Phase(name)
+        self.phases.append(p)
+        return p
+
+    def to_dict(self):
+        return dict(
+            phases = list(p.to_dict() for p in self.phases),
+            max_rss = max_rss(),
+        )
+
+    def dump(self, path, **extra):
+        "Saves phases as JSON. `extra` items are added to the root object."
+        data = self.to_dict()
+        data.update(extra)
+        with open(path, "w") as f:
+            dump(data, f, indent = 4, sort_keys = True)
+
+    def report(self):
+        print("%-24s %9s %9s %10s" % ("Phase", "Wall, s", "CPU, s", "RSS+, KiB"))
+        for p in self.phases:
+            if p.wall is None:
+                # not finished
+                continue
+            counts = ", ".join("%s: %s" % i for i in sorted(p.counts.items()))
+            print("%-24s %9.3f %9.3f %10s %s" % (p.name, p.wall, p.cpu,
+                "-" if p.max_rss_delta is None else p.max_rss_delta,
+                counts
+            ))
@@ -14,6 +14,16 @@ from six import (
 from itertools import (
     count
 )
+from os import (
+    getpid,
+    remove
+)
+from os.path import (
+    isfile
+)
+from re import (
+    compile
+)
 from .code_writer import (
     CodeWriter
 )
@@ -25,6 +35,21 @@ from .visitor import (
     ObjectVisitor
 )
 
+try:
+    from os import (
+        replace
+    )
+except ImportError: # Py2
+    from os import (
+        rename
+    )
+
+    def replace(src, dst):
+        if isfile(dst):
+            remove(dst)
+        rename(src, dst)
+
+
 const_types = (float, text_type, binary_type, bool) + integer_types
 
 # Those standard types are supported by `PyGenerator` without specific code.
@@ -35,6 +60,44 @@ GENERATING = 1
 GENERATED = 2
 
 
+# Characters those cannot be in a string literal as is: control, backslash
+# and non-ASCII.
+re_const_special = compile(u"[^\\x20-\\x5b\\x5d-\\x7f]")
+re_const_wide = compile(u"[^\\x00-\\xff]")
+
+
+class ConstEscapes(dict):
+    "Memoized escape sequences of characters for `PyGenerator.gen_const`."
+
+    def __missing__(self, ch):
+        code = ord(ch)
+
+        if code > 0xFFFF: # 4-byte unicode
+            esc = "\\U%08x" % code
+        elif code > 0xFF: # 2-byte unicode
+            esc = "\\u%04x" % code
+        elif code == 92: # \
+            esc = "\\\\"
+        elif code == 0x0A:
+            esc = "\\n"
+        elif code == 0x0D:
+            esc = "\\r"
+        elif code == 0x09:
+            esc = "\\t"
+        else: # control or non-ASCII code
+            esc = "\\x%02x" % code
+
+        self[ch] = esc
+        return esc
+
+
+const_escapes = ConstEscapes()
+
+
+def _escape_const_char(match):
+    return const_escapes[match.group()]
+
+
 class PyGenVisitor(ObjectVisitor):
 
     def __init__(self, root, backend = None, **genkw):
@@ -91,7 +154,7 @@ class PyGenVisitor(ObjectVisitor):
         # descriptor like `property`.
         self.keepalive = []
 
-        ret = super(PyGenVisitor, self).visit()
+        self.visit_iteratively()
 
         # generate root
         o = self.cur
@@ -109,7 +172,54 @@ class PyGenVisitor(ObjectVisitor):
 
             g.line()
 
-        return ret
+        return self
+
+    def children(self, obj):
+        "Iterates (child, name) as `ObjectVisitor` visits them."
+
+        if isinstance(obj, (list, tuple)):
+            return ((e, i) for i, e in enumerate(obj))
+        elif isinstance(obj, dict):
+            return ((e, k) for k, e in sorted(obj.items()))
+        elif isinstance(obj, set):
+            # objects in a set are not named.
+            return ((e, None) for e in sorted(obj))
+
+        try:
+            names = getattr(obj, self.field_name)
+        except AttributeError:
+            return iter(())
+
+        return ((getattr(obj, name), name) for name in names)
+
+    def visit_iteratively(self):
+        """ Does same as `ObjectVisitor.visit` without recursion. A graph of
+dependencies can be very deep.
+        """
+
+        # iterators of children of objects in `self.path`
+        stack = [self.children(self.cur)]
+
+        while stack:
+            for child, name in stack[-1]:
+                if child is None or isinstance(child, const_types):
+                    # nothing to generate
+                    continue
+
+                self.__push__(child, name)
+                try:
+                    self.on_visit()
+                except BreakVisiting:
+                    self.on_leave()
+                    self.__pop__()
+                else:
+                    stack.append(self.children(child))
+                    break
+            else:
+                stack.pop()
+                if stack:
+                    self.on_leave()
+                    self.__pop__()
 
 
 class PyGenerator(CodeWriter):
@@ -186,42 +296,21 @@ accuracy.
             else:
                 return "0x%0x" % c
         elif isinstance(c, (binary_type, text_type)):
-            normalized = ""
-            prefix = ""
-            multiline = False
-            # Double and single quote count
-            dquote = 0
-            squote = 0
-            for ch in c:
-                code = ch if isinstance(ch, int) else ord(ch)
-
-                if code > 0xFFFF: # 4-byte unicode
-                    prefix = "u"
-                    normalized += "\\U%08x" % code
-                elif code > 0xFF: # 2-byte unicode
-                    prefix = "u"
-                    normalized += "\\u%04x" % code
-                elif code > 127: # non-ASCII code
-                    normalized += "\\x%02x" % code
-                elif code == 92: # \
-                    normalized += "\\\\"
-                else:
-                    if code == 34: # "
-                        dquote += 1
-                    elif code == 38: # '
-                        squote += 1
-                    elif code == 0x0A or code == 0x0D:
-                        multiline = True
-                    normalized += chr(code)
-
-            if dquote > squote:
-                escaped = normalized.replace("'", "\\'")
-                quotes = "'''" if multiline else "'"
-                return prefix + quotes + escaped + quotes
+            if isinstance(c, binary_type):
+                # a byte per character
+                c = c.decode("latin-1")
+                prefix = ""
             else:
-                escaped = normalized.replace('"', '\\"')
-                quotes = '"""' if multiline else '"'
-                return prefix + quotes + escaped + quotes
+                prefix = "u" if re_const_wide.search(c) else ""
+
+            # The literal is always single-line because `CodeWriter.write`
+            # indents each line of a multi-line string.
+            normalized = re_const_special.sub(_escape_const_char, c)
+
+            if c.count('"') > c.count("'"):
+                return prefix + "'" + normalized.replace("'", "\\'") + "'"
+            else:
+                return prefix + '"' + normalized.replace('"', '\\"') + '"'
         else:
             return repr(c)
 
@@ -325,7 +414,12 @@ accuracy.
         self.write("]")
 
     def pprint(self, val):
-        if isinstance(val, list):
+        # Constants are most frequent.
+        if isinstance(val, const_types):
+            self.write(self.gen_const(val))
+        elif val is None:
+            self.write("None")
+        elif isinstance(val, list):
             if type(val) is not list:
                 self.write(type(val).__name__ + "(")
             if not val:
@@ -389,10 +483,6 @@ accuracy.
             self.pop_indent()
             self.line()
             self.write(")")
-        elif isinstance(val, const_types):
-            self.write(self.gen_const(val))
-        elif val is None:
-            self.write("None")
         else:
             o2n = self.id2name
             val_id = id(val)
@@ -411,8 +501,40 @@ def pythonize(root, path):
     :path: of target file
     """
 
-    res = PyGenVisitor(root).visit().gen.w
+    # Code is written to the file during generation. The file is replaced
+    # atomically after successful generation.
+    tmp_path = "%s.%d.tmp" % (path, getpid())
+
+    with open(tmp_path, "wb") as _file:
+        backend = UTF8Writer(_file)
+        try:
+            PyGenVisitor(root, backend = backend).visit()
+            backend.flush()
+        except:
+            _file.close()
+            remove(tmp_path)
+            raise
+
+    replace(tmp_path, path)
+
+
+class UTF8Writer(object):
+    """ A `CodeWriter` backend encoding code to UTF-8 and writing it to a
+binary file by big portions.
+    """
+
+    def __init__(self, _file, portion = 1 << 12):
+        self.file = _file
+        self.portion = portion
+        self.strings = []
+
+    def write(self, string):
+        strings = self.strings
+        strings.append(string)
+        if len(strings) >= self.portion:
+            self.flush()
 
-    with open(path, "wb") as _file:
-        _file.write(res.getvalue().encode("utf-8"))
+    def flush(self):
+        self.file.write(u"".join(self.strings).encode("utf-8"))
+        del self.strings[:]
 
@@ -2,11 +2,20 @@ __all__ = [
     "pypath"
   , "iter_submodules"
   , "pythonpath"
+  , "lazy_exports"
+  , "load_exports"
 ]
 
 from contextlib import (
     contextmanager
 )
+from importlib import (
+    import_module
+)
+from re import (
+    compile,
+    MULTILINE
+)
 from os.path import (
     isdir,
     isfile,
@@ -24,8 +33,9 @@ from os import (
 )
 
 
-def iter_submodules():
-    cur_dir = dirname(caller_file_name())
+def iter_submodules(cur_dir = None):
+    if cur_dir is None:
+        cur_dir = dirname(caller_file_name())
 
     for item in listdir(cur_dir):
         if item[-3:] == ".py":
@@ -104,3 +114,162 @@ def pythonpath(dirname):
         sys.path.insert(0, dirname)
         yield
         sys.path.remove(dirname)
+
+
+re_all = compile(r"^__all__\s*=\s*\[([^\]]*)\]", MULTILINE)
+re_all_name = compile(r"""["']([^"']+)["']""")
+re_comment = compile(r"#[^\n]*")
+re_star_import = compile(r"^from\s+\.(\w+)\s+import\s+\*", MULTILINE)
+
+
+def static_exports(path):
+    """ Returns names a module (or a package) exports by `import *` without
+importing it. Only `__all__` lists of string literals and `import *` from
+own submodules are supported. Else, returns `None`.
+
+:param path: of module file or package directory
+    """
+
+    if isdir(path):
+        pkg_dir = path
+        path = join(path, "__init__.py")
+    else:
+        pkg_dir = None
+
+    with open(path, "r") as f:
+        code = f.read()
+
+    m = re_all.search(code)
+    if m is not None:
+        return re_all_name.findall(re_comment.sub("", m.group(1)))
+
+    if pkg_dir is None:
+        return None
+
+    stars = re_star_import.findall(code)
+    if not stars:
+        return None
+
+    names = []
+    for mod in stars:
+        mod_path = join(pkg_dir, mod)
+        if not isdir(mod_path):
+            mod_path += ".py"
+        mod_names = static_exports(mod_path)
+        if mod_names is None:
+            return None
+        names.extend(mod_names)
+    return names
+
+
+def _export_all(namespace, module):
+    "Does `from module import *` into `namespace`."
+
+    try:
+        names = module.__all__
+    except AttributeError:
+        names = list(n for n in vars(module) if n[0] != "_")
+
+    for name in names:
+        namespace[name] = getattr(module, name)
+
+
+@contextmanager
+def _no_context():
+    yield
+
+
+def lazy_exports(namespace, context = _no_context):
+    """ Exports names of all submodules of a package like
+`from .submodule import *` for each of them. But a submodule is only
+imported on first access to a name it exports (see PEP 562). Use it in
+package `__init__`:
+
+lazy_exports(globals())
+
+Names are found by `static_exports`. Before Python 3.7, all submodules are
+imported at once.
+
+:param namespace: of package `__init__` (`globals()`)
+:param context: returns a context manager to be entered during a submodule
+    import
+    """
+
+    package = namespace["__name__"]
+    pkg_dir = dirname(abspath(namespace["__file__"]))
+
+    def import_submodule(mod):
+        with context():
+            return import_module("." + mod, package)
+
+    if sys.version_info < (3, 7):
+        for mod in iter_submodules(pkg_dir):
+            _export_all(namespace, import_submodule(mod))
+        return
+
+    submodules = list(iter_submodules(pkg_dir))
+    # name -> submodule
+    exports = {}
+    # submodules those exports are unknown until import
+    unknown = []
+
+    for mod in submodules:
+        mod_path = join(pkg_dir, mod)
+        if not isdir(mod_path):
+            mod_path += ".py"
+
+        names = static_exports(mod_path)
+        if names is None:
+            unknown.append(mod)
+        else:
+            for name in names:
+                # last one wins like during consequent `import *`
+                exports[name] = mod
+
+    all_names = sorted(exports)
+
+    # Import of a submodule sets same named attribute of the package. So, a
+    # name exported by same named submodule is resolved right now.
+    for name, mod in list(exports.items()):
+        if name == mod:
+            namespace[name] = getattr(import_submodule(mod), name)
+            del exports[name]
+
+    def __getattr__(name):
+        if name[:2] == "__":
+            raise AttributeError(name)
+
+        try:
+            mod = exports[name]
+        except KeyError:
+            if name in submodules:
+                return import_submodule(name)
+            while unknown:
+                _export_all(namespace, import_submodule(unknown.pop()))
+            try:
+                return namespace[name]
+            except KeyError:
+                raise AttributeError("module '%s' has no attribute '%s'" % (
+                    package, name
+                ))
+
+        value = getattr(import_submodule(mod), name)
+        namespace[name] = value
+        return value
+
+    def __dir__():
+        return sorted(set(namespace) | set(exports))
+
+    namespace["__getattr__"] = __getattr__
+    namespace["__dir__"] = __dir__
+    namespace["__all__"] = all_names
+
+
+def load_exports(module):
+    """ Resolves all names exported lazily by the package (see
+`lazy_exports`). Returns its namespace (`__dict__`).
+    """
+
+    for name in getattr(module, "__all__", []):
+        getattr(module, name)
+    return vars(module)
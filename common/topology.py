@@ -1,6 +1,7 @@
 __all__ = [
     "GraphIsNotAcyclic"
   , "sort_topologically"
+  , "iter_sccs"
   , "flatten"
 ]
 
@@ -65,3 +66,61 @@ either return an empty iterable or do not implement `__dfs_children__` at all.
     for node in roots:
         for n in dfs(node, visiting, visited):
             yield n
+
+
+def iter_sccs(nodes, successors):
+    """ Yields strongly connected components (lists of nodes) of a directed
+graph. A component is yielded after all components reachable from it. I.e.,
+the order is topological for the reversed graph.
+
+:param nodes: iterable of (hashable) nodes to start search from
+:param successors: function returning an iterable of successors of a node
+
+It's iterative Tarjan's algorithm. So, deep graphs are supported.
+    """
+
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+
+    for root in nodes:
+        if root in index:
+            continue
+
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        # DFS path: (node, its successors iterator)
+        path = [(root, iter(successors(root)))]
+
+        while path:
+            node, succ_iter = path[-1]
+
+            for succ in succ_iter:
+                if succ not in index:
+                    index[succ] = lowlink[succ] = len(index)
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    path.append((succ, iter(successors(succ))))
+                    break
+                elif succ in on_stack:
+                    if index[succ] < lowlink[node]:
+                        lowlink[node] = index[succ]
+            else:
+                path.pop()
+
+                if path:
+                    parent = path[-1][0]
+                    if lowlink[node] < lowlink[parent]:
+                        lowlink[parent] = lowlink[node]
+
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        n = stack.pop()
+                        on_stack.remove(n)
+                        component.append(n)
+                        if n is node:
+                            break
+                    yield component
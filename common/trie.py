@@ -1,6 +1,7 @@
 __all__ = [
     "trie_add"
   , "trie_find"
+  , "trie_prefixes"
 ]
 
 # Helpers to build trie of `dict`s
@@ -107,3 +108,40 @@ def trie_find(trie, path):
         )
 
     raise KeyError("No path %s" % str(path))
+
+
+def trie_prefixes(trie, path):
+    """ Looks up values those paths are prefixes of given `path` (including
+the `path` itself).
+
+    :trie: is a starting node
+    :path: is a list (or any indexable & slicable) of hashables of same type
+        as paths were added
+    :returns: generator of tuples (value, rest of `path`), shortest prefix
+        first
+    """
+
+    i = 0
+    while True:
+        if None in trie:
+            yield trie[None], path[i:]
+
+        if i == len(path):
+            return
+
+        p = path[i]
+        if p not in trie:
+            return
+        i += 1
+
+        v = trie[p]
+
+        if isinstance(v, dict):
+            trie = v
+            continue
+
+        value, rest = v
+
+        if path[i:i + len(rest)] == rest:
+            yield value, path[i + len(rest):]
+        return
@@ -0,0 +1,387 @@
+__all__ = [
+    "UnixDaemon"
+  , "daemon_request"
+  , "daemon_socket_path"
+]
+
+from array import (
+    array
+)
+from errno import (
+    ECONNREFUSED,
+    EINTR,
+    ENOENT
+)
+from json import (
+    dumps,
+    loads
+)
+from os import (
+    _exit,
+    chdir,
+    chmod,
+    close,
+    dup2,
+    environ,
+    fdopen,
+    fork,
+    getcwd,
+    lstat,
+    pipe,
+    remove,
+    umask
+)
+from os.path import (
+    exists,
+    join
+)
+from select import (
+    select
+)
+from signal import (
+    SIGCHLD,
+    SIG_DFL,
+    SIG_IGN,
+    signal
+)
+from struct import (
+    Struct
+)
+from tempfile import (
+    gettempdir
+)
+from traceback import (
+    print_exc
+)
+from .co_dispatcher import (
+    CoDispatcher
+)
+import socket
+import sys
+
+try:
+    from os import (
+        getuid
+    )
+except ImportError: # Windows
+    getuid = None
+
+
+# Requests are served by a child process forked from the daemon. Standard
+# streams of the client are passed to it (SCM_RIGHTS). So, only the request
+# and the exit code are sent over the socket.
+#
+# request: length ('!I'), UTF-8 JSON [cwd, argv, environ] + 3 file
+#     descriptors
+# response: status ('!B', `HANDLED` or `REFUSED`), exit code ('!i')
+#
+# The daemon refuses a request if the environment of the client differs in
+# variables those affect the daemon's state (see `UnixDaemon.environ_key`).
+# Then, the client should handle the request itself.
+
+length_fmt = Struct("!I")
+response_fmt = Struct("!Bi")
+# struct ucred of SO_PEERCRED (Linux)
+ucred_fmt = Struct("3i")
+
+HANDLED = 0
+REFUSED = 1
+
+STD_FDS = (0, 1, 2)
+
+# sendmsg/recvmsg appeared in Py3.3
+UNIX_DAEMON_SUPPORTED = (
+    hasattr(socket, "AF_UNIX") and hasattr(socket.socket, "sendmsg")
+)
+
+
+def daemon_socket_path(name):
+    "Default path of socket of the daemon with `name`."
+    env = "QDT_%s_SOCKET" % name.upper().replace("-", "_")
+    try:
+        return environ[env]
+    except KeyError:
+        pass
+    user = "" if getuid is None else ("-%d" % getuid())
+    return join(gettempdir(), "qdt-%s%s.sock" % (name, user))
+
+
+def _recv_exactly(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError()
+        data += chunk
+    return data
+
+
+def daemon_request(path, argv):
+    """ Asks a daemon at socket `path` to handle `argv` in current working
+directory with standard streams of the current process.
+
+:returns: exit code or `None` if there is no daemon
+    """
+    if not UNIX_DAEMON_SUPPORTED or not exists(path):
+        return None
+
+    if lstat(path).st_uid != getuid():
+        # Streams and environment must not be passed to another user.
+        print("Socket %s is owned by another user, ignoring it" % path)
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(path)
+        except socket.error as e:
+            if e.errno in (ECONNREFUSED, ENOENT):
+                # stale socket
+                return None
+            raise
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        data = dumps([getcwd(), list(argv), dict(environ)]).encode("utf-8")
+        sock.sendmsg([length_fmt.pack(len(data)) + data], [
+            (socket.SOL_SOCKET, socket.SCM_RIGHTS, array("i", STD_FDS))
+        ])
+
+        try:
+            status, code = response_fmt.unpack(
+                _recv_exactly(sock, response_fmt.size)
+            )
+        except EOFError:
+            print("Daemon has closed connection without exit code")
+            return -1
+
+        if status == REFUSED:
+            return None
+        return code
+    finally:
+        sock.close()
+
+
+class UnixDaemon(object):
+    """ Serves requests sent by `daemon_request` over Unix socket. A request
+is handled by a forked process. So, state of the daemon is not affected by
+requests but is inherited by them.
+
+Subclasses implement `handle`. A handler can `report` data to the daemon
+which receives it by `on_report` (in the daemon process). Long work of the
+daemon should be done by coroutines given to `dispatcher`. They are
+iterated between requests.
+
+The handler gets environment of the client. But values those were read
+during imports are inherited from the daemon. So, a request is refused if
+`environ_key` of the client differs from the daemon's one.
+    """
+
+    # Prefix of names of environment variables those must be same in the
+    # daemon and a client.
+    environ_prefix = "QDT_"
+    # Names of variables those can differ.
+    environ_ignored = ()
+
+    def __init__(self, path):
+        if not UNIX_DAEMON_SUPPORTED:
+            raise RuntimeError("Unix daemon is not supported by this Python")
+        self.path = path
+        # pipe read end -> buffer
+        self.reports = {}
+        self.environ = self.environ_key(environ)
+        self.dispatcher = CoDispatcher()
+
+    def environ_key(self, env):
+        prefix, ignored = self.environ_prefix, self.environ_ignored
+        return dict(
+            (name, value) for name, value in env.items()
+            if name.startswith(prefix) and name not in ignored
+        )
+
+    def handle(self, argv, report):
+        "Runs in forked process with streams of the client. Returns code."
+        raise NotImplementedError()
+
+    def on_report(self, data):
+        "Called in the daemon process with data `report`ed by a handler."
+        pass
+
+    def on_fork(self):
+        "Called in forked process before `handle`."
+        pass
+
+    def on_listening(self):
+        "Called when the daemon starts accepting requests."
+        print("Listening at " + self.path)
+
+    def serve_forever(self):
+        if exists(self.path):
+            # The socket is either stale or used by a running daemon.
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except socket.error:
+                remove(self.path)
+            else:
+                raise RuntimeError("Daemon is already running at "
+                    + self.path
+                )
+            finally:
+                probe.close()
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Requests run arbitrary scripts. Only the owner can connect.
+        prev_umask = umask(0o177)
+        try:
+            listener.bind(self.path)
+        finally:
+            umask(prev_umask)
+        chmod(self.path, 0o600)
+        listener.listen(16)
+
+        # children are not waited for
+        signal(SIGCHLD, SIG_IGN)
+
+        self.on_listening()
+
+        disp = self.dispatcher
+        # a coroutine has work right now
+        busy = False
+
+        try:
+            while True:
+                if busy:
+                    timeout = 0
+                elif disp.has_work():
+                    # coroutines wait for something
+                    timeout = 0.01
+                else:
+                    timeout = None
+
+                try:
+                    ready = select([listener] + list(self.reports), [], [],
+                        timeout
+                    )[0]
+                except (OSError, IOError) as e:
+                    if e.errno == EINTR:
+                        continue
+                    raise
+
+                for r in ready:
+                    if r is listener:
+                        self._accept(listener)
+                    else:
+                        self._read_report(r)
+
+                busy = bool(disp.has_work() and disp.iteration())
+        finally:
+            listener.close()
+            remove(self.path)
+
+    def _read_report(self, r):
+        chunk = r.read(4096)
+        if chunk:
+            self.reports[r] += chunk
+            return
+
+        data = self.reports.pop(r)
+        r.close()
+
+        for line in data.split(b"\n"):
+            if line:
+                try:
+                    self.on_report(loads(line.decode("utf-8")))
+                except Exception as e:
+                    print("Report handling failed: %s" % e)
+
+    def _accept(self, listener):
+        conn, _ = listener.accept()
+        fds = []
+        try:
+            try:
+                peercred = socket.SO_PEERCRED
+            except AttributeError:
+                pass # the socket file mode is only protection
+            else:
+                uid = ucred_fmt.unpack(conn.getsockopt(socket.SOL_SOCKET,
+                    peercred, ucred_fmt.size
+                ))[1]
+                if uid != getuid():
+                    raise ValueError("Peer user %d is not allowed" % uid)
+
+            header, ancdata, _, _ = conn.recvmsg(length_fmt.size,
+                socket.CMSG_LEN(len(STD_FDS) * array("i").itemsize)
+            )
+            for level, kind, data in ancdata:
+                if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                    a = array("i")
+                    a.frombytes(data[:len(data) - len(data) % a.itemsize])
+                    fds.extend(a)
+
+            if len(header) < length_fmt.size:
+                header += _recv_exactly(conn, length_fmt.size - len(header))
+            length = length_fmt.unpack(header)[0]
+            cwd, argv, env = loads(
+                _recv_exactly(conn, length).decode("utf-8")
+            )
+
+            if len(fds) != len(STD_FDS):
+                raise ValueError("Standard streams are not passed")
+
+            if self.environ_key(env) != self.environ:
+                conn.sendall(response_fmt.pack(REFUSED, 0))
+                return
+
+            report_r, report_w = pipe()
+
+            pid = fork()
+            if pid == 0:
+                # the child never returns
+                close(report_r)
+                listener.close()
+                self._serve(conn, fds, cwd, argv, env, report_w)
+
+            close(report_w)
+            r = fdopen(report_r, "rb", 0)
+            self.reports[r] = b""
+        except Exception as e:
+            print("Bad request: %s" % e)
+        finally:
+            for fd in fds:
+                close(fd)
+            conn.close()
+
+    def _serve(self, conn, fds, cwd, argv, env, report_w):
+        code = -1
+        try:
+            # Subprocesses of the handler must be waitable.
+            signal(SIGCHLD, SIG_DFL)
+            sys.stdout.flush()
+            sys.stderr.flush()
+            for std, fd in zip(STD_FDS, fds):
+                dup2(fd, std)
+                close(fd)
+
+            report = fdopen(report_w, "wb", 0)
+
+            def report_data(data):
+                report.write(dumps(data).encode("utf-8") + b"\n")
+
+            chdir(cwd)
+            environ.clear()
+            environ.update(env)
+            self.on_fork()
+            code = self.handle(argv, report_data)
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else 1
+        except BaseException:
+            print_exc()
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                conn.sendall(response_fmt.pack(HANDLED, code or 0))
+            finally:
+                _exit(0)
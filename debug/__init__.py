@@ -1,9 +1,14 @@
 from common import (
-    iter_submodules,
-    pypath
+    lazy_exports,
+    pythonpath
+)
+from os.path import (
+    abspath,
+    dirname,
+    join
 )
 
 # this module uses custom pyelftools
-with pypath("pyelftools"):
-    for mod in iter_submodules():
-        exec("from ." + mod + " import *")
+_pyelftools = join(dirname(abspath(__file__)), "pyelftools")
+
+lazy_exports(globals(), context = lambda : pythonpath(_pyelftools))
@@ -38,6 +38,7 @@ from common import (
     execfile,
     lazy,
     Persistent,
+    load_exports,
     Extensible
 )
 from argparse import (
@@ -336,7 +337,7 @@ class QDTMeasurer(Measurer):
         self.diffs = diffs
 
         self.qvc_pattern = (
-            "qvc*_%s.py" % qemugit.commit(project.target_version).hexsha
+            "qvc*_%s.qvc" % qemugit.commit(project.target_version).hexsha
         )
 
     def __enter__(self):
@@ -662,7 +663,7 @@ def main():
 
     loaded = {}
     try:
-        execfile(script, dict(qdt.__dict__), loaded)
+        execfile(script, dict(load_exports(qdt)), loaded)
     except:
         print("Cannot load configuration from '%s'" % script)
         print_exc()
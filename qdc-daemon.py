@@ -0,0 +1,130 @@
+#!/usr/bin/python
+
+# Keeps QEMU version descriptions loaded and serves qemu_device_creator.py
+# requests over Unix socket.
+from argparse import (
+    ArgumentParser
+)
+from os.path import (
+    abspath
+)
+from traceback import (
+    print_exc
+)
+from common import (
+    UnixDaemon,
+    daemon_socket_path
+)
+from qemu import (
+    qvd_get
+)
+from qemu_device_creator import (
+    QDC_DAEMON_NAME,
+    run
+)
+import qemu.version_description as qvd_module
+
+
+def warm_up(build_path, version):
+    qvd = qvd_get(build_path, version = version)
+    if not qvd.qvc_is_ready:
+        print("Loading QVD %s of %s" % (qvd.commit_sha, build_path))
+        qvd.init_cache()
+    return qvd
+
+
+def co_warm_up(build_path, version):
+    qvd = qvd_get(build_path, version = version)
+    if not qvd.qvc_is_ready:
+        print("Loading QVD %s of %s" % (qvd.commit_sha, build_path))
+        yield qvd.co_init_cache()
+
+
+class QDCDaemon(UnixDaemon):
+
+    # Those variables only select the daemon.
+    environ_ignored = (
+        "QDT_QDC_DAEMON",
+        "QDT_QDC_DAEMON_SOCKET",
+    )
+
+    def __init__(self, *a, **kw):
+        super(QDCDaemon, self).__init__(*a, **kw)
+        # (build path, SHA1) of QVDs being loaded
+        self.warming = set()
+
+    def handle(self, argv, report):
+        return run(argv, on_qvd = lambda *args: report(args))
+
+    def on_report(self, data):
+        key = build_path, sha = tuple(data)
+        if key in self.warming:
+            return
+        # The QVD is loaded by the request process. Now load it in the daemon
+        # for next requests. Requests are served meanwhile.
+        self.warming.add(key)
+        self.dispatcher.enqueue(self.co_warm_up(key))
+
+    def co_warm_up(self, key):
+        try:
+            yield co_warm_up(*key)
+        except Exception:
+            print("QVD loading failed")
+            print_exc()
+        finally:
+            self.warming.discard(key)
+
+    def on_fork(self):
+        # GitPython keeps `git cat-file` processes. They must not be shared
+        # with the daemon. Note that `Git.clear_cache` kills them. So,
+        # references are just moved away. The process ends by `os._exit`,
+        # i.e. without finalization.
+        self.inherited = inherited = []
+        for qvds in (qvd_module.qvd_reg or {}).values():
+            for qvd in qvds.values():
+                git = qvd.repo.git
+                for attr in ("cat_file_all", "cat_file_header"):
+                    inherited.append(getattr(git, attr, None))
+                    setattr(git, attr, None)
+
+
+def main():
+    parser = ArgumentParser(
+        description = "QEMU Device Creator daemon. It keeps QEMU version"
+        " descriptions in memory and serves qemu_device_creator.py requests."
+        " A request is handled by a forked process."
+    )
+
+    parser.add_argument("--socket", "-s",
+        default = daemon_socket_path(QDC_DAEMON_NAME),
+        metavar = "/path/to/socket",
+        help = "Unix socket path (QDT_QDC_DAEMON_SOCKET by default)."
+    )
+
+    parser.add_argument("--qemu-build", "-b",
+        action = "append",
+        default = [],
+        metavar = "/path/to/qemu/build/directory[@<tree-ish>]",
+        help = "Load QVD before serving. Can be given several times."
+    )
+
+    arguments = parser.parse_args()
+
+    for build in arguments.qemu_build:
+        build_path, _, version = build.partition("@")
+        try:
+            warm_up(abspath(build_path), version or None)
+        except:
+            print("QVD loading failed")
+            print_exc()
+            return -1
+
+    try:
+        QDCDaemon(arguments.socket).serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -61,6 +61,7 @@ from common import (
     CoSignal,
     CoTask,
     pythonize,
+    load_exports,
     mlget as _
 )
 from six.moves.tkinter import (
@@ -794,7 +795,7 @@ later.").get()
         self.task_manager.enqueue(self._project_generation_task)
 
     def load_project_from_file(self, file_name):
-        loaded_variables = dict(qdt.__dict__)
+        loaded_variables = dict(load_exports(qdt))
 
         try:
             execfile(file_name, loaded_variables)
@@ -996,7 +997,7 @@ def main():
 
         try:
             variables = {}
-            execfile("serialize-test.py", qdt.__dict__, variables)
+            execfile("serialize-test.py", load_exports(qdt), variables)
     
             for v in variables.values():
                 if isinstance(v, MachineNode):
@@ -57,10 +57,32 @@ from qemu import (
           , MemoryRAMNode
           , MemoryROMNode
 )
+from sys import (
+    version_info as _version_info
+)
 
-# Required to load scripts generated by the GUI
-from widgets import (
-    GUIProject
-  , GUILayout
-  , MachineWidgetLayout
+# Required to load scripts generated by the GUI. `widgets` (and Tkinter) is
+# only imported on first access to one of them (see PEP 562).
+_gui_names = (
+    "GUIProject",
+    "GUILayout",
+    "MachineWidgetLayout",
 )
+
+if _version_info < (3, 7):
+    from widgets import (
+        GUIProject
+      , GUILayout
+      , MachineWidgetLayout
+    )
+else:
+    def __getattr__(name):
+        if name not in _gui_names:
+            raise AttributeError("module 'qdt' has no attribute '%s'" % name)
+
+        import widgets
+        value = getattr(widgets, name)
+        globals()[name] = value
+        return value
+
+__all__ = list(n for n in globals() if n[0] != "_") + list(_gui_names)
@@ -1,6 +1,4 @@
 from common import (
-    iter_submodules
+    lazy_exports
 )
-
-for mod in iter_submodules():
-    exec("from ." + mod + " import *")
+lazy_exports(globals())
@@ -0,0 +1,180 @@
+__all__ = [
+    "GenManifest"
+  , "generator_hash"
+  , "packages_hash"
+]
+
+from common import (
+    PyGenVisitor
+)
+from hashlib import (
+    md5
+)
+from json import (
+    dump,
+    load
+)
+from os import (
+    getpid,
+    remove,
+    walk
+)
+from os.path import (
+    dirname,
+    isfile,
+    join,
+    relpath
+)
+
+try:
+    from os import (
+        replace
+    )
+except ImportError: # Py2
+    from os import (
+        rename
+    )
+
+    def replace(src, dst):
+        if isfile(dst):
+            remove(dst)
+        rename(src, dst)
+
+
+GEN_MANIFEST_VERSION = 2
+
+# Code of those packages affects generated code.
+generator_packages = ("common", "qemu", "source")
+
+_generator_hash = None
+
+
+def packages_hash(root, packages):
+    "MD5 of code of `packages` in `root` including subpackages."
+
+    h = md5()
+    for package in packages:
+        for cur_dir, dirs, files in walk(join(root, package)):
+            # order of visiting
+            dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+
+            for name in sorted(files):
+                if not name.endswith(".py"):
+                    continue
+                path = join(cur_dir, name)
+                rel_path = relpath(path, root).replace("\\", "/")
+                h.update(rel_path.encode("utf-8"))
+                with open(path, "rb") as f:
+                    h.update(f.read())
+    return h.hexdigest()
+
+
+def generator_hash():
+    "MD5 of generator's code."
+
+    global _generator_hash
+
+    if _generator_hash is None:
+        root = dirname(dirname(__file__))
+        _generator_hash = packages_hash(root, generator_packages)
+
+    return _generator_hash
+
+
+def file_hash(path):
+    try:
+        with open(path, "rb") as f:
+            return md5(f.read()).hexdigest()
+    except (IOError, OSError):
+        return None
+
+
+class GenManifest(object):
+    """ Fingerprints of descriptions generated last time and hashes of their
+files. A description whose fingerprint is not changed and whose files are
+not modified since then need not be generated again.
+
+:salt: identifies everything (except the description) the generation depends
+    on: generator code, QVC, destination.
+    """
+
+    def __init__(self, path, salt):
+        self.path = path
+        self.salt = salt
+        # name -> dict(fingerprint, files, headers)
+        self.entries = {}
+
+    @classmethod
+    def load(klass, path, salt):
+        "Loads manifest from file if possible. Else, returns an empty one."
+
+        self = klass(path, salt)
+
+        if isfile(path):
+            try:
+                with open(path, "r") as f:
+                    data = load(f)
+            except (IOError, OSError, ValueError) as e:
+                print("Bad generation manifest %s: %s" % (path, e))
+            else:
+                if data.get("version") == GEN_MANIFEST_VERSION:
+                    self.entries = data["descriptions"]
+
+        return self
+
+    def save(self):
+        tmp_path = "%s.%d.tmp" % (self.path, getpid())
+        with open(tmp_path, "w") as f:
+            dump(dict(
+                version = GEN_MANIFEST_VERSION,
+                descriptions = self.entries
+            ), f, indent = 1, sort_keys = True)
+        replace(tmp_path, self.path)
+
+    def fingerprint(self, desc, *extra):
+        "`extra` strings are accounted too."
+
+        h = md5(self.salt.encode("utf-8"))
+        code = PyGenVisitor(desc).visit().gen.w.getvalue()
+        h.update(code.encode("utf-8"))
+        for e in extra:
+            h.update(e.encode("utf-8"))
+        return h.hexdigest()
+
+    def lookup(self, name, fingerprint, src):
+        """ Returns the entry of description if it's up to date: fingerprint
+matches and files in `src` directory are same.
+        """
+
+        entry = self.entries.get(name)
+        if entry is None or entry["fingerprint"] != fingerprint:
+            return None
+
+        for path, _, digest in entry["files"]:
+            if file_hash(join(src, path)) != digest:
+                return None
+
+        return entry
+
+    def account(self, name, fingerprint, files, headers):
+        """ Remembers generated description.
+
+:param files: see `QProject.co_gen_files`
+:param headers: see `header_models`
+        """
+
+        self.entries[name] = dict(
+            fingerprint = fingerprint,
+            files = list(
+                (path, is_module, md5(content.encode("utf-8")).hexdigest())
+                for path, is_module, content, _ in files
+            ),
+            headers = headers
+        )
+
+    def forget_others(self, names):
+        "Removes entries of descriptions not in `names`."
+
+        for name in list(self.entries):
+            if name not in names:
+                del self.entries[name]
@@ -0,0 +1,281 @@
+__all__ = [
+    "HeuristicCache"
+]
+
+from array import (
+    array
+)
+from struct import (
+    Struct
+)
+from os import (
+    getpid,
+    remove
+)
+from os.path import (
+    isfile
+)
+
+try:
+    from os import (
+        replace
+    )
+except ImportError: # Py2
+    from os import (
+        rename
+    )
+
+    def replace(src, dst):
+        if isfile(dst):
+            remove(dst)
+        rename(src, dst)
+
+from .heuristic_propagation import (
+    HP_IBY,
+    heuristic_values
+)
+
+
+# File layout (native byte order, the file is a local cache):
+#
+#     header: magic, version, number of commits, SHA1 of last commit,
+#         number of columns, number of rows
+#     columns: name length, UTF-8 name, key (hex MD5)
+#     rows: value codes ('H' array, 2 * columns per row)
+#     row index: row of each commit ('I' array)
+
+HEURISTIC_CACHE_MAGIC = b"QHC\x00"
+HEURISTIC_CACHE_VERSION = 2
+
+cache_header = Struct("=4sII40sII")
+column_header = Struct("=I")
+
+
+class HeuristicCache(object):
+    """ Values of heuristic parameters of all commits of a `CommitGraph` in
+the form computed by `HeuristicPropagation`.
+
+:columns: list of (name, key), see `heuristic_key`. Value codes are only
+    valid for same definitions of the parameter.
+    """
+
+    def __init__(self, graph):
+        self.count = len(graph)
+        self.last = graph.shas[-1] if graph.shas else "0" * 40
+        self.columns = []
+        self.rows = [()]
+        self.row_index = array("I", [0]) * self.count
+
+    def matches(self, graph):
+        if self.count != len(graph):
+            return False
+        return self.last == (graph.shas[-1] if graph.shas else "0" * 40)
+
+    def co_extend(self, graph, groups, names):
+        """ Computes rows of commits added to `graph` after the cache was
+built. Values of other commits are not changed. Raises `ValueError` if the
+values of other commits may change (full propagation is required then).
+
+:param groups: see `group_heuristics`
+:param names: columns to compute, values of other columns of new commits
+    are meaningless
+        """
+
+        count = self.count
+        if len(graph) < count or (count and graph.shas[count - 1] != self.last):
+            raise ValueError("Graph is not an extension of the cached one")
+
+        if len(graph) == count:
+            return
+
+        index = graph.index
+        for name in names:
+            for sha, _ in groups[name]:
+                if index.get(sha, -1) >= count:
+                    # It changes old values of ancestors.
+                    raise ValueError("Definition of '%s' is in new commit %s"
+                        % (name, sha)
+                    )
+
+        m = len(self.columns)
+        checked = list(col for col, (name, _) in enumerate(self.columns)
+            if name in names
+        )
+
+        rows = self.rows
+        row_index = self.row_index
+        row_idx = dict((row, idx) for idx, row in enumerate(rows))
+
+        parent_offsets = graph.parent_offsets
+        parents = graph.parents
+
+        i2y = HP_IBY
+
+        for i in range(count, len(graph)):
+            start, end = parent_offsets[i], parent_offsets[i + 1]
+            if start == end:
+                # Old values of definitions with unknown SHA1 are assigned
+                # to all commits.
+                raise ValueError("New root commit %s" % graph.shas[i])
+
+            idx = row_index[parents[start]]
+            p_idxs = set(row_index[p] for p in parents[start + 1:end])
+            p_idxs.discard(idx)
+
+            if p_idxs:
+                row = list(rows[idx])
+                p_rows = list(rows[p_idx] for p_idx in p_idxs)
+                for col in checked:
+                    for p_row in p_rows:
+                        if p_row[col] != row[col]:
+                            # Values of one of parents could be old.
+                            raise ValueError("Parameter '%s' differs in "
+                                "parents of %s" % (self.columns[col][0],
+                                    graph.shas[i]
+                                )
+                            )
+                        if p_row[m + col] != row[m + col]:
+                            # Old values of parents would be same.
+                            raise ValueError("Old value of '%s' differs in "
+                                "parents of %s" % (self.columns[col][0],
+                                    graph.shas[i]
+                                )
+                            )
+                row = tuple(row)
+                try:
+                    idx = row_idx[row]
+                except KeyError:
+                    idx = row_idx[row] = len(rows)
+                    rows.append(row)
+
+            row_index.append(idx)
+
+            i2y -= 1
+            if not i2y:
+                yield True
+                i2y = HP_IBY
+
+        self.count = len(graph)
+        self.last = graph.shas[-1]
+
+    def update(self, keep, columns, propagation):
+        """ Replaces columns with `keep` columns and columns computed by
+`propagation`.
+
+:param keep: names of columns to keep
+:param columns: list of (name, key) of `propagation`
+        """
+        old_m = len(self.columns)
+        keep_cols = list(col for col, (name, _) in enumerate(self.columns)
+            if name in keep
+        )
+        new_m = len(columns)
+
+        old_rows = self.rows
+        new_rows = propagation.rows
+        # (old row, new row) -> row
+        row_idx = {}
+        rows = []
+        row_index = array("I")
+
+        for old, new in zip(self.row_index, propagation.row_index):
+            key = (old, new)
+            try:
+                idx = row_idx[key]
+            except KeyError:
+                idx = row_idx[key] = len(rows)
+                old_row = old_rows[old]
+                new_row = new_rows[new]
+                rows.append(
+                    tuple(old_row[col] for col in keep_cols) +
+                    new_row[:new_m] +
+                    tuple(old_row[old_m + col] for col in keep_cols) +
+                    new_row[new_m:]
+                )
+            row_index.append(idx)
+
+        self.columns = list(self.columns[col] for col in keep_cols) + columns
+        self.rows = rows
+        self.row_index = row_index
+
+    def iter_values(self, commit, groups):
+        """ Yields (name, value) of parameters of the commit. An old value
+overrides new one.
+        """
+        row = self.rows[self.row_index[commit]]
+        m = len(self.columns)
+        for col, (name, _) in enumerate(self.columns):
+            code = row[m + col] or row[col]
+            if code:
+                yield name, heuristic_values(groups[name])[code - 1]
+
+    def save(self, path):
+        "Saves the cache to file. The file is replaced atomically."
+
+        tmp_path = "%s.%d.tmp" % (path, getpid())
+        with open(tmp_path, "wb") as f:
+            f.write(cache_header.pack(HEURISTIC_CACHE_MAGIC,
+                HEURISTIC_CACHE_VERSION, self.count,
+                self.last.encode("ascii"), len(self.columns), len(self.rows)
+            ))
+            for name, key in self.columns:
+                raw_name = name.encode("utf-8")
+                f.write(column_header.pack(len(raw_name)))
+                f.write(raw_name)
+                f.write(key.encode("ascii"))
+
+            codes = array("H")
+            for row in self.rows:
+                codes.extend(row)
+            codes.tofile(f)
+            self.row_index.tofile(f)
+
+        replace(tmp_path, path)
+
+    @classmethod
+    def load(klass, path):
+        "Loads cache saved by `save`. Raises `ValueError` on bad file."
+
+        with open(path, "rb") as f:
+            header = f.read(cache_header.size)
+            if len(header) != cache_header.size:
+                raise ValueError("File is too short")
+
+            (magic, version, count, last, ncolumns, nrows
+            ) = cache_header.unpack(header)
+
+            if magic != HEURISTIC_CACHE_MAGIC:
+                raise ValueError("Not a heuristic cache file")
+            if version != HEURISTIC_CACHE_VERSION:
+                raise ValueError("Heuristic cache version %u is not supported"
+                    % version
+                )
+
+            self = klass.__new__(klass)
+            self.count = count
+            self.last = last.decode("ascii")
+            self.columns = columns = []
+
+            try:
+                for _ in range(ncolumns):
+                    raw = f.read(column_header.size)
+                    if len(raw) != column_header.size:
+                        raise EOFError()
+                    name_len = column_header.unpack(raw)[0]
+                    name = f.read(name_len).decode("utf-8")
+                    key = f.read(32).decode("ascii")
+                    columns.append((name, key))
+
+                width = 2 * ncolumns
+                codes = array("H")
+                codes.fromfile(f, nrows * width)
+                self.rows = list(tuple(codes[i:i + width])
+                    for i in range(0, nrows * width, width)
+                )
+
+                self.row_index = array("I")
+                self.row_index.fromfile(f, count)
+            except EOFError:
+                raise ValueError("File is too short")
+
+        return self
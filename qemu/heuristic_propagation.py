@@ -0,0 +1,438 @@
+__all__ = [
+    "HP_IBY"
+  , "HeuristicPropagation"
+  , "group_heuristics"
+  , "heuristic_key"
+  , "heuristic_values"
+]
+
+from array import (
+    array
+)
+from hashlib import (
+    md5
+)
+
+
+# Iterations Between Yields of Heuristic Propagation task
+HP_IBY = 1000
+
+
+def group_heuristics(vd):
+    """ Groups definitions of `qemu_heuristic_db`-like `vd` by parameter name.
+
+:returns: name -> list of (SHA1, `QEMUVersionParameterDescription`) sorted by
+    SHA1
+    """
+    groups = {}
+    for sha in sorted(vd):
+        for vpd in vd[sha]:
+            groups.setdefault(vpd.name, []).append((sha, vpd))
+    return groups
+
+
+def heuristic_key(name, defs):
+    "Modification detection code of definitions of a parameter."
+    h = md5(name.encode("utf-8"))
+    for sha, vpd in defs:
+        h.update((sha + vpd.gen_mdc()).encode("utf-8"))
+    return h.hexdigest()
+
+
+def heuristic_values(defs):
+    """ All values a commit can get for the parameter. A value is referenced
+by code: 0 - no value, `i` - `i - 1`-th value.
+    """
+    values = []
+    for _, vpd in defs:
+        values.append(vpd.new_value)
+        values.append(vpd.old_value)
+    return values
+
+
+def value_code(values, value):
+    "Code of first value equal to given one."
+    for i, v in enumerate(values, 1):
+        if v is value or (type(v) is type(value) and v == value):
+            return i
+    raise ValueError("Unknown value %r" % value)
+
+
+class HeuristicPropagation(object):
+    """ Computes values of heuristic parameters for all commits of a
+`CommitGraph`.
+
+Each parameter is a column and each commit is a row. A row is a tuple of
+new value codes of all columns followed by old value codes (see
+`heuristic_values`). Commits mostly share rows. So, only distinct rows are
+stored and a commit refers its row by index.
+
+New values are computed by a sweep over commits in topological order.
+A commit gets new values of its parents. When values of parents differ, the
+one defined later (according to commit numbers) wins if the other one is an
+old value of a definition preceding it. If neither is old, the definition is
+contradictory.
+
+Old values are assigned to commits without new value. Such commits form
+ancestor closed set. Its parts connected through a merge gets same old value.
+Parts are identified by sets of root commits, see `co_propagate_old`.
+
+:param groups: see `group_heuristics`
+:param names: parameters to propagate, column order
+
+Result is in `rows` and `row_index` (commit -> index in `rows`).
+    """
+
+    def __init__(self, graph, groups, names):
+        self.graph = graph
+        self.names = names = list(names)
+        self.defs = [groups[name] for name in names]
+        self.values = [heuristic_values(defs) for defs in self.defs]
+
+        self.rows = []
+        self.row_index = array("I")
+
+    def co_propagate(self):
+        graph = self.graph
+        index = graph.index
+
+        # commit -> list of (column, new value code, old value code)
+        self.vd_commits = vd_commits = {}
+        # per column list of old value codes of definitions with unknown SHA1
+        self.unknown = unknown = []
+
+        for col, (defs, values) in enumerate(zip(self.defs, self.values)):
+            col_unknown = []
+            unknown.append(col_unknown)
+
+            for sha, vpd in defs:
+                ocode = value_code(values, vpd.old_value)
+                if sha in index:
+                    vd_commits.setdefault(index[sha], []).append((col,
+                        value_code(values, vpd.new_value), ocode
+                    ))
+                else:
+                    print("WARNING: Unknown SHA1 %s in QEMU heuristic "
+                        "database" % sha
+                    )
+                    col_unknown.append(ocode)
+
+        yield self.co_propagate_new()
+        yield self.co_propagate_old()
+
+        # rows of the result
+        rows = self.rows
+        row_index = self.row_index
+        row_idx = {}
+        nrows = self.nrows
+        orows = self.orows
+
+        i2y = HP_IBY
+
+        for i in range(len(graph)):
+            nrow, orow = nrows[i], orows[i]
+            key = (id(nrow), id(orow))
+            try:
+                idx = row_idx[key]
+            except KeyError:
+                idx = row_idx[key] = len(rows)
+                rows.append(nrow + orow)
+            row_index.append(idx)
+
+            i2y -= 1
+            if not i2y:
+                yield True
+                i2y = HP_IBY
+
+        del self.nrows, self.orows, self.vd_commits, self.unknown
+
+    def co_propagate_new(self):
+        graph = self.graph
+        shas = graph.shas
+        parent_offsets = graph.parent_offsets
+        parents = graph.parents
+        vd_commits = self.vd_commits
+
+        m = len(self.names)
+
+        # Rank of a commit with a definition. Commit numbers are topological.
+        rank = {}
+        for r, i in enumerate(sorted(vd_commits)):
+            rank[i] = r
+
+        # Per column: code -> lowest rank of a definition with such old value.
+        # I.e. since which definition the value is old.
+        old_rank = list({} for _ in range(m))
+        for i, col_defs in vd_commits.items():
+            r = rank[i]
+            for col, _, ocode in col_defs:
+                col_old_rank = old_rank[col]
+                if col_old_rank.get(ocode, r) >= r:
+                    col_old_rank[ocode] = r
+
+        empty = (0,) * m, (-1,) * m
+
+        # per commit (new value codes, ranks of definitions of the values)
+        self.states = states = []
+        i2y = HP_IBY
+
+        for i in range(len(shas)):
+            start, end = parent_offsets[i], parent_offsets[i + 1]
+            if start == end:
+                state = empty
+            else:
+                state = states[parents[start]]
+                for p in parents[start + 1:end]:
+                    other = states[p]
+                    if other is not state and other != state:
+                        state = self._merge(i, parents[start:end], old_rank)
+                        break
+
+            col_defs = vd_commits.get(i)
+            if col_defs is not None:
+                codes, origins = list(state[0]), list(state[1])
+                r = rank[i]
+                for col, ncode, _ in col_defs:
+                    codes[col] = ncode
+                    origins[col] = r
+                state = tuple(codes), tuple(origins)
+
+            states.append(state)
+
+            i2y -= 1
+            if not i2y:
+                yield True
+                i2y = HP_IBY
+
+        # States with same codes but different ranks share codes.
+        codes = {}
+        state_codes = {}
+        nrows = self.nrows = []
+        for state in states:
+            try:
+                nrow = state_codes[id(state)]
+            except KeyError:
+                nrow = state_codes[id(state)] = codes.setdefault(state[0],
+                    state[0]
+                )
+            nrows.append(nrow)
+
+        del self.states
+
+    def _merge(self, commit, commit_parents, old_rank):
+        states = self.states
+        codes = []
+        origins = []
+
+        for col in range(len(self.names)):
+            # values in the order of definition
+            incoming = sorted(set(
+                (states[p][1][col], states[p][0][col]) for p in commit_parents
+                if states[p][0][col]
+            ))
+            if not incoming:
+                codes.append(0)
+                origins.append(-1)
+                continue
+
+            origin, code = incoming[0]
+            col_old_rank = old_rank[col]
+
+            for r, y in incoming[1:]:
+                if y == code:
+                    continue
+                # Is the value old since definition `r`?
+                if col_old_rank.get(y, r + 1) <= r:
+                    continue
+                if col_old_rank.get(code, r + 1) <= r:
+                    origin, code = r, y
+                    continue
+
+                values = self.values[col]
+                raise Exception("Contradictory definition of param "
+                    "'%s' in commit %s (%s != %s)" % (
+                        self.names[col], self.graph.shas[commit],
+                        values[y - 1], values[code - 1]
+                    )
+                )
+
+            codes.append(code)
+            origins.append(origin)
+
+        return tuple(codes), tuple(origins)
+
+    def co_propagate_old(self):
+        graph = self.graph
+        shas = graph.shas
+        parent_offsets = graph.parent_offsets
+        parents = graph.parents
+        nrows = self.nrows
+        names = self.names
+        values = self.values
+        n = len(shas)
+        m = len(names)
+
+        msg_nval = ("Conflict with param '%s' in commit %s (old_val (%s) != "
+            "new_val (%s))"
+        )
+        msg_oval = ("Conflict with param '%s' in commit %s (old_val (%s) != "
+            "old_val (%s))"
+        )
+
+        # Bit mask of root commits a commit descends from. Commits without
+        # new value whose masks intersect are connected through a common
+        # ancestor, a root.
+        masks = []
+        # commits whose masks differ from masks of all parents
+        first_masks = []
+        roots = 0
+        i2y = HP_IBY
+
+        for i in range(n):
+            start, end = parent_offsets[i], parent_offsets[i + 1]
+            if start == end:
+                mask = 1 << roots
+                roots += 1
+                first_masks.append(i)
+            else:
+                mask = masks[parents[start]]
+                for p in parents[start + 1:end]:
+                    mask |= masks[p]
+                for p in parents[start:end]:
+                    if masks[p] == mask:
+                        # share the object
+                        mask = masks[p]
+                        break
+                else:
+                    first_masks.append(i)
+            masks.append(mask)
+
+            i2y -= 1
+            if not i2y:
+                yield True
+                i2y = HP_IBY
+
+        def lowest_root(mask):
+            return (mask & -mask).bit_length() - 1
+
+        # per column: root -> representative root
+        links = []
+        # per column: representative root -> old value code
+        comp_values = []
+
+        for col in range(m):
+            link = list(range(roots))
+            links.append(link)
+            comp_values.append({})
+
+            def find(r):
+                while link[r] != r:
+                    link[r] = link[link[r]]
+                    r = link[r]
+                return r
+
+            # Any commit with a mask can be reached from a commit of
+            # `first_masks` with same mask through ancestors. Commits without
+            # new value are ancestor closed. Hence, it's enough to check those.
+            for i in first_masks:
+                if nrows[i][col]:
+                    continue
+                mask = masks[i]
+                r0 = find(lowest_root(mask))
+                mask &= mask - 1
+                while mask:
+                    r = find(lowest_root(mask))
+                    link[r] = r0
+                    mask &= mask - 1
+
+            for r in range(roots):
+                find(r)
+
+        yield True
+
+        for col in range(m):
+            link = links[col]
+            col_values = values[col]
+            comp_value = comp_values[col]
+
+            # Definitions with unknown SHA1 is assumed to be in an ancestor
+            # of each commit. So, its old value is for all commits.
+            for ocode in self.unknown[col]:
+                first = None
+                for i in range(n):
+                    ncode = nrows[i][col]
+                    if not ncode:
+                        if first is None:
+                            first = i
+                    elif ncode != ocode:
+                        raise Exception(msg_nval % (names[col], shas[i],
+                            col_values[ocode - 1], col_values[ncode - 1]
+                        ))
+
+                if first is None:
+                    continue
+
+                for r in set(link):
+                    other = comp_value.setdefault(r, ocode)
+                    if other != ocode:
+                        raise Exception(msg_oval % (names[col], shas[first],
+                            col_values[ocode - 1], col_values[other - 1]
+                        ))
+
+        yield True
+
+        # Parents of commits with definitions get old values. Latest commits
+        # are processed first.
+        vd_commits = self.vd_commits
+        for commit in sorted(vd_commits, reverse = True):
+            for col, _, ocode in vd_commits[commit]:
+                link = links[col]
+                comp_value = comp_values[col]
+                col_values = values[col]
+
+                for p in parents[parent_offsets[commit]:
+                                 parent_offsets[commit + 1]]:
+                    ncode = nrows[p][col]
+                    if ncode:
+                        if ncode != ocode:
+                            raise Exception(msg_nval % (names[col], shas[p],
+                                col_values[ocode - 1], col_values[ncode - 1]
+                            ))
+                        continue
+
+                    r = link[lowest_root(masks[p])]
+                    other = comp_value.setdefault(r, ocode)
+                    if other != ocode:
+                        raise Exception(msg_oval % (names[col], shas[p],
+                            col_values[ocode - 1], col_values[other - 1]
+                        ))
+
+        yield True
+
+        # Commits with same mask and new values have same old values.
+        orow_cache = {}
+        orows_distinct = {}
+        self.orows = orows = []
+
+        for i in range(n):
+            nrow = nrows[i]
+            mask = masks[i]
+            key = (mask, id(nrow))
+            try:
+                orow = orow_cache[key]
+            except KeyError:
+                root = lowest_root(mask)
+                orow = []
+                for col in range(m):
+                    if nrow[col]:
+                        orow.append(0)
+                    else:
+                        orow.append(comp_values[col].get(links[col][root], 0))
+                orow = tuple(orow)
+                orow = orow_cache[key] = orows_distinct.setdefault(orow, orow)
+            orows.append(orow)
+
+            i2y -= 1
+            if not i2y:
+                yield True
+                i2y = HP_IBY
@@ -14,11 +14,16 @@ from re import (
     compile
 )
 from source import (
-    Type,
-    Macro
+    SourceTreeContainer,
+    Type
 )
 from common import (
-    co_find_eq
+    co_find_eq,
+    trie_add,
+    trie_prefixes
+)
+from six import (
+    integer_types
 )
 from six.moves import (
     range as xrange
@@ -28,6 +33,18 @@ re_pci_vendor = compile("PCI_VENDOR_ID_([A-Z0-9_]+)")
 re_pci_device = compile("PCI_DEVICE_ID_([A-Z0-9_]+)")
 re_pci_class = compile("PCI_CLASS_([A-Z0-9_]+)")
 
+
+def pci_id_key(pci_id):
+    "Normalizes ID value: 0x8086, 0X8086 and 32902 give same key."
+
+    if isinstance(pci_id, integer_types):
+        return pci_id
+    try:
+        return int(pci_id, 0)
+    except ValueError:
+        return pci_id.upper()
+
+
 class PCIVendorIdAlreadyExists(RuntimeError):
     pass
 
@@ -61,15 +78,12 @@ class PCIId(object):
 
 class PCIVendorId (PCIId):
     def __init__(self, vendor_name, vendor_id):
-        if vendor_name in PCIId.db.vendors.keys():
+        if vendor_name in PCIId.db.vendors:
             raise PCIVendorIdAlreadyExists(vendor_name)
 
         PCIId.__init__(self, vendor_name, vendor_id)
 
-        self.device_pattern = compile(
-                "PCI_DEVICE_ID_%s_([A-Z0-9_]+)" % self.name)
-
-        PCIId.db.vendors[self.name] = self
+        PCIId.db.add_vendor(self)
 
     def find_macro(self):
         return Type["PCI_VENDOR_ID_%s" % self.name]
@@ -83,18 +97,18 @@ class PCIVendorId (PCIId):
 class PCIDeviceId (PCIId):
     def __init__(self, vendor_name, device_name, device_id):
         dev_key = PCIClassification.gen_device_key(vendor_name, device_name)
-        if dev_key in PCIId.db.devices.keys():
+        if dev_key in PCIId.db.devices:
             raise PCIDeviceIdAlreadyExists("Vendor %s, Device %s" % vendor_name,
                     device_name)
 
         PCIId.__init__(self, device_name, device_id)
 
-        if not vendor_name in PCIId.db.vendors.keys():
+        if not vendor_name in PCIId.db.vendors:
             self.vendor = PCIVendorId(vendor_name, 0xFFFF)
         else:
             self.vendor = PCIId.db.vendors[vendor_name]
 
-        PCIId.db.devices[dev_key] = self
+        PCIId.db.add_device(dev_key, self)
 
     def find_macro(self):
         return Type["PCI_DEVICE_ID_%s_%s" % (self.vendor.name, self.name)]
@@ -108,12 +122,12 @@ class PCIDeviceId (PCIId):
 
 class PCIClassId (PCIId):
     def __init__(self, class_name, class_id):
-        if class_name in PCIId.db.classes.keys():
+        if class_name in PCIId.db.classes:
             raise Exception("PCI class %s already exists" % class_name)
 
         PCIId.__init__(self, class_name, class_id)
 
-        PCIId.db.classes[self.name] = self
+        PCIId.db.add_class(self)
 
     def find_macro(self):
         return Type["PCI_CLASS_%s" % self.name]
@@ -126,17 +140,50 @@ class PCIClassId (PCIId):
 
 class PCIClassification(object):
     def __init__(self, built = False):
-        self.vendors = {}
-        self.devices = {}
-        self.classes = {}
+        self.clear()
         self.built = built
 
     def clear(self):
+        # name -> PCIId
         self.vendors = {}
         self.devices = {}
         self.classes = {}
+        # `pci_id_key` -> first PCIId with that ID
+        self.vendor_ids = {}
+        self.device_ids = {}
+        self.class_ids = {}
+        # vendor name split by "_" -> PCIVendorId
+        self.vendor_trie = {}
         self.built = False
 
+    def add_vendor(self, v):
+        self.vendors[v.name] = v
+        self.vendor_ids.setdefault(pci_id_key(v.id), v)
+        trie_add(self.vendor_trie, tuple(v.name.split("_")), v)
+
+    def add_device(self, dev_key, d):
+        self.devices[dev_key] = d
+        self.device_ids.setdefault(pci_id_key(d.id), d)
+
+    def add_class(self, c):
+        self.classes[c.name] = c
+        self.class_ids.setdefault(pci_id_key(c.id), c)
+
+    def find_device_vendor(self, device_name):
+        """ Splits name of device (without PCI_DEVICE_ID_ prefix) by the
+vendor with longest name prefix.
+
+:returns: tuple (PCIVendorId, rest of the name) or `None`
+        """
+
+        match = None
+        for v, rest in trie_prefixes(self.vendor_trie,
+            tuple(device_name.split("_"))
+        ):
+            if rest:
+                match = v, "_".join(rest)
+        return match
+
     def find_vendors(self, **kw):
         return co_find_eq(self.vendors.values(), **kw)
 
@@ -167,25 +214,20 @@ class PCIClassification(object):
         gen.line("PCIId.db = " + gen.nameof(self) + ".tmp")
         gen.line("del " + gen.nameof(self) + ".tmp")
 
-    def gen_uniq_vid(self):
+    @staticmethod
+    def gen_uniq_id(used):
         for i in xrange(0, 0xFFFF):
-            for v in self.vendors.values():
-                if v.id.upper() == "0x%X" % i:
-                    break;
-            else:
+            if i not in used:
                 return "0x%X" % i
+        return None
+
+    def gen_uniq_vid(self):
         # no uniq ID
-        return "0xDEAD"
+        return self.gen_uniq_id(self.vendor_ids) or "0xDEAD"
 
     def gen_uniq_did(self):
-        for i in xrange(0, 0xFFFF):
-            for d in self.devices.values():
-                if d.id.upper() == "0x%X" % i:
-                    break;
-            else:
-                return "0x%X" % i
         # no uniq ID
-        return "0xBEAF"
+        return self.gen_uniq_id(self.device_ids) or "0xBEAF"
 
     @staticmethod
     def build():
@@ -194,30 +236,32 @@ class PCIClassification(object):
         if db.built:
             db.clear()
 
-        for t in Type.reg.values():
-            if type(t) == Macro:
-                mi = re_pci_vendor.match(t.name)
-                if mi:
-                    PCIVendorId(mi.group(1), t.text)
-                    continue
+        # Macros of headers those are not loaded yet are listed without
+        # loading.
+        devices = []
+
+        for name, _, text in SourceTreeContainer.current.iter_macros():
+            mi = re_pci_vendor.match(name)
+            if mi:
+                PCIVendorId(mi.group(1), text)
+                continue
 
-                mi = re_pci_class.match(t.name)
-                if mi:
-                    # print 'PCI class %s' % mi.group(1)
-                    PCIClassId(mi.group(1), t.text)
-                    continue
+            mi = re_pci_class.match(name)
+            if mi:
+                # print 'PCI class %s' % mi.group(1)
+                PCIClassId(mi.group(1), text)
+                continue
+
+            mi = re_pci_device.match(name)
+            if mi:
+                devices.append((mi.group(1), text))
 
         # All PCI vendors must be defined before any device.
-        for t in Type.reg.values():
-            if type(t) == Macro:
-                mi = re_pci_device.match(t.name)
-                if mi:
-                    for v in db.vendors.values():
-                        mi = v.device_pattern.match(t.name)
-                        if mi:
-                            PCIDeviceId(v.name, mi.group(1), t.text)
-                            break;
-                    continue
+        for name, text in devices:
+            match = db.find_device_vendor(name)
+            if match:
+                v, device_name = match
+                PCIDeviceId(v.name, device_name, text)
 
         db.built = True
 
@@ -230,10 +274,9 @@ class PCIClassification(object):
             if not isinstance(cid, str):
                 raise ValueError("Class ID value must be a string")
 
-            tmp = self.find_classes(id = cid)
             try:
-                c = next(tmp)
-            except StopIteration:
+                c = self.class_ids[pci_id_key(cid)]
+            except KeyError:
                 raise Exception("There is no known class ID for value %s and"
                     " no one can be created because of the name is not"
                     " given" % cid
@@ -278,16 +321,18 @@ class PCIClassification(object):
                 if did is None:
                     raise Exception("No identification information was got!")
                 # Return first device with such ID
-                for d in self.devices.values():
-                    if did.upper() == d.id.upper():
-                        return d
-                raise Exception("No device with id %s was found!" % did.upper())
+                try:
+                    return self.device_ids[pci_id_key(did)]
+                except KeyError:
+                    raise Exception("No device with id %s was found!" %
+                        did.upper()
+                    )
             # Try get vendor by device name
-            for v in self.vendors.values():
-                if v.device_pattern.match(name):
-                    break
-            else:
+            mi = re_pci_device.match(name)
+            match = mi and self.find_device_vendor(mi.group(1))
+            if not match:
                 raise Exception("Cannot get vendor by device name %s." % name)
+            v = match[0]
 
         if name is not None:
             dev_key = PCIClassification.gen_device_key(v.name, name)
@@ -328,11 +373,7 @@ class PCIClassification(object):
  exists and cannot be created because of no id is specified" % name)
             return v
         elif vid is not None:
-            v = None
-            for ven in self.vendors.values():
-                if ven.id == vid:
-                    v = ven
-                    break
+            v = self.vendor_ids.get(pci_id_key(vid))
             if v is None:
                 raise PCIVendorIdNetherExistsNorCreated("No vendor with id %s\
  was found and no one can be created because of no name is\
@@ -1,5 +1,6 @@
 __all__ = [
     "PCIExpressDeviceType"
+  , "PCIExpressDeviceDescription"
 ]
 
 from source import (
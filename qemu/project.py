@@ -7,6 +7,7 @@ from os import (
     remove
 )
 from os.path import (
+    abspath,
     split,
     join,
     splitext,
@@ -22,11 +23,21 @@ from .machine_description import (
 from common import (
     same_sets,
     callco,
-    co_find_eq
+    co_find_eq,
+    ee,
+    fork_pool,
+    has_fork
 )
 from .makefile_patching import (
     patch_makefile
 )
+from .gen_manifest import (
+    GenManifest,
+    generator_hash
+)
+from .version_description import (
+    QemuVersionDescription
+)
 from codecs import (
     open
 )
@@ -35,8 +46,28 @@ from collections import (
 )
 from source import (
     Header,
+    Macro,
     Source
 )
+from six.moves import (
+    StringIO
+)
+from multiprocessing import (
+    cpu_count
+)
+
+# Number of processes generating device descriptions of a project. 1 is for
+# generation in the current process only. 0 is for a process per CPU.
+# Processes are forked. So, they share loaded QVC with the parent.
+GEN_JOBS = ee("QDT_GEN_JOBS", "1")
+
+# Descriptions not changed since last generation are not generated again.
+# Files whose content is not changed are not rewritten. So, QEMU build system
+# does not recompile them. See `GenManifest`.
+GEN_INCREMENTAL = ee("QDT_GEN_INCREMENTAL", "True")
+
+# The manifest is kept in QEMU build directory.
+GEN_MANIFEST_NAME = "qdt_gen_manifest.json"
 
 # TODO: Selection of configuration flag and accumulator variable
 # name is Qemu version specific. Version API must be used there.
@@ -54,6 +85,82 @@ config_flags["hw"] = "$(CONFIG_SOFTMMU)"
 # settings is chosen this way.
 
 
+# The project being generated by `fork_pool` processes.
+gen_project = None
+
+
+def gen_description(idx, with_chunk_graph):
+    """ Generates description with index `idx` of `gen_project` in a forked
+process.
+
+:returns: files (see `QProject.co_gen_files`) and models of generated
+    headers (see `header_models`)
+    """
+
+    desc = gen_project.descriptions[idx]
+    files = []
+    callco(gen_project.co_gen_files(desc, files,
+        with_chunk_graph = with_chunk_graph
+    ))
+    # `callco` does not raise exceptions
+    if not files or files[-1] is not None:
+        raise RuntimeError("Generation of %s failed" % desc.name)
+    files.pop()
+
+    return files, header_models(files)
+
+
+def header_models(files):
+    """ Parts of models of generated headers those can be used by other
+descriptions (machines): [(header path, [inclusion path], [macro dict])].
+See `Macro.gen_dict`.
+    """
+
+    headers = []
+    for path, is_module, _, _ in files:
+        if is_module:
+            continue
+        h = Header[path]
+        headers.append((path,
+            list(h.inclusions),
+            list(t.gen_dict() for t in h.types.values() if type(t) is Macro)
+        ))
+    return headers
+
+
+def gen_manifest(src):
+    """ Returns `GenManifest` for generation to `src` with current QVD or
+`None` if incremental generation is not possible.
+    """
+
+    if not GEN_INCREMENTAL:
+        return None
+
+    qvd = QemuVersionDescription.current
+    if qvd is None:
+        return None
+
+    salt = "\n".join((generator_hash(), qvd.commit_sha, abspath(src)))
+    return GenManifest.load(join(qvd.build_path, GEN_MANIFEST_NAME), salt)
+
+
+def write_if_changed(path, data):
+    "Writes `bytes` `data` to file at `path` only if its content differs."
+
+    if isfile(path):
+        with open(path, "rb") as stream:
+            if stream.read() == data:
+                return
+        remove(path)
+    else:
+        folder = split(path)[0]
+        if not isdir(folder):
+            makedirs(folder)
+
+    with open(path, "wb") as stream:
+        stream.write(data)
+
+
 class QProject(object):
 
     def __init__(self,
@@ -96,16 +203,107 @@ class QProject(object):
         "Backward compatibility wrapper for co_gen_all"
         callco(self.co_gen_all(*args, **kw))
 
-    def co_gen_all(self, qemu_src, **gen_cfg):
-        # First, generate all devices, then generate machines
-        for desc in self.descriptions:
-            if not isinstance(desc, MachineNode):
-                yield self.co_gen(desc, qemu_src, **gen_cfg)
+    def co_gen_all(self, qemu_src, jobs = None, **gen_cfg):
+        """
+:param jobs: number of processes generating devices, see `GEN_JOBS`
+:param gen_cfg: generation options, see `co_gen`
+        """
 
+        with_chunk_graph = gen_cfg.get("with_chunk_graph", False)
+        known_targets = gen_cfg.get("known_targets", None)
+
+        if jobs is None:
+            jobs = GEN_JOBS
+        if jobs == 0:
+            jobs = cpu_count()
+
+        devices, machines = [], []
         for desc in self.descriptions:
             if isinstance(desc, MachineNode):
-                desc.link()
-                yield self.co_gen(desc, qemu_src, **gen_cfg)
+                machines.append(desc)
+            else:
+                devices.append(desc)
+
+        manifest = gen_manifest(qemu_src)
+
+        # name -> fingerprint
+        fingerprints = {}
+        # name -> manifest entry, descriptions those need not be generated
+        skipped = {}
+
+        if manifest is not None:
+            for desc in devices:
+                fingerprints[desc.name] = manifest.fingerprint(desc,
+                    str(with_chunk_graph)
+                )
+
+            # Machines use devices.
+            devices_fingerprints = sorted(fingerprints.items())
+
+            for desc in machines:
+                fingerprints[desc.name] = manifest.fingerprint(desc,
+                    str(with_chunk_graph),
+                    *("%s=%s" % i for i in devices_fingerprints)
+                )
+
+            for desc in self.descriptions:
+                entry = manifest.lookup(desc.name, fingerprints[desc.name],
+                    qemu_src
+                )
+                if entry is not None:
+                    print("%s is up to date" % desc.name)
+                    skipped[desc.name] = entry
+
+        gen_devices = list(d for d in devices if d.name not in skipped)
+        gen_machines = list(d for d in machines if d.name not in skipped)
+
+        # name -> (files, headers) of generated descriptions
+        results = {}
+
+        # First, generate all devices, then generate machines
+        if jobs > 1 and len(gen_devices) > 1 and has_fork:
+            yield self.co_gen_parallel(jobs, gen_devices, qemu_src,
+                results = results,
+                with_models = bool(gen_machines),
+                **gen_cfg
+            )
+        else:
+            for desc in gen_devices:
+                yield self.co_gen(desc, qemu_src,
+                    results = results,
+                    **gen_cfg
+                )
+
+        for desc in self.descriptions:
+            entry = skipped.get(desc.name)
+            if entry is None:
+                continue
+
+            # Files are same but the build system could be reset.
+            yield self.co_write_files(desc, qemu_src,
+                list((path, is_module, None, None)
+                    for path, is_module, _ in entry["files"]
+                ),
+                known_targets = known_targets
+            )
+
+            if gen_machines and not isinstance(desc, MachineNode):
+                yield self.co_gen_model(entry["headers"])
+
+        for desc in gen_machines:
+            desc.link()
+            yield self.co_gen(desc, qemu_src,
+                results = results,
+                **gen_cfg
+            )
+
+        if manifest is None:
+            return
+
+        for name, (files, headers) in results.items():
+            manifest.account(name, fingerprints[name], files, headers)
+        manifest.forget_others(fingerprints)
+        manifest.save()
 
     def register_in_build_system(self, folder, known_targets):
         tail, head = split(folder)
@@ -132,33 +330,119 @@ class QProject(object):
         if not isfile(Makefile_obj):
             open(Makefile_obj, "w").close()
 
+    def co_gen_parallel(self, jobs, devices, src,
+        with_chunk_graph = False,
+        known_targets = None,
+        results = None,
+        with_models = None
+    ):
+        """ Generates `devices` by `jobs` processes (see `gen_description`).
+Files are written by the current process in same order as `co_gen` does.
+The devices must not depend on each other.
+
+:param results: see `co_gen`
+:param with_models: restore models of headers of `devices` in the current
+    process, see `co_gen_model` (by default, if there are machines in the
+    project)
+        """
+
+        global gen_project
+
+        # Processes inherit the project being forked.
+        gen_project = self
+        pool = fork_pool(jobs)
+        try:
+            indices = dict((id(d), i) for i, d in enumerate(self.descriptions))
+            async_results = list(
+                pool.apply_async(gen_description,
+                    (indices[id(desc)], with_chunk_graph)
+                ) for desc in devices
+            )
+            pool.close()
+
+            if with_models is None:
+                with_models = len(devices) < len(self.descriptions)
+
+            for desc, res in zip(devices, async_results):
+                while not res.ready():
+                    # Waiting must not block other coroutines.
+                    yield False
+
+                files, headers = res.get()
+
+                yield self.co_write_files(desc, src, files,
+                    known_targets = known_targets
+                )
+
+                if results is not None:
+                    results[desc.name] = (files, headers)
+
+                if with_models:
+                    # Machines are generated by this process. They use
+                    # headers of devices.
+                    yield self.co_gen_model(headers)
+        finally:
+            gen_project = None
+            pool.terminate()
+            pool.join()
+
     def gen(self, *args, **kw):
         "Backward compatibility wrapper for co_gen"
         callco(self.co_gen(*args, **kw))
 
+    def co_gen_model(self, headers):
+        """ Restores models of headers of a description generated by another
+process or previous run (see `header_models`). The description is not
+generated again.
+        """
+
+        for path, inclusions, macros in headers:
+            yield True
+
+            try:
+                h = Header[path]
+            except Exception:
+                h = Header(path)
+
+            for m in macros:
+                h.add_type(Macro.new_from_dict(m))
+
+            for inc in inclusions:
+                h.add_inclusion(Header[inc])
+
     def co_gen(self, desc, src,
         with_chunk_graph = False,
-        known_targets = None
+        known_targets = None,
+        results = None
     ):
-        qom_t = desc.gen_type()
+        """
+:param results: `dict`, if given, generated files (see `co_gen_files`) and
+    models of headers (see `header_models`) are saved by `desc.name`
+        """
+
+        files = []
+        yield self.co_gen_files(desc, files,
+            with_chunk_graph = with_chunk_graph
+        )
+        files.pop()
+        yield self.co_write_files(desc, src, files,
+            known_targets = known_targets
+        )
 
-        yield qom_t.co_gen_sources()
+        if results is not None:
+            results[desc.name] = (files, header_models(files))
 
-        for s in qom_t.sources:
-            spath = join(src, s.path)
-            sdir, sname = split(spath)
+    def co_gen_files(self, desc, files, with_chunk_graph = False):
+        """ Generates content of files of `desc`. Tuples (path, is module,
+content, chunk graph or `None`) are appended to `files`. `None` is appended
+after last file.
+        """
 
-            if isfile(spath):
-                yield True
-                remove(spath)
-            elif not isdir(sdir):
-                yield True
-                makedirs(sdir)
+        qom_t = desc.gen_type()
 
-            if type(s) is Source: # Exactly a compile module
-                yield
-                self.register_in_build_system(sdir, known_targets)
+        yield qom_t.co_gen_sources()
 
+        for s in qom_t.sources:
             yield True
 
             # TODO: current value of inherit_references is dictated by Qemu
@@ -167,15 +451,44 @@ class QProject(object):
 
             f = s.generate(inherit_references = inherit_references)
 
-            with open(spath, mode = "wb", encoding = "utf-8") as stream:
-                f.generate(stream)
+            stream = StringIO()
+            f.generate(stream)
 
             if with_chunk_graph:
                 yield True
-                s.gen_chunks_gv_file(spath + ".chunks.gv")
+                graph = StringIO()
+                f.gen_chunks_graph(graph)
+                graph = graph.getvalue()
+            else:
+                graph = None
+
+            files.append((s.path, type(s) is Source, stream.getvalue(), graph))
+
+        files.append(None)
+
+    def co_write_files(self, desc, src, files, known_targets = None):
+        """ Writes `files` of `desc` generated by `co_gen_files`. A file is
+only rewritten if its content is changed. A file with `None` content is
+assumed to be up to date and only registered in the build system.
+        """
+
+        for path, is_module, content, graph in files:
+            spath = join(src, path)
+            sdir, sname = split(spath)
+
+            if content is not None:
+                yield True
+                write_if_changed(spath, content.encode("utf-8"))
+
+            if is_module: # Exactly a compile module
+                yield
+                self.register_in_build_system(sdir, known_targets)
+
+            if graph is not None:
+                write_if_changed(spath + ".chunks.gv", graph.encode("utf-8"))
 
             # Only sources need to be registered in the build system
-            if type(s) is not Source:
+            if not is_module:
                 continue
 
             yield True
@@ -61,9 +61,13 @@ def describable(QOMTemplate):
 
     # export the description class
     try:
-        module.__all__.append(desc_name)
+        names = module.__all__
     except AttributeError:
         pass # The module does not define `__all__`
+    else:
+        # It can be listed already for `static_exports`.
+        if desc_name not in names:
+            names.append(desc_name)
 
     # The template is not actually changed.
     return QOMTemplate
@@ -1,6 +1,9 @@
 __all__ = [
     "QType"
   , "co_update_device_tree"
+  , "co_reverse_device_tree"
+  , "reverse_device_tree"
+  , "merge_device_tree"
 ]
 
 from .qemu_watcher import (
@@ -13,7 +16,16 @@ from debug import (
 )
 from common import (
     pypath,
-    co_find_eq
+    co_find_eq,
+    callco,
+    CancelledCallee,
+    FailedCallee
+)
+from traceback import (
+    format_exception
+)
+from sys import (
+    exc_info
 )
 from os.path import (
     join
@@ -119,7 +131,9 @@ def co_fill_children(qomtr_node, qtype_node, arch):
         yield co_fill_children(c, qt, arch)
 
 
-def co_update_device_tree(qemu_exec, src_path, arch_name, root):
+def co_update_device_tree(qemu_exec, src_path, arch_name, root,
+    port_start = 4321
+):
     dic = create_dwarf_cache(qemu_exec)
 
     gvl_adptr = GitLineVersionAdapter(src_path)
@@ -130,7 +144,7 @@ def co_update_device_tree(qemu_exec, src_path, arch_name, root):
         line_adapter = gvl_adptr
     )
 
-    port = find_free_port(4321)
+    port = find_free_port(port_start)
     qemu_debug_addr = "localhost:%u" % port
     Popen(["gdbserver", qemu_debug_addr, qemu_exec])
 
@@ -158,3 +172,74 @@ def co_update_device_tree(qemu_exec, src_path, arch_name, root):
         root,
         arch_name
     )
+
+
+def co_reverse_device_tree(binaries, src_path, arch_name, root, message,
+    port_start = 4321
+):
+    """ Updates device tree `root` using first working binary for the
+architecture. The architecture is added to `root.arches` on success. Else,
+failures are described in `message` (a `list` of `str`s).
+    """
+
+    for qemu_exec in binaries:
+        try:
+            yield co_update_device_tree(qemu_exec, src_path, arch_name, root,
+                port_start = port_start
+            )
+        except Exception as e:
+            message.extend([
+                "\n",
+                "Failure for binary '%s':\n" % qemu_exec,
+                "\n",
+            ])
+            if isinstance(e, (CancelledCallee, FailedCallee)):
+                message.extend(e.callee.traceback_lines)
+            else:
+                message.extend(format_exception(*exc_info()))
+        else:
+            root.arches.add(arch_name)
+            # Stop on first successful update.
+            break
+
+
+def qtype_to_data(qt):
+    return (qt.name, list(qtype_to_data(c) for c in qt.children.values()))
+
+
+def reverse_device_tree(binaries, src_path, arch_name, port_start):
+    """ Runs `co_reverse_device_tree` in a separate process.
+
+:returns: (device tree, message), the tree is `None` on failure. Else it's
+    nested (name, children) `tuple`s
+    """
+
+    root = QType("device")
+    message = []
+
+    callco(co_reverse_device_tree(binaries, src_path, arch_name, root, message,
+        port_start = port_start
+    ))
+
+    if arch_name not in root.arches:
+        return None, message
+
+    return qtype_to_data(root), message
+
+
+def merge_device_tree(root, data, arch_name):
+    "Adds device tree `data` (see `reverse_device_tree`) for the architecture."
+
+    stack = [(root, data[1])]
+    while stack:
+        node, children = stack.pop()
+        for name, sub in children:
+            try:
+                qt = node.children[name]
+            except KeyError:
+                qt = QType(name)
+                node.add_child(qt)
+
+            qt.arches.add(arch_name)
+
+            stack.append((qt, sub))
@@ -0,0 +1,808 @@
+__all__ = [
+    "QVC_SCHEMA_VERSION"
+  , "QVCFormatError"
+  , "HeaderIndex"
+  , "write_qvc"
+  , "read_qvc"
+]
+
+from array import (
+    array
+)
+from bisect import (
+    bisect_right
+)
+from mmap import (
+    mmap,
+    ACCESS_READ
+)
+from struct import (
+    Struct
+)
+from os import (
+    getpid,
+    remove
+)
+from os.path import (
+    isfile
+)
+from sys import (
+    byteorder
+)
+from six import (
+    integer_types,
+    text_type,
+    binary_type
+)
+from common import (
+    path2tuple
+)
+from source.model import (
+    HDB_HEADER_PATH,
+    HDB_HEADER_IS_GLOBAL,
+    HDB_HEADER_INCLUSIONS,
+    HDB_HEADER_MACROS,
+    HDB_MACRO_NAME,
+    HDB_MACRO_TEXT,
+    HDB_MACRO_ARGS
+)
+from .qom_hierarchy import (
+    QType
+)
+from .pci_ids import (
+    PCIId,
+    PCIVendorId,
+    PCIDeviceId,
+    PCIClassId,
+    PCIClassification
+)
+from .version import (
+    QVHDict
+)
+
+try:
+    from os import (
+        replace
+    )
+except ImportError: # Py2
+    from os import (
+        rename
+    )
+
+    def replace(src, dst):
+        if isfile(dst):
+            remove(dst)
+        rename(src, dst)
+
+
+# Binary QVC file layout.
+#
+# All numbers are little-endian.
+#
+#     file header: magic, schema version, number of sections
+#     section table: tag, offset (from file beginning), size
+#     sections
+#
+# Sections:
+#
+#     "STRS": string table, strings of "DATA" are referenced by index
+#         count, offsets array ('I', count + 1), UTF-8 data
+#     "HSTR": string table of the header DB ("HDRS", "MCRS"), same layout
+#     "HDRS": headers of the header DB, columnar
+#         count, total inclusions,
+#         path ('i'), is_global ('i'),
+#         inclusions start ('I', count + 1), inclusions (header indices, 'i'),
+#         macros start ('I', count + 1)
+#     "MCRS": macros of the header DB, columnar, ordered by definer
+#         count, total arguments,
+#         name ('i'), text ('i', -1 is `None`),
+#         argument count ('i', -1 is `None`), arguments start ('I'),
+#         arguments ('i')
+#     "HIDX": header indices ('i') sorted by path (see `path2tuple`)
+#     "MIDX": macro indices ('i') sorted by UTF-8 encoded name
+#     "DATA": other QVC fields as a tagged value tree (see `_ValueWriter`)
+#
+# Header DB sections have own string table to be copied as is when the header
+# DB is not loaded.
+#
+# Schema 1 had no "HSTR", "HIDX" and "MIDX" sections. All strings were in
+# "STRS". Such files are still loaded (eagerly).
+#
+# Increase `QVC_SCHEMA_VERSION` on any layout change.
+
+QVC_MAGIC = b"QVC\x00"
+QVC_SCHEMA_VERSION = 2
+QVC_SCHEMA_VERSIONS_SUPPORTED = (1, 2)
+
+HEADER_DB_SECTIONS = (b"HSTR", b"HDRS", b"MCRS", b"HIDX", b"MIDX")
+
+file_header = Struct("<4sII")
+section_entry = Struct("<4sQQ")
+u32 = Struct("<I")
+u32x2 = Struct("<II")
+i64 = Struct("<q")
+f64 = Struct("<d")
+
+NONE_IDX = -1
+
+ARRAY_NEEDS_SWAP = byteorder != "little"
+
+for _tc in "iI":
+    if array(_tc).itemsize != 4:
+        raise RuntimeError("array('%s') item is not 4 bytes long" % _tc)
+
+
+class QVCFormatError(ValueError):
+    pass
+
+
+def array_from_bytes(typecode, data):
+    a = array(typecode)
+    try:
+        a.frombytes(data)
+    except AttributeError: # Py2
+        a.fromstring(bytes(data))
+    if ARRAY_NEEDS_SWAP:
+        a.byteswap()
+    return a
+
+
+def array_to_bytes(a):
+    if ARRAY_NEEDS_SWAP:
+        a = array(a.typecode, a)
+        a.byteswap()
+    try:
+        return a.tobytes()
+    except AttributeError: # Py2
+        return a.tostring()
+
+
+class StringTable(object):
+    "Assigns indices to strings being written."
+
+    def __init__(self):
+        self.idx = {}
+        self.strings = []
+
+    def __getitem__(self, string):
+        try:
+            return self.idx[string]
+        except KeyError:
+            i = len(self.strings)
+            self.idx[string] = i
+            self.strings.append(string)
+            return i
+
+    def opt(self, string):
+        return NONE_IDX if string is None else self[string]
+
+    def to_bytes(self):
+        offsets = array("I", [0])
+        data = []
+        off = 0
+        for s in self.strings:
+            b = s.encode("utf-8")
+            off += len(b)
+            offsets.append(off)
+            data.append(b)
+        return (u32.pack(len(self.strings)) + array_to_bytes(offsets)
+            + b"".join(data)
+        )
+
+
+class SectionReader(object):
+    "Sequential reader of a section."
+
+    def __init__(self, buf, offset, size):
+        self.buf = buf
+        self.start = self.pos = offset
+        self.end = offset + size
+
+    def whole(self):
+        return self.buf[self.start:self.end]
+
+    def take(self, size):
+        pos = self.pos
+        end = pos + size
+        if end > self.end:
+            raise QVCFormatError("Section data is truncated")
+        self.pos = end
+        return self.buf[pos:end]
+
+    def unpack(self, struct):
+        return struct.unpack(self.take(struct.size))
+
+    def array(self, typecode, count):
+        return array_from_bytes(typecode, self.take(4 * count))
+
+
+def read_strings(r):
+    count, = r.unpack(u32)
+    offsets = r.array("I", count + 1)
+    data = r.take(offsets[-1])
+
+    try:
+        text = data.decode("ascii")
+    except UnicodeDecodeError:
+        return list(
+            data[offsets[i]:offsets[i + 1]].decode("utf-8")
+                for i in range(count)
+        )
+    else:
+        # Byte offsets are character offsets in ASCII text.
+        return list(text[offsets[i]:offsets[i + 1]] for i in range(count))
+
+
+def header_db_to_bytes(list_headers, st):
+    h_path = array("i")
+    h_global = array("i")
+    h_inc = array("I", [0])
+    inc = array("i")
+    h_mac = array("I", [0])
+
+    m_name = array("i")
+    m_text = array("i")
+    m_argc = array("i")
+    m_arg0 = array("I")
+    args = array("i")
+
+    path2idx = {}
+    for i, dict_h in enumerate(list_headers):
+        path2idx[dict_h[HDB_HEADER_PATH]] = i
+
+    for dict_h in list_headers:
+        h_path.append(st[dict_h[HDB_HEADER_PATH]])
+        h_global.append(1 if dict_h[HDB_HEADER_IS_GLOBAL] else 0)
+
+        for i in dict_h[HDB_HEADER_INCLUSIONS]:
+            try:
+                inc.append(path2idx[i])
+            except KeyError:
+                raise QVCFormatError("Header %s includes unknown header %s" % (
+                    dict_h[HDB_HEADER_PATH], i
+                ))
+        h_inc.append(len(inc))
+
+        for m in dict_h[HDB_HEADER_MACROS]:
+            m_name.append(st[m[HDB_MACRO_NAME]])
+            m_text.append(st.opt(m.get(HDB_MACRO_TEXT, None)))
+            m_arg0.append(len(args))
+            margs = m.get(HDB_MACRO_ARGS, None)
+            if margs is None:
+                m_argc.append(NONE_IDX)
+            else:
+                m_argc.append(len(margs))
+                args.extend(st[a] for a in margs)
+        h_mac.append(len(m_name))
+
+    hdrs = b"".join([u32x2.pack(len(h_path), len(inc))] + list(
+        array_to_bytes(a) for a in (h_path, h_global, h_inc, inc, h_mac)
+    ))
+    mcrs = b"".join([u32x2.pack(len(m_name), len(args))] + list(
+        array_to_bytes(a) for a in (m_name, m_text, m_argc, m_arg0, args)
+    ))
+    return hdrs, mcrs
+
+
+def header_db_to_sections(list_headers):
+    st = StringTable()
+    hdrs, mcrs = header_db_to_bytes(list_headers, st)
+
+    strings = st.strings
+
+    tpaths = list(path2tuple(dict_h[HDB_HEADER_PATH])
+        for dict_h in list_headers
+    )
+    hidx = array("i", sorted(range(len(tpaths)), key = tpaths.__getitem__))
+
+    names = list(
+        m[HDB_MACRO_NAME].encode("utf-8")
+            for dict_h in list_headers
+                for m in dict_h[HDB_HEADER_MACROS]
+    )
+    midx = array("i", sorted(range(len(names)), key = names.__getitem__))
+
+    return [
+        (b"HSTR", st.to_bytes()),
+        (b"HDRS", hdrs),
+        (b"MCRS", mcrs),
+        (b"HIDX", array_to_bytes(hidx)),
+        (b"MIDX", array_to_bytes(midx))
+    ]
+
+
+def header_db_from_sections(hdrs, mcrs, strings):
+    count, inc_count = hdrs.unpack(u32x2)
+    h_path = hdrs.array("i", count)
+    h_global = hdrs.array("i", count)
+    h_inc = hdrs.array("I", count + 1)
+    inc = hdrs.array("i", inc_count)
+    h_mac = hdrs.array("I", count + 1)
+
+    m_count, args_count = mcrs.unpack(u32x2)
+    m_name = mcrs.array("i", m_count)
+    m_text = mcrs.array("i", m_count)
+    m_argc = mcrs.array("i", m_count)
+    m_arg0 = mcrs.array("I", m_count)
+    args = mcrs.array("i", args_count)
+
+    paths = list(strings[i] for i in h_path)
+
+    macros = []
+    for i in range(m_count):
+        m = { HDB_MACRO_NAME : strings[m_name[i]] }
+        text = m_text[i]
+        if text != NONE_IDX:
+            m[HDB_MACRO_TEXT] = strings[text]
+        argc = m_argc[i]
+        if argc != NONE_IDX:
+            arg0 = m_arg0[i]
+            m[HDB_MACRO_ARGS] = list(
+                strings[a] for a in args[arg0:arg0 + argc]
+            )
+        macros.append(m)
+
+    list_headers = []
+    for i in range(count):
+        list_headers.append({
+            HDB_HEADER_PATH : paths[i],
+            HDB_HEADER_IS_GLOBAL : bool(h_global[i]),
+            HDB_HEADER_INCLUSIONS : list(
+                paths[j] for j in inc[h_inc[i]:h_inc[i + 1]]
+            ),
+            HDB_HEADER_MACROS : macros[h_mac[i]:h_mac[i + 1]]
+        })
+
+    return list_headers
+
+
+class HeaderIndex(object):
+    """ Header DB of a QVC file. Headers and macros are decoded on demand.
+See `SourceTreeContainer.load_header_index` for the interface.
+    """
+
+    def __init__(self, sections):
+        self.sections = sections
+
+        r = sections[b"HSTR"]
+        str_count, = r.unpack(u32)
+        self.str_offsets = r.array("I", str_count + 1)
+        self.str_buf = r.buf
+        self.str_base = r.pos
+
+        hdrs = sections[b"HDRS"]
+        count, inc_count = hdrs.unpack(u32x2)
+        self.count = count
+        self.h_path = hdrs.array("i", count)
+        self.h_global = hdrs.array("i", count)
+        self.h_inc = hdrs.array("I", count + 1)
+        self.inc = hdrs.array("i", inc_count)
+        self.h_mac = hdrs.array("I", count + 1)
+
+        mcrs = sections[b"MCRS"]
+        m_count, args_count = mcrs.unpack(u32x2)
+        self.m_name = mcrs.array("i", m_count)
+        self.m_text = mcrs.array("i", m_count)
+        self.m_argc = mcrs.array("i", m_count)
+        self.m_arg0 = mcrs.array("I", m_count)
+        self.args = mcrs.array("i", args_count)
+
+        self.h_sorted = sections[b"HIDX"].array("i", count)
+        self.m_sorted = sections[b"MIDX"].array("i", m_count)
+
+    @classmethod
+    def from_list_headers(klass, list_headers):
+        "Creates the index in memory."
+
+        sections = {}
+        parts = []
+        offset = 0
+        for tag, data in header_db_to_sections(list_headers):
+            sections[tag] = (offset, len(data))
+            parts.append(data)
+            offset += len(data)
+
+        buf = b"".join(parts)
+
+        return klass(dict(
+            (tag, SectionReader(buf, offset, size))
+                for tag, (offset, size) in sections.items()
+        ))
+
+    def to_list_headers(self):
+        "Decodes whole header DB."
+
+        paths = list(self.string(i) for i in self.h_path)
+
+        list_headers = []
+        for hid in range(self.count):
+            path, is_global, inclusions, macros = self.header(hid)
+
+            dict_macros = []
+            for name, args, text in macros:
+                m = { HDB_MACRO_NAME : name }
+                if text is not None:
+                    m[HDB_MACRO_TEXT] = text
+                if args is not None:
+                    m[HDB_MACRO_ARGS] = args
+                dict_macros.append(m)
+
+            list_headers.append({
+                HDB_HEADER_PATH : path,
+                HDB_HEADER_IS_GLOBAL : is_global,
+                HDB_HEADER_INCLUSIONS : list(paths[i] for i in inclusions),
+                HDB_HEADER_MACROS : dict_macros
+            })
+
+        return list_headers
+
+    def raw_sections(self):
+        "Returns header DB sections to be written as is."
+        return list(
+            (tag, self.sections[tag].whole()) for tag in HEADER_DB_SECTIONS
+        )
+
+    def raw_string(self, i):
+        offsets = self.str_offsets
+        base = self.str_base
+        return self.str_buf[base + offsets[i]:base + offsets[i + 1]]
+
+    def string(self, i):
+        return self.raw_string(i).decode("utf-8")
+
+    def header_count(self):
+        return self.count
+
+    def find_header(self, tpath):
+        h_sorted = self.h_sorted
+        h_path = self.h_path
+        string = self.string
+
+        lo, hi = 0, len(h_sorted)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if path2tuple(string(h_path[h_sorted[mid]])) < tpath:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo < len(h_sorted):
+            hid = h_sorted[lo]
+            if path2tuple(string(h_path[hid])) == tpath:
+                return hid
+        return None
+
+    def find_macro(self, name):
+        m_sorted = self.m_sorted
+        m_name = self.m_name
+        raw_string = self.raw_string
+        key = name.encode("utf-8")
+
+        lo, hi = 0, len(m_sorted)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if raw_string(m_name[m_sorted[mid]]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo < len(m_sorted):
+            mid = m_sorted[lo]
+            if raw_string(m_name[mid]) == key:
+                # the definer
+                return bisect_right(self.h_mac, mid) - 1
+        return None
+
+    def header(self, hid):
+        return (
+            self.string(self.h_path[hid]),
+            bool(self.h_global[hid]),
+            list(self.inc[self.h_inc[hid]:self.h_inc[hid + 1]]),
+            self.macros(hid)
+        )
+
+    def macros(self, hid):
+        "Macros of the header as tuples (name, args, text)."
+
+        string = self.string
+
+        m_text = self.m_text
+        m_argc = self.m_argc
+        m_arg0 = self.m_arg0
+        args = self.args
+
+        macros = []
+        for i in range(self.h_mac[hid], self.h_mac[hid + 1]):
+            text = m_text[i]
+            argc = m_argc[i]
+            if argc == NONE_IDX:
+                margs = None
+            else:
+                arg0 = m_arg0[i]
+                margs = list(string(a) for a in args[arg0:arg0 + argc])
+            macros.append((
+                string(self.m_name[i]),
+                margs,
+                None if text == NONE_IDX else string(text)
+            ))
+
+        return macros
+
+
+class _ValueWriter(object):
+    """ Tagged value tree encoder. Tags:
+
+    N: None, T: True, F: False
+    I: integer (64 bit), D: float
+    S: string (string table index), B: bytes (size, data)
+    L: list, U: tuple, E: set (item count, items)
+    M: dict (item count, key-value pairs)
+    """
+
+    def __init__(self, st):
+        self.st = st
+        self.parts = []
+
+    def write(self, v):
+        parts = self.parts
+        if v is None:
+            parts.append(b"N")
+        elif v is True:
+            parts.append(b"T")
+        elif v is False:
+            parts.append(b"F")
+        elif isinstance(v, integer_types):
+            parts.append(b"I" + i64.pack(v))
+        elif isinstance(v, float):
+            parts.append(b"D" + f64.pack(v))
+        elif isinstance(v, text_type):
+            parts.append(b"S" + u32.pack(self.st[v]))
+        elif isinstance(v, binary_type):
+            parts.append(b"B" + u32.pack(len(v)) + v)
+        elif isinstance(v, dict):
+            parts.append(b"M" + u32.pack(len(v)))
+            for k, e in v.items():
+                self.write(k)
+                self.write(e)
+        else:
+            if isinstance(v, list):
+                tag = b"L"
+            elif isinstance(v, tuple):
+                tag = b"U"
+            elif isinstance(v, (set, frozenset)):
+                tag = b"E"
+                v = sorted(v)
+            else:
+                raise QVCFormatError("Cannot store value of type %s" %
+                    type(v).__name__
+                )
+            parts.append(tag + u32.pack(len(v)))
+            for e in v:
+                self.write(e)
+
+    def to_bytes(self):
+        return b"".join(self.parts)
+
+
+class _ValueReader(object):
+
+    def __init__(self, r, strings):
+        self.r = r
+        self.strings = strings
+
+    def read(self):
+        r = self.r
+        tag = r.take(1)
+        if tag == b"N":
+            return None
+        elif tag == b"T":
+            return True
+        elif tag == b"F":
+            return False
+        elif tag == b"I":
+            return r.unpack(i64)[0]
+        elif tag == b"D":
+            return r.unpack(f64)[0]
+        elif tag == b"S":
+            return self.strings[r.unpack(u32)[0]]
+        elif tag == b"B":
+            return bytes(r.take(r.unpack(u32)[0]))
+
+        count, = r.unpack(u32)
+        read = self.read
+        if tag == b"M":
+            res = {}
+            for _ in range(count):
+                k = read()
+                res[k] = read()
+            return res
+        items = list(read() for _ in range(count))
+        if tag == b"L":
+            return items
+        elif tag == b"U":
+            return tuple(items)
+        elif tag == b"E":
+            return set(items)
+        raise QVCFormatError("Unknown value tag %r" % tag)
+
+
+def device_tree_to_data(root):
+    if root is None:
+        return None
+    return (
+        root.name,
+        list(root.macros),
+        set(root.arches),
+        list(device_tree_to_data(c) for c in root.children.values())
+    )
+
+
+def device_tree_from_data(data):
+    if data is None:
+        return None
+
+    name, macros, arches, children = data
+    root = QType(name, macros = macros, arches = arches)
+
+    stack = [(root, children)]
+    while stack:
+        parent, children = stack.pop()
+        for name, macros, arches, sub in children:
+            qt = QType(name, parent = parent, macros = macros, arches = arches)
+            if sub:
+                stack.append((qt, sub))
+
+    return root
+
+
+def pci_classes_to_data(db):
+    if db is None:
+        return None
+    return {
+        "built" : db.built,
+        "vendors" : list((v.name, v.id) for v in db.vendors.values()),
+        "devices" : list(
+            (d.vendor.name, d.name, d.id) for d in db.devices.values()
+        ),
+        "classes" : list((c.name, c.id) for c in db.classes.values())
+    }
+
+
+def pci_classes_from_data(data):
+    if data is None:
+        return None
+
+    db = PCIClassification(built = data["built"])
+
+    # See `PCIClassification.__gen_code__`
+    tmp = PCIId.db
+    PCIId.db = db
+    try:
+        for args in data["vendors"]:
+            PCIVendorId(*args)
+        for args in data["devices"]:
+            PCIDeviceId(*args)
+        for args in data["classes"]:
+            PCIClassId(*args)
+    finally:
+        PCIId.db = tmp
+
+    return db
+
+
+def write_qvc(qvc, path):
+    """ Saves `QemuVersionCache` to binary file. The file is replaced
+atomically.
+    """
+
+    if qvc.list_headers is not None:
+        sections = header_db_to_sections(qvc.list_headers)
+    elif qvc.header_index is not None:
+        sections = qvc.header_index.raw_sections()
+    else:
+        sections = []
+
+    st = StringTable()
+    vw = _ValueWriter(st)
+    vw.write({
+        "device_tree" : device_tree_to_data(qvc.device_tree),
+        "known_targets" : qvc.known_targets,
+        # `dict` constructor gets raw (converter, value) pairs from `QVHDict`
+        "version_desc" : (
+            None if qvc.version_desc is None else dict(qvc.version_desc)
+        ),
+        "pci_classes" : pci_classes_to_data(qvc.pci_c)
+    })
+    sections.append((b"DATA", vw.to_bytes()))
+
+    # Strings must be written after "DATA" because it fills the table.
+    sections.insert(0, (b"STRS", st.to_bytes()))
+
+    offset = file_header.size + section_entry.size * len(sections)
+    toc = []
+    for tag, data in sections:
+        toc.append(section_entry.pack(tag, offset, len(data)))
+        offset += len(data)
+
+    tmp_path = "%s.%d.tmp" % (path, getpid())
+    with open(tmp_path, "wb") as f:
+        f.write(file_header.pack(QVC_MAGIC, QVC_SCHEMA_VERSION,
+            len(sections)
+        ))
+        f.write(b"".join(toc))
+        for _, data in sections:
+            f.write(data)
+
+    replace(tmp_path, path)
+
+
+def read_sections(buf):
+    if len(buf) < file_header.size:
+        raise QVCFormatError("File is too short")
+
+    magic, schema, count = file_header.unpack_from(buf, 0)
+    if magic != QVC_MAGIC:
+        raise QVCFormatError("Not a QVC file")
+    if schema not in QVC_SCHEMA_VERSIONS_SUPPORTED:
+        raise QVCFormatError("QVC schema version %u is not supported (%u is"
+            " expected)" % (schema, QVC_SCHEMA_VERSION)
+        )
+
+    sections = {}
+    for i in range(count):
+        tag, offset, size = section_entry.unpack_from(buf,
+            file_header.size + i * section_entry.size
+        )
+        if offset + size > len(buf):
+            raise QVCFormatError("Section %r is truncated" % tag)
+        sections[tag] = SectionReader(buf, offset, size)
+
+    return schema, sections
+
+
+def read_qvc(path):
+    """ Loads fields of `QemuVersionCache` from binary file.
+
+:returns: `dict` of `QemuVersionCache.__init__` arguments
+    """
+
+    with open(path, "rb") as f:
+        try:
+            # The mapping remains valid after the file is closed.
+            buf = mmap(f.fileno(), 0, access = ACCESS_READ)
+        except ValueError: # empty file cannot be mapped
+            buf = b""
+
+    schema, sections = read_sections(buf)
+
+    list_headers = None
+    header_index = None
+
+    try:
+        strings = read_strings(sections[b"STRS"])
+        data = _ValueReader(sections[b"DATA"], strings).read()
+
+        if schema == 1:
+            if b"HDRS" in sections:
+                list_headers = header_db_from_sections(sections[b"HDRS"],
+                    sections[b"MCRS"], strings
+                )
+        elif b"HDRS" in sections:
+            header_index = HeaderIndex(sections)
+    except KeyError as e:
+        raise QVCFormatError("No section %r" % e.args[0])
+
+    version_desc = data["version_desc"]
+    if version_desc is not None:
+        # Values are already converted to (converter, value) pairs, so
+        # `QVHDict.__setitem__` must be bypassed.
+        version_desc = QVHDict(version_desc)
+
+    return dict(
+        list_headers = list_headers,
+        header_index = header_index,
+        device_tree = device_tree_from_data(data["device_tree"]),
+        known_targets = data["known_targets"],
+        version_desc = version_desc,
+        pci_classes = pci_classes_from_data(data["pci_classes"])
+    )
@@ -0,0 +1,261 @@
+__all__ = [
+    "QVCStore"
+  , "QVCStoreLock"
+]
+
+from os import (
+    O_CREAT,
+    O_EXCL,
+    O_WRONLY,
+    close,
+    getpid,
+    kill,
+    link,
+    listdir,
+    makedirs,
+    open as os_open,
+    remove,
+    stat,
+    utime,
+    write
+)
+from os.path import (
+    isdir,
+    isfile,
+    join
+)
+from errno import (
+    EEXIST,
+    ENOENT,
+    ESRCH
+)
+from shutil import (
+    copyfile
+)
+from socket import (
+    gethostname
+)
+from time import (
+    time
+)
+
+try:
+    from os import (
+        replace
+    )
+except ImportError: # Py2
+    from os import (
+        rename
+    )
+
+    def replace(src, dst):
+        if isfile(dst):
+            remove(dst)
+        rename(src, dst)
+
+
+class QVCStoreLock(object):
+    """ Exclusive right to build an entry of `QVCStore`. The lock is a file
+created with `O_EXCL`. It contains host name and PID of the owner.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def release(self):
+        try:
+            remove(self.path)
+        except OSError as e:
+            if e.errno != ENOENT:
+                raise
+
+
+class QVCStore(object):
+    """ Directory with QVC files shared by build directories.
+
+Entries are keyed by file name which must identify the QVC content (QEMU
+commit, QVD version, heuristic hash). Entries are written atomically and
+evicted in LRU order (by modification time which is updated on each use)
+when total size exceeds `size_limit`.
+
+An entry being built by a process is locked. Other processes should wait
+for it (see `co_lock`).
+    """
+
+    # A lock which is not updated so long is considered stale.
+    lock_timeout = 6 * 60 * 60
+    # Interval of lock checking, seconds.
+    poll_interval = 1.
+
+    def __init__(self, path, size_limit):
+        self.path = path
+        self.size_limit = size_limit
+
+        if not isdir(path):
+            try:
+                makedirs(path)
+            except OSError as e:
+                if e.errno != EEXIST:
+                    raise
+
+    def entry_path(self, name):
+        return join(self.path, name)
+
+    def fetch(self, name, dst):
+        """ Puts the entry to `dst` path. A hard link is used if possible.
+
+:returns: whether the entry exists
+        """
+        src = self.entry_path(name)
+
+        try:
+            # LRU
+            utime(src, None)
+        except OSError as e:
+            if e.errno == ENOENT:
+                return False
+            raise
+
+        tmp = "%s.%d.tmp" % (dst, getpid())
+        try:
+            link(src, tmp)
+        except OSError:
+            try:
+                copyfile(src, tmp)
+            except (IOError, OSError) as e:
+                if e.errno == ENOENT:
+                    # evicted concurrently
+                    return False
+                raise
+
+        replace(tmp, dst)
+        return True
+
+    def publish(self, name, src):
+        "Atomically puts file `src` to the store as entry `name`."
+
+        tmp = self.entry_path("%s.%s.%d.tmp" % (name, gethostname(),
+            getpid()
+        ))
+        try:
+            link(src, tmp)
+        except OSError:
+            copyfile(src, tmp)
+
+        replace(tmp, self.entry_path(name))
+        # LRU
+        utime(self.entry_path(name), None)
+
+        self.evict()
+
+    def evict(self):
+        "Removes least recently used entries above the size limit."
+
+        entries = []
+        total = 0
+        for name in listdir(self.path):
+            if not name.endswith(".qvc"):
+                continue
+            try:
+                st = stat(self.entry_path(name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+            total += st.st_size
+
+        entries.sort()
+
+        for _, size, name in entries:
+            if total <= self.size_limit:
+                break
+            # Entries being built are not published yet. A process which has
+            # fetched an entry keeps it by a hard link or a copy.
+            try:
+                remove(self.entry_path(name))
+            except OSError as e:
+                if e.errno != ENOENT:
+                    raise
+            else:
+                print("QVC store: evicted " + name)
+            total -= size
+
+    def try_lock(self, name):
+        """ Tries to lock the entry for building.
+
+:returns: `QVCStoreLock` or `None` if locked by another process
+        """
+        path = self.entry_path(name + ".lock")
+
+        try:
+            fd = os_open(path, O_CREAT | O_EXCL | O_WRONLY)
+        except OSError as e:
+            if e.errno != EEXIST:
+                raise
+            if self._is_stale(path):
+                print("QVC store: removing stale lock " + path)
+                QVCStoreLock(path).release()
+                return self.try_lock(name)
+            return None
+
+        try:
+            write(fd, ("%s %d" % (gethostname(), getpid())).encode("utf-8"))
+        finally:
+            close(fd)
+
+        return QVCStoreLock(path)
+
+    def _is_stale(self, path):
+        try:
+            st = stat(path)
+            with open(path, "rb") as f:
+                owner = f.read().decode("utf-8").split()
+        except (IOError, OSError):
+            # removed concurrently, try again
+            return False
+
+        if time() - st.st_mtime > self.lock_timeout:
+            return True
+
+        if len(owner) != 2:
+            # being written
+            return False
+
+        host, pid = owner
+        if host != gethostname():
+            return False
+
+        try:
+            kill(int(pid), 0)
+        except OSError as e:
+            return e.errno == ESRCH
+        return False
+
+    def co_lock(self, name, lock_holder):
+        """ Waits until either the entry is published or the lock is got.
+The lock (or `None` if the entry exists) is appended to `lock_holder` list.
+        """
+        waiting = False
+        while True:
+            if isfile(self.entry_path(name)):
+                lock_holder.append(None)
+                break
+
+            lock = self.try_lock(name)
+            if lock is not None:
+                # The entry can be published between checks.
+                if isfile(self.entry_path(name)):
+                    lock.release()
+                    lock_holder.append(None)
+                else:
+                    lock_holder.append(lock)
+                break
+
+            if not waiting:
+                print("QVC store: waiting for %s to be built by another "
+                    "process" % name
+                )
+                waiting = True
+
+            t = time() + self.poll_interval
+            while time() < t:
+                yield False
@@ -1,5 +1,6 @@
 __all__ = [
     "SysBusDeviceType"
+  , "SysBusDeviceDescription"
 ]
 
 from .qom import (
@@ -13,25 +13,36 @@ __all__ = [
   , "forget_build_path"
   , "load_build_path_list"
   , "account_build_path"
+  , "load_legacy_qvc"
+  , "convert_qvc"
+  , "patch_header_db"
 ]
 
 from source import (
     SourceTreeContainer,
     Header,
-    Macro
+    HeaderParseCache
+)
+from source.model import (
+    HDB_HEADER_PATH,
+    HDB_HEADER_INCLUSIONS,
+    HDB_HEADER_MACROS,
+    HDB_MACRO_NAME
 )
 from common import (
     lazy,
-    CancelledCallee,
-    FailedCallee,
     fast_repo_clone,
     fixpath,
-    CommitDesc,
+    CommitGraph,
     mlget as _,
     callco,
     remove_file,
     execfile,
-    pythonize
+    path2tuple,
+    ee,
+    GitTree,
+    load_exports,
+    PhaseProfiler
 )
 from collections import (
     defaultdict
@@ -45,20 +56,41 @@ from .version import (
 )
 from .qom_hierarchy import (
     QType,
-    co_update_device_tree
+    co_reverse_device_tree,
+    reverse_device_tree,
+    merge_device_tree
 )
 from os import (
+    environ,
     listdir
 )
 from os.path import (
     sep,
     join,
+    isdir,
     isfile
 )
 from .pci_ids import (
     PCIId,
     PCIClassification
 )
+from .heuristic_cache import (
+    HeuristicCache
+)
+from .heuristic_propagation import (
+    HeuristicPropagation,
+    group_heuristics,
+    heuristic_key
+)
+from .qvc_store import (
+    QVCStore
+)
+from .qvc_storage import (
+    HeaderIndex,
+    QVCFormatError,
+    write_qvc,
+    read_qvc
+)
 from git import (
     Repo
 )
@@ -74,6 +106,13 @@ from traceback import (
 from sys import (
     exc_info
 )
+from re import (
+    compile
+)
+from multiprocessing import (
+    cpu_count,
+    Pool
+)
 
 
 bp_file_name = "build_path_list"
@@ -193,15 +232,6 @@ def qvds_load_with_cache():
     qvds_load()
     qvds_init_cache()
 
-class QemuCommitDesc(CommitDesc):
-    def __init__(self, sha, parents, children):
-        super(QemuCommitDesc, self).__init__(sha, parents, children)
-
-        # dict of QEMUVersionParameterDescription new_value parameters
-        self.param_nval = {}
-        # dict of QEMUVersionParameterDescription old_value parameters
-        self.param_oval = {}
-
 class QemuVersionCache(object):
     current = None
 
@@ -210,246 +240,134 @@ class QemuVersionCache(object):
         device_tree = None,
         known_targets = None,
         version_desc = None,
-        pci_classes = None
+        pci_classes = None,
+        header_index = None
     ):
         self.device_tree = device_tree
         self.known_targets = known_targets
         self.list_headers = list_headers
+        # Alternative to `list_headers`, see `HeaderIndex`
+        self.header_index = header_index
         self.version_desc = version_desc
 
         # Create source tree container
         self.stc = SourceTreeContainer()
         self.pci_c = PCIClassification() if pci_classes is None else pci_classes
 
-    def co_computing_parameters(self, repo, version):
-        print("Build QEMU Git graph ...")
-        self.commit_desc_nodes = {}
-        yield QemuCommitDesc.co_build_git_graph(repo, self.commit_desc_nodes)
-        print("QEMU Git graph was built")
-
-        yield self.co_propagate_param()
-
-        c = self.commit_desc_nodes[repo.commit(version).hexsha]
-        param = self.version_desc = QVHDict()
-        for k, v in c.param_nval.items():
-            param[k] = v
-        for k, v in c.param_oval.items():
-            param[k] = v
-
-    def co_propagate_param(self):
-        vd = qemu_heuristic_db
-        vd_list = []
-
-        unknown_vd_keys = set()
-        for k in vd.keys():
-            if k in self.commit_desc_nodes:
-                vd_list.append((k, self.commit_desc_nodes[k].num))
-            else:
-                unknown_vd_keys.add(k)
-                print("WARNING: Unknown SHA1 %s in QEMU heuristic database" % k)
+    def co_computing_parameters(self, repo, version, graph,
+        cache_path = None,
+        profile = None
+    ):
+        """
+:param graph: `CommitGraph` of `repo`
+:param cache_path: file of `HeuristicCache`, the cache is not used if `None`
+        """
 
-        sorted_tuple = sorted(vd_list, key = lambda x: x[1])
-        sorted_vd_keys = [t[0] for t in sorted_tuple]
+        if profile is None:
+            profile = PhaseProfiler()
 
         yield True
 
-        # first, need to propagate the new labels
-        print("Propagation params in graph of commit's description ...")
-        yield self.co_propagate_new_param(sorted_vd_keys, vd)
-        yield self.co_propagate_old_param(sorted_vd_keys, unknown_vd_keys, vd)
-        print("Params in graph of commit's description were propagated")
-
-    def co_propagate_new_param(self, sorted_vd_keys, vd):
-        """ This method propagate QEMUVersionParameterDescription.new_value
-        in graph of commits. It must be called before old_value propagation.
-
-    :param sorted_vd_keys:
-        keys of qemu_heuristic_db sorted in ascending order by num of
-        QemuCommitDesc. It's necessary to optimize the graph traversal.
+        groups = group_heuristics(qemu_heuristic_db)
+        keys = dict(
+            (name, heuristic_key(name, defs)) for name, defs in groups.items()
+        )
 
-    :param vd:
-        qemu_heuristic_db
-        """
+        def kept(cache):
+            "Parameters with same definitions as cached ones."
+            return set(name for name, key in cache.columns
+                if keys.get(name) == key
+            )
 
-        # iterations to yield
-        i2y = QVD_HP_IBY
+        cache = None
+        if cache_path is not None and isfile(cache_path):
+            try:
+                cache = HeuristicCache.load(cache_path)
+            except (ValueError, IOError, OSError) as e:
+                print("Bad heuristic cache %s: %s" % (cache_path, e))
+
+        is_changed = False
+        if cache is not None and not cache.matches(graph):
+            # Only values of new commits are computed.
+            with profile.phase("heuristic cache extension") as phase:
+                count = cache.count
+                try:
+                    yield cache.co_extend(graph, groups, kept(cache))
+                except ValueError as e:
+                    print("Cannot extend heuristic cache: %s" % e)
+                    cache = None
+                else:
+                    is_changed = True
+                    phase.count("new commits", len(graph) - count)
 
-        for key in sorted_vd_keys:
-            cur_vd = vd[key]
-            cur_node = self.commit_desc_nodes[key]
-            for vpd in cur_vd:
-                cur_node.param_nval[vpd.name] = vpd.new_value
+        if cache is None:
+            cache = HeuristicCache(graph)
 
-            if i2y == 0:
-                yield True
-                i2y = QVD_HP_IBY
-            else:
-                i2y -= 1
+        # Only parameters with changed definitions are propagated.
+        keep = kept(cache)
+        stale = sorted((name, key) for name, key in keys.items()
+            if name not in keep
+        )
 
-        # vd_keys_set is used to accelerate propagation
-        vd_keys_set = set(sorted_vd_keys)
+        if stale or len(keep) != len(cache.columns):
+            print("Propagation params in graph of commit's description ...")
 
-        # old_val contains all old_value that are in ancestors
-        old_val = {}
-        for key in sorted_vd_keys:
-            stack = [self.commit_desc_nodes[key]]
-            for vpd in vd[key]:
-                try:
-                    old_val[vpd.name].append(vpd.old_value)
-                except KeyError:
-                    old_val[vpd.name] = [vpd.old_value]
-            while stack:
-                cur_node = stack.pop()
-                for c in cur_node.children:
-                    if c.sha in vd_keys_set:
-                        # if the child is vd, only the parameters that are not
-                        # in vd's param_nval are added
-                        for p in cur_node.param_nval:
-                            if p not in c.param_nval:
-                                c.param_nval[p] = cur_node.param_nval[p]
-                        # no need to add element to stack, as it's in the sorted_vd_keys
-                    else:
-                        # the child is't vd
-                        for p in cur_node.param_nval:
-                            if p in c.param_nval:
-                                if cur_node.param_nval[p] != c.param_nval[p]:
-                                    exc_raise = False
-                                    if p in old_val:
-                                        if cur_node.param_nval[p] not in old_val[p]:
-                                            if c.param_nval[p] in old_val[p]:
-                                                c.param_nval[p] = cur_node.param_nval[p]
-                                                stack.append(c)
-                                            else:
-                                                exc_raise = True
-                                    else:
-                                        exc_raise = True
-                                    if exc_raise:
-                                        raise Exception("Contradictory definition of param " \
-"'%s' in commit %s (%s != %s)" % (p, c.sha, cur_node.param_nval[p], c.param_nval[p])
-                                        )
-                            else:
-                                c.param_nval[p] = cur_node.param_nval[p]
-                                stack.append(c)
+            with profile.phase("propagation") as phase:
+                propagation = HeuristicPropagation(graph, groups,
+                    (name for name, _ in stale)
+                )
+                yield propagation.co_propagate()
+                cache.update(keep, stale, propagation)
 
-                if i2y == 0:
-                    yield True
-                    i2y = QVD_HP_IBY
-                else:
-                    i2y -= 1
+                phase.count("params", len(stale))
+                phase.count("rows", len(cache.rows))
 
-    def co_propagate_old_param(self, sorted_vd_keys, unknown_vd_keys, vd):
-        """ This method propagate QEMUVersionParameterDescription.old_value
-        in graph of commits. It must be called after new_value propagation.
+            print("Params in graph of commit's description were propagated")
+            is_changed = True
 
-    :param sorted_vd_keys:
-        keys of qemu_heuristic_db sorted in ascending order by num of
-        QemuCommitDesc. It's necessary to optimize the graph traversal.
+        if is_changed and cache_path is not None:
+            try:
+                cache.save(cache_path)
+            except (IOError, OSError) as e:
+                print("Cannot save heuristic cache %s: %s" % (cache_path, e))
 
-    :param unknown_vd_keys:
-        set of keys which are not in commit_desc_nodes.
+        c = graph.index[repo.commit(version).hexsha]
+        param = self.version_desc = QVHDict()
+        for k, v in cache.iter_values(c, groups):
+            param[k] = v
 
-    :param vd:
-        qemu_heuristic_db
+    def compact_header_db(self):
+        """ Replaces `list_headers` with `header_index`. Headers and macros
+created before are dropped. Instead, they are created on demand.
         """
 
-        # message for exceptions
-        msg = "Conflict with param '%s' in commit %s (old_val (%s) != old_val (%s))"
+        self.header_index = HeaderIndex.from_list_headers(self.list_headers)
+        self.list_headers = None
 
-        # iterations to yield
-        i2y = QVD_HP_IBY
+        self.stc = SourceTreeContainer()
+        self.stc.load_header_index(self.header_index)
 
-        # Assume unknown SHA1 corresponds to an ancestor of a known node.
-        # Therefore, old value must be used for all commits.
-        for commit in self.commit_desc_nodes.values():
-            for vd_keys in unknown_vd_keys:
-                self.init_commit_old_val(commit, vd[vd_keys])
+        if QemuVersionCache.current is self:
+            self.stc.set_cur_stc()
 
-                i2y -= 1
-                if not i2y:
-                    yield True
-                    i2y = QVD_HP_IBY
-
-        vd_keys_set = set(sorted_vd_keys)
-        visited_vd = set()
-        for key in sorted_vd_keys[::-1]:
-            stack = []
-            # used to avoid multiple processing of one node
-            visited_nodes = set([key])
-            visited_vd.add(key)
-
-            node = self.commit_desc_nodes[key]
-            for p in node.parents:
-                stack.append(p)
-
-                # propagate old_val from node to their parents
-                p.param_oval.update()
-                for param, oval in node.param_oval.items():
-                    try:
-                        other = p.param_oval[param]
-                    except KeyError:
-                        p.param_oval[param] = oval
-                    else:
-                        if other != oval:
-                            raise Exception(msg % (param, p.sha, oval, other))
-
-                # init old_val of nodes that consist of vd's parents
-                # and check conflicts
-                self.init_commit_old_val(p, vd[key])
+    def has_header(self, path):
+        "Is the header in the header DB?"
+        if self.header_index is not None:
+            return self.header_index.find_header(path2tuple(path)) is not None
+        if self.list_headers is not None:
+            for dict_h in self.list_headers:
+                if dict_h[HDB_HEADER_PATH] == path:
+                    return True
+        return False
 
-                i2y -= 1
-                if not i2y:
-                    yield True
-                    i2y = QVD_HP_IBY
-
-            while stack:
-                cur_node = stack.pop()
-                visited_nodes.add(cur_node.sha)
-
-                for commit in cur_node.parents + cur_node.children:
-                    if commit.sha in visited_nodes:
-                        continue
-                    for param_name in cur_node.param_oval:
-                        if param_name in commit.param_nval:
-                            continue
-                        elif param_name in commit.param_oval:
-                            if commit.param_oval[param_name] != cur_node.param_oval[param_name]:
-                                raise Exception(msg % (
-param_name, commit.sha, commit.param_oval[param_name], cur_node.param_oval[param_name]
-                                ))
-                        else:
-                            commit.param_oval[param_name] = cur_node.param_oval[param_name]
-                            if commit.sha not in vd_keys_set:
-                                stack.append(commit)
-                            # if we have visited vd before, it is necessary
-                            # to propagate the param, otherwise we do it
-                            # in the following iterations of the outer loop
-                            elif commit.sha in visited_vd:
-                                stack.append(commit)
+    def save(self, path):
+        write_qvc(self, path)
 
-                i2y -= 1
-                if not i2y:
-                    yield True
-                    i2y = QVD_HP_IBY
-
-    def init_commit_old_val(self, commit, vd):
-        # messages for exceptions
-        msg1 = "Conflict with param '%s' in commit %s (old_val (%s) != new_val (%s))"
-        msg2 = "Conflict with param '%s' in commit %s (old_val (%s) != old_val (%s))"
-
-        for param in vd:
-            if param.name in commit.param_nval:
-                if commit.param_nval[param.name] != param.old_value:
-                    raise Exception(msg1 % (
-param.name, commit.sha, param.old_value, commit.param_nval[param.name]
-                    ))
-            elif param.name in commit.param_oval:
-                if commit.param_oval[param.name] != param.old_value:
-                    raise Exception(msg2 % (
-param.name, commit.sha, param.old_value, commit.param_oval[param.name]
-                    ))
-            else:
-                commit.param_oval[param.name] = param.old_value
+    @classmethod
+    def load(klass, path):
+        return klass(**read_qvc(path))
 
+    # Legacy QVCs are pythonized
     __pygen_deps__ = ("pci_c", "device_tree")
 
     def __gen_code__(self, gen):
@@ -462,7 +380,10 @@ param.name, commit.sha, param.old_value, commit.param_oval[param.name]
         gen.pprint(self.known_targets)
 
         gen.gen_field("list_headers = ")
-        gen.pprint(self.list_headers)
+        if self.list_headers is None and self.header_index is not None:
+            gen.pprint(self.header_index.to_list_headers())
+        else:
+            gen.pprint(self.list_headers)
 
         gen.gen_field("version_desc = ")
         gen.pprint(self.version_desc)
@@ -480,6 +401,101 @@ param.name, commit.sha, param.old_value, commit.param_oval[param.name]
         QemuVersionCache.current = self
         return previous
 
+def load_legacy_qvc(path):
+    "Loads pythonized `QemuVersionCache`."
+
+    variables = {}
+    context = {
+        "QemuVersionCache": QemuVersionCache,
+        "QVHDict": QVHDict
+    }
+
+    import qemu
+    context.update(load_exports(qemu))
+
+    execfile(path, context, variables)
+
+    for v in variables.values():
+        if isinstance(v, QemuVersionCache):
+            qvc = v
+            break
+    else:
+        raise Exception("No QemuVersionCache was loaded from %s." % path)
+
+    qvc.version_desc = QVHDict(qvc.version_desc)
+    return qvc
+
+def convert_qvc(legacy_path, path):
+    "Converts pythonized QVC to binary format."
+
+    load_legacy_qvc(legacy_path).save(path)
+
+def patch_header_db(list_headers, fresh, changed, removed):
+    """ Applies changes of header files to a header DB.
+
+:param list_headers: the header DB to patch
+:param fresh: a header DB with just parsed `changed` headers (and headers
+    included by them)
+:param changed: paths of added and modified headers
+:param removed: paths of removed headers
+:returns: new header DB or `None` if a macro of changed or removed headers
+    is not defined by any header now (another header not included by them
+    may define it)
+
+A macro keeps its definer unless the definer is changed or removed. Other
+headers of `fresh` are added if they are not in `list_headers`. Else, only
+new macros are added to them (e.g., a changed header includes them before
+defining its macros now).
+    """
+
+    dropped = set(changed)
+    dropped.update(removed)
+
+    new_db = []
+    known_macros = set()
+    lost_macros = set()
+
+    for dict_h in list_headers:
+        names = (m[HDB_MACRO_NAME] for m in dict_h[HDB_HEADER_MACROS])
+        if dict_h[HDB_HEADER_PATH] in dropped:
+            lost_macros.update(names)
+            continue
+        new_db.append(dict(dict_h))
+        known_macros.update(names)
+
+    known = dict((dict_h[HDB_HEADER_PATH], dict_h) for dict_h in new_db)
+
+    for dict_h in fresh:
+        macros = list(m for m in dict_h[HDB_HEADER_MACROS]
+            if m[HDB_MACRO_NAME] not in known_macros
+        )
+        known_macros.update(m[HDB_MACRO_NAME] for m in macros)
+
+        path = dict_h[HDB_HEADER_PATH]
+        if path in known:
+            if macros:
+                known_h = known[path]
+                known_h[HDB_HEADER_MACROS] = (
+                    list(known_h[HDB_HEADER_MACROS]) + macros
+                )
+            continue
+
+        dict_h = dict(dict_h)
+        dict_h[HDB_HEADER_MACROS] = macros
+        new_db.append(dict_h)
+        known[path] = dict_h
+
+    if lost_macros - known_macros:
+        return None
+
+    # Inclusions of removed headers
+    for dict_h in new_db:
+        dict_h[HDB_HEADER_INCLUSIONS] = list(
+            i for i in dict_h[HDB_HEADER_INCLUSIONS] if i in known
+        )
+
+    return new_db
+
 class ConfigHost(object):
 
     def __init__(self, config_host_path):
@@ -500,8 +516,6 @@ class QVCIsNotReady(RuntimeError):
 
 # Iterations Between Yields of Device Tree Macros adding task
 QVD_DTM_IBY = 100
-# Iterations Between Yields of Heuristic Propagation task
-QVD_HP_IBY = 100
 # Iterations Between Yields of Check Modified Files task
 QVD_CMF_IBY = 100
 # Iterations Between Yields of Check Untracked Files task
@@ -509,6 +523,45 @@ QVD_CUF_IBY = 100
 
 QVD_QH_HASH = "qh_hash"
 
+# Build QVC from the QVC of the nearest ancestor or descendant commit, if
+# available. Only changed headers are parsed then.
+QVD_INCREMENTAL = ee("QDT_QVC_INCREMENTAL", "True")
+
+re_sha = compile("^[0-9a-f]{40}$")
+
+# Number of processes building device trees of architectures concurrently.
+# 1 is for building in the current process (default). 0 is for a process per
+# CPU. Each process runs a QEMU under gdbserver, so be careful.
+QVD_DT_JOBS = ee("QDT_DEVICE_TREE_JOBS", "1")
+# Processes search for free ports for gdbserver in different ranges.
+QVD_DT_PORT_START = 4321
+QVD_DT_PORTS_PER_JOB = 100
+
+# Read QEMU headers directly from Git object store. Else, a temporary clone
+# is checked out.
+QVD_GIT_TREE = ee("QDT_QVC_GIT_TREE", "True")
+
+# Keep QEMU commit graph and values of heuristic parameters in files inside
+# the build directory. Both are updated incrementally.
+QVD_GRAPH_CACHE = ee("QDT_QVC_GRAPH_CACHE", "True")
+QVD_GRAPH_FILE_NAME = "qdt_commit_graph"
+QVD_HEURISTIC_CACHE_FILE_NAME = "qdt_heuristic_cache"
+
+# Keep results of header parsing in a file inside the build directory. A
+# header is not parsed again if it and files it includes are same (by blob
+# SHA1), see `HeaderParseCache`.
+QVD_HEADER_PARSE_CACHE = ee("QDT_QVC_HEADER_PARSE_CACHE", "True")
+QVD_HEADER_PARSE_CACHE_FILE_NAME = "qdt_header_parse_cache"
+
+# Directory with QVCs shared by build directories (disabled by default) and
+# its size limit in bytes.
+QVD_STORE_PATH = environ.get("QDT_QVC_STORE", "")
+QVD_STORE_SIZE = ee("QDT_QVC_STORE_SIZE", "8 << 30")
+
+# Phases of QVC initialization are measured (see `PhaseProfiler`). The results
+# are dumped as JSON to that file or directory if given.
+QVD_PROFILE_PATH = environ.get("QDT_QVC_PROFILE", "")
+
 class QemuVersionDescription(object):
     current = None
     # Current version of the QVD. Please use notation `u"_v{number}"` for next
@@ -558,6 +611,8 @@ class QemuVersionDescription(object):
 
         self.qvc = None
         self.qvc_is_ready = False
+        # see `co_init_commit_graph`
+        self.commit_graph = None
 
     # The method made the description active
     def use(self):
@@ -590,6 +645,26 @@ class QemuVersionDescription(object):
 
     @lazy
     def qvc_file_name(self):
+        return (u"qvc" + QemuVersionDescription.version + u"_" +
+            self.commit_sha + u".qvc"
+        )
+
+    def qvc_store_name(self, qemu_heuristic_hash):
+        "Name of QVC file in shared store (see `QVCStore`)."
+        return (u"qvc" + QemuVersionDescription.version + u"_" +
+            self.commit_sha + u"_" + qemu_heuristic_hash + u".qvc"
+        )
+
+    @lazy
+    def heuristic_cache_path(self):
+        "File of `HeuristicCache` or `None` if it's disabled."
+        if QVD_GRAPH_CACHE:
+            return join(self.build_path, QVD_HEURISTIC_CACHE_FILE_NAME)
+        return None
+
+    @lazy
+    def qvc_legacy_file_name(self):
+        "Name of pythonized QVC file. It's only loaded to be converted."
         return (u"qvc" + QemuVersionDescription.version + u"_" +
             self.commit_sha + u".py"
         )
@@ -601,63 +676,216 @@ class QemuVersionDescription(object):
 
         qvc_path = self.qvc_path = join(self.build_path, self.qvc_file_name)
 
+        # See `QVD_PROFILE_PATH`
+        self.profile = profile = PhaseProfiler()
+
         qemu_heuristic_hash = calculate_qh_hash()
 
         yield True
 
         if not isfile(qvc_path):
+            legacy_path = join(self.build_path, self.qvc_legacy_file_name)
+            if isfile(legacy_path):
+                print("Converting legacy QVC " + legacy_path)
+                convert_qvc(legacy_path, qvc_path)
+
+            yield True
+
+        if QVD_STORE_PATH:
+            store = QVCStore(QVD_STORE_PATH, QVD_STORE_SIZE)
+            store_name = self.qvc_store_name(qemu_heuristic_hash)
+        else:
+            store = None
+
+        store_lock = None
+
+        if store is not None and not isfile(qvc_path):
+            with profile.phase("store fetch"):
+                # The QVC can be built for another build directory. If it's
+                # being built by another process, wait for it.
+                while not store.fetch(store_name, qvc_path):
+                    lock_holder = []
+                    yield store.co_lock(store_name, lock_holder)
+                    store_lock = lock_holder[0]
+                    if store_lock is not None:
+                        break
+
+            if store_lock is None:
+                print("QVC was taken from store " + QVD_STORE_PATH)
+
+        try:
+            yield self._co_init_cache(qvc_path, qemu_heuristic_hash)
+
+            if store is not None and (store_lock is not None
+                or self.qvc_was_saved
+                or not isfile(store.entry_path(store_name))
+            ):
+                with profile.phase("store publish"):
+                    store.publish(store_name, qvc_path)
+        finally:
+            if store_lock is not None:
+                store_lock.release()
+
+        if QVD_PROFILE_PATH:
+            self.dump_profile(QVD_PROFILE_PATH)
+
+    def dump_profile(self, path):
+        "Saves `profile` of QVC initialization as JSON file or to directory."
+        if isdir(path):
+            path = join(path, u"qvc" + QemuVersionDescription.version + u"_" +
+                self.commit_sha + u"_profile.json"
+            )
+        print("Saving QVC initialization profile to " + path)
+        self.profile.dump(path,
+            commit_sha = self.commit_sha,
+            qemu_version = self.qemu_version,
+            qvc_was_saved = self.qvc_was_saved
+        )
+        self.profile.report()
+
+    def _co_init_cache(self, qvc_path, qemu_heuristic_hash):
+        self.qvc_was_saved = False
+        profile = self.profile
+
+        if isfile(qvc_path):
+            with profile.phase("load"):
+                try:
+                    self.load_cache()
+                except QVCFormatError as e:
+                    print("Bad QVC %s: %s" % (qvc_path, e))
+                    remove_file(qvc_path)
+
+        if self.qvc is None:
             self.qvc = QemuVersionCache()
 
-            # Check out Qemu source to a temporary directory and analyze it
-            # there. This avoids problems with user changes in main working
-            # directory.
+            # Qemu source is analyzed at the commit rather than in main working
+            # directory. This avoids problems with user changes.
 
-            print("Checking out temporary source tree...")
+            with profile.phase("source tree"):
+                if QVD_GIT_TREE:
+                    # Headers are read from Git object store while
+                    # `Header.co_build_inclusions` believes that they are in
+                    # main working directory.
+                    tree = GitTree(self.repo, self.commit_sha,
+                        paths = list(path for path, _ in self.include_paths)
+                    )
+                    work_dir = tree.root
+                else:
+                    tree = None
 
-            # Note. Alternatively, checking out can be performed without
-            # cloning. Instead, a magic might be casted on GIT_DIR and
-            # GIT_WORK_TREE environment variables. But, this approach resets
-            # staged files in src_path repository which can be inconvenient
-            # for a user.
-            tmp_repo = fast_repo_clone(self.repo, self.commit_sha, "qdt-qemu")
-            tmp_work_dir = tmp_repo.working_tree_dir
+                    print("Checking out temporary source tree...")
 
-            print("Temporary source tree: %s" % tmp_work_dir)
+                    # Note. Alternatively, checking out can be performed
+                    # without cloning. Instead, a magic might be casted on
+                    # GIT_DIR and GIT_WORK_TREE environment variables. But,
+                    # this approach resets staged files in src_path repository
+                    # which can be inconvenient for a user.
+                    tmp_repo = fast_repo_clone(self.repo, self.commit_sha,
+                        "qdt-qemu"
+                    )
+                    work_dir = tmp_repo.working_tree_dir
 
-            # make new QVC active and begin construction
-            prev_qvc = self.qvc.use()
-            for path, recursive in self.include_paths:
-                yield Header.co_build_inclusions(join(tmp_work_dir, path),
-                    recursive
-                )
+                    print("Temporary source tree: %s" % work_dir)
+
+            try:
+                # make new QVC active and begin construction
+                prev_qvc = self.qvc.use()
+
+                if QVD_INCREMENTAL:
+                    yield self.co_init_commit_graph(profile = profile)
+                    base = self.load_nearest_header_db()
+                else:
+                    base = None
+
+                parse_cache = self.load_header_parse_cache()
+
+                if base is not None:
+                    with profile.phase("header DB update") as phase:
+                        yield self.co_update_header_db(work_dir, tree, *base,
+                            parse_cache = parse_cache
+                        )
+
+                        if self.qvc.header_index is not None:
+                            phase.count("headers",
+                                self.qvc.header_index.header_count()
+                            )
+
+                if self.qvc.header_index is None:
+                    with profile.phase("header parsing") as phase:
+                        for path, recursive in self.include_paths:
+                            yield Header.co_build_inclusions(
+                                join(work_dir, path),
+                                recursive,
+                                tree = tree,
+                                cache = parse_cache
+                            )
+                        phase.count("headers", len(self.qvc.stc.reg_header))
+                        if parse_cache is not None:
+                            phase.count("cached headers", parse_cache.hits)
+
+                    with profile.phase("header DB") as phase:
+                        self.qvc.list_headers = self.qvc.stc.create_header_db()
+                        phase.count("headers", len(self.qvc.list_headers))
+                        phase.count("macros", sum(
+                            len(h[HDB_HEADER_MACROS])
+                                for h in self.qvc.list_headers
+                        ))
 
-            self.qvc.list_headers = self.qvc.stc.create_header_db()
+                    with profile.phase("header DB compaction"):
+                        self.qvc.compact_header_db()
 
-            rmtree(tmp_work_dir)
+                if parse_cache is not None:
+                    with profile.phase("header parse cache saving"):
+                        parse_cache.save()
+            finally:
+                if tree is None:
+                    rmtree(work_dir)
+                else:
+                    tree.close()
 
-            yield self.co_init_device_tree()
+            with profile.phase("device tree") as phase:
+                yield self.co_init_device_tree()
+                phase.count("targets", len(self.softmmu_targets))
 
-            yield self.co_gen_known_targets()
+            with profile.phase("known targets") as phase:
+                yield self.co_gen_known_targets()
+                phase.count("targets", len(self.qvc.known_targets))
 
             # gen version description
-            yield self.qvc.co_computing_parameters(self.repo, self.commit_sha)
+            yield self.co_init_commit_graph(profile = profile)
+            yield self.qvc.co_computing_parameters(self.repo, self.commit_sha,
+                self.commit_graph,
+                cache_path = self.heuristic_cache_path,
+                profile = profile
+            )
             self.qvc.version_desc[QVD_QH_HASH] = qemu_heuristic_hash
 
-            # Search for PCI Ids
-            PCIClassification.build()
+            with profile.phase("PCI classification"):
+                # Search for PCI Ids
+                PCIClassification.build()
 
             yield True
 
-            pythonize(self.qvc, qvc_path)
+            with profile.phase("save"):
+                self.qvc.save(qvc_path)
+            self.qvc_was_saved = True
         else:
-            self.load_cache()
             # make just loaded QVC active
             prev_qvc = self.qvc.use()
 
-            if self.qvc.list_headers is not None:
+            # Schema 1 QVC has no header index. It will be re-saved.
+            has_old_schema = self.qvc.list_headers is not None
+
+            if has_old_schema:
                 yield True
 
-                yield self.qvc.stc.co_load_header_db(self.qvc.list_headers)
+                with profile.phase("header DB loading") as phase:
+                    phase.count("headers", len(self.qvc.list_headers))
+                    self.qvc.compact_header_db()
+            elif self.qvc.header_index is not None:
+                # Headers are loaded on demand.
+                with profile.phase("header index loading"):
+                    self.qvc.stc.load_header_index(self.qvc.header_index)
 
             yield True
 
@@ -671,9 +899,13 @@ class QemuVersionDescription(object):
                 if not checksum == qemu_heuristic_hash:
                     is_outdated = True
             if is_outdated:
+                yield self.co_init_commit_graph(profile = profile)
                 yield self.qvc.co_computing_parameters(
                     self.repo,
-                    self.commit_sha
+                    self.commit_sha,
+                    self.commit_graph,
+                    cache_path = self.heuristic_cache_path,
+                    profile = profile
                 )
                 self.qvc.version_desc[QVD_QH_HASH] = qemu_heuristic_hash
 
@@ -687,52 +919,294 @@ class QemuVersionDescription(object):
                 has_new_target = True
 
             if has_new_target:
-                yield self.co_init_device_tree(new_targets)
+                with profile.phase("device tree") as phase:
+                    yield self.co_init_device_tree(new_targets)
+                    phase.count("targets", len(new_targets))
 
-            if is_outdated or has_new_target:
-                pythonize(self.qvc, qvc_path)
+            if is_outdated or has_new_target or has_old_schema:
+                with profile.phase("save"):
+                    self.qvc.save(qvc_path)
+                self.qvc_was_saved = True
 
         yield True
 
-        # set Qemu version heuristics according to current version
-        initialize_version(self.qvc.version_desc)
+        with profile.phase("version initialization"):
+            # set Qemu version heuristics according to current version
+            initialize_version(self.qvc.version_desc)
 
         yield True
 
-        # initialize Qemu types in QVC
-        get_vp()["qemu types definer"]()
-        get_vp()["msi_init type definer"]()
+        with profile.phase("QOM types definition"):
+            # initialize Qemu types in QVC
+            get_vp()["qemu types definer"]()
+            get_vp()["msi_init type definer"]()
 
         if prev_qvc is not None:
             prev_qvc.use()
 
         self.qvc_is_ready = True
 
+    def co_init_commit_graph(self, profile = None):
+        """ Makes `commit_graph` of QEMU repository. The graph is loaded from
+the file and extended with new commits or built from scratch.
+        """
+
+        if self.commit_graph is not None:
+            return
+
+        if profile is None:
+            profile = PhaseProfiler()
+
+        repo = self.repo
+        graph_path = join(self.build_path, QVD_GRAPH_FILE_NAME)
+        cache_path = self.heuristic_cache_path
+
+        with profile.phase("git graph") as phase:
+            graph = None
+            if QVD_GRAPH_CACHE and isfile(graph_path):
+                try:
+                    graph = CommitGraph.load(graph_path)
+                except (ValueError, IOError, OSError) as e:
+                    print("Bad commit graph %s: %s" % (graph_path, e))
+
+            if graph is not None:
+                count = len(graph)
+                print("Update QEMU Git graph ...")
+                try:
+                    yield graph.co_build(repo)
+                except (ValueError, RuntimeError) as e:
+                    # E.g., heads of the graph were removed from the
+                    # repository.
+                    print("Cannot update QEMU Git graph: %s" % e)
+                    graph = None
+
+            if graph is None:
+                count = 0
+                print("Build QEMU Git graph ...")
+                graph = CommitGraph()
+                yield graph.co_build(repo)
+                # numbering of the commits may be different
+                if cache_path is not None and isfile(cache_path):
+                    remove_file(cache_path)
+
+            print("QEMU Git graph was built")
+
+            if QVD_GRAPH_CACHE and len(graph) != count:
+                try:
+                    graph.save(graph_path)
+                except (IOError, OSError) as e:
+                    print("Cannot save commit graph %s: %s" % (graph_path, e))
+
+            phase.count("commits", len(graph))
+            phase.count("new commits", len(graph) - count)
+
+        self.commit_graph = graph
+
+    def find_nearest_qvc(self):
+        """ Looks for a QVC of the nearest ancestor or descendant commit in
+the build directory. The distance is the number of commits between. All
+candidates are measured by one pass over `commit_graph`.
+
+:returns: (path, SHA1) or `None`
+        """
+
+        prefix = u"qvc" + QemuVersionDescription.version + u"_"
+        index = self.commit_graph.index
+
+        try:
+            commits = [index[self.commit_sha]]
+        except KeyError:
+            # not reachable from references
+            return None
+
+        candidates = []
+        for name in listdir(self.build_path):
+            if not (name.startswith(prefix) and name.endswith(u".qvc")):
+                continue
+
+            sha = name[len(prefix):-len(u".qvc")]
+            if not re_sha.match(sha) or sha == self.commit_sha:
+                continue
+
+            try:
+                commits.append(index[sha])
+            except KeyError:
+                # unknown commit
+                continue
+
+            candidates.append((name, sha))
+
+        if not candidates:
+            return None
+
+        counts = self.commit_graph.count_ancestors(commits)
+
+        nearest = None
+        for i, (name, sha) in enumerate(candidates, 1):
+            bit = 1 << i
+            # ancestors of current commit which are not ancestors of the
+            # candidate and vice versa
+            ahead = sum(n for m, n in counts.items() if m & 1 and not m & bit)
+            behind = sum(n for m, n in counts.items() if m & bit and not m & 1)
+
+            if ahead and behind:
+                # neither ancestor nor descendant
+                continue
+
+            distance = ahead + behind
+            if nearest is None or distance < nearest[0]:
+                nearest = (distance, join(self.build_path, name), sha)
+
+        if nearest is None:
+            return None
+        return nearest[1:]
+
+    def load_nearest_header_db(self):
+        """ Loads the header DB from the QVC found by `find_nearest_qvc`.
+
+:returns: (header DB, SHA1) or `None`
+        """
+
+        nearest = self.find_nearest_qvc()
+        if nearest is None:
+            return None
+
+        path, sha = nearest
+
+        print("Loading header DB from " + path)
+        try:
+            base = QemuVersionCache.load(path)
+        except QVCFormatError as e:
+            print("Bad QVC %s: %s" % (path, e))
+            return None
+
+        if base.header_index is not None:
+            return base.header_index.to_list_headers(), sha
+        if base.list_headers is not None:
+            return base.list_headers, sha
+        return None
+
+    def get_changed_headers(self, sha):
+        """ Compares headers at `sha` with headers at `commit_sha`.
+
+:returns: tuple of
+    - `dict` of modified header entries per include path,
+    - `list` of header DB paths of added headers,
+    - `list` of header DB paths of removed headers
+        """
+
+        changed = dict((path, []) for path, _ in self.include_paths)
+        added = []
+        removed = []
+
+        out = self.repo.git.diff("--name-status", "--no-renames", "-z",
+            sha, self.commit_sha, "--",
+            *(path for path, _ in self.include_paths)
+        )
+        parts = out.split("\0")
+
+        for status, git_path in zip(parts[0::2], parts[1::2]):
+            if not git_path.endswith(".h"):
+                continue
+
+            for path, recursive in self.include_paths:
+                prefix = path + "/"
+                if not git_path.startswith(prefix):
+                    continue
+
+                entry = git_path[len(prefix):]
+                if not recursive and "/" in entry:
+                    continue
+
+                entry = join(*entry.split("/"))
+                if status == "D":
+                    removed.append(entry)
+                elif status == "A":
+                    added.append(entry)
+                else:
+                    changed[path].append(entry)
+                break
+
+        return changed, added, removed
+
+    def load_header_parse_cache(self):
+        "Returns `HeaderParseCache` or `None` if it's disabled."
+
+        if not QVD_HEADER_PARSE_CACHE:
+            return None
+
+        return HeaderParseCache.load(
+            join(self.build_path, QVD_HEADER_PARSE_CACHE_FILE_NAME)
+        )
+
+    def co_update_header_db(self, work_dir, tree, list_headers, sha,
+        parse_cache = None
+    ):
+        """ Builds header DB by patching `list_headers` of commit `sha`.
+The header DB is not built (`header_index` is left `None`) if the patching
+can give a result other than full parsing.
+
+:param tree: see `Header.co_build_inclusions`
+:param parse_cache: see `Header.co_build_inclusions`
+        """
+
+        changed, added, removed = self.get_changed_headers(sha)
+
+        if added or removed:
+            # A header may be included instead of another one with same name
+            # found later on the include path. Macros may be moved to other
+            # headers.
+            print("Headers of %s are added (%u) or removed (%u), full "
+                "analysis is required" % (sha, len(added), len(removed))
+            )
+            return
+
+        print("Updating header DB of %s: %u changed headers" % (
+            sha, sum(len(e) for e in changed.values())
+        ))
+
+        # Changed headers are parsed separately to get their new content.
+        parse_stc = SourceTreeContainer()
+        parse_stc.set_cur_stc()
+        try:
+            for path, recursive in self.include_paths:
+                if changed[path]:
+                    yield Header.co_build_inclusions(join(work_dir, path),
+                        recursive,
+                        entries = changed[path],
+                        tree = tree,
+                        cache = parse_cache
+                    )
+
+            fresh = parse_stc.create_header_db()
+        finally:
+            self.qvc.stc.set_cur_stc()
+
+        yield True
+
+        all_changed = []
+        for entries in changed.values():
+            all_changed.extend(entries)
+
+        list_headers = patch_header_db(list_headers, fresh, all_changed,
+            removed
+        )
+
+        if list_headers is None:
+            print("Macros of changed headers of %s may be defined by other "
+                "headers, full analysis is required" % sha
+            )
+            return
+
+        self.qvc.list_headers = list_headers
+        self.qvc.compact_header_db()
+
     def load_cache(self):
         if not isfile(self.qvc_path):
             raise Exception("%s does not exists." % self.qvc_path)
         else:
             print("Loading QVC from " + self.qvc_path)
-            variables = {}
-            context = {
-                "QemuVersionCache": QemuVersionCache,
-                "QVHDict": QVHDict
-            }
-
-            import qemu
-            context.update(qemu.__dict__)
-
-            execfile(self.qvc_path, context, variables)
-
-            for v in variables.values():
-                if isinstance(v, QemuVersionCache):
-                    self.qvc = v
-                    break
-            else:
-                raise Exception(
-"No QemuVersionCache was loaded from %s." % self.qvc_path
-                )
-            self.qvc.version_desc = QVHDict(self.qvc.version_desc)
+            self.qvc = QemuVersionCache.load(self.qvc_path)
 
     def co_check_modified_files(self):
         # A diff between the index and the working tree
@@ -748,9 +1222,9 @@ class QemuVersionDescription(object):
         yield True
 
         i2y = QVD_CMF_IBY
-        for e in self.qvc.list_headers:
-            if e['path'] in modified_files:
-                raise ProcessingModifiedFile(e['path'])
+        for path in modified_files:
+            if self.qvc.has_header(path):
+                raise ProcessingModifiedFile(path)
 
             if i2y == 0:
                 yield True
@@ -814,48 +1288,44 @@ class QemuVersionDescription(object):
             root = QType("device")
 
         arches_count = len(root.arches)
-        for arch in targets:
-            # Try to get QOM tree using binaries from different places.
-            # Installed binary is tried first because in this case Qemu
-            # launched as during normal operation.
-            # However, if user did not install Qemu, we should try to use
-            # binary from build directory.
-            install_dir = join(fixpath(self.config_host.prefix), "bin")
+
+        # Try to get QOM tree using binaries from different places.
+        # Installed binary is tried first because in this case Qemu
+        # launched as during normal operation.
+        # However, if user did not install Qemu, we should try to use
+        # binary from build directory.
+        install_dir = join(fixpath(self.config_host.prefix), "bin")
+
+        arches_binaries = []
+        # Architectures are handled in a fixed order for stable results.
+        for arch in sorted(targets):
             build_dir = join(self.build_path, arch + "-softmmu")
 
-            binaries = [
+            arches_binaries.append((arch, [
                 join(install_dir, "qemu-system-" + arch),
                 join(build_dir, "qemu-system-" + arch)
-            ]
+            ]))
 
-            message = []
+        jobs = QVD_DT_JOBS or cpu_count()
 
-            for qemu_exec in binaries:
-                try:
-                    yield co_update_device_tree(
-                        qemu_exec,
-                        self.src_path,
-                        arch,
-                        root
+        if jobs > 1 and len(arches_binaries) > 1:
+            yield self.co_init_device_tree_parallel(root, arches_binaries,
+                jobs
+            )
+        else:
+            for arch, binaries in arches_binaries:
+                message = []
+
+                yield co_reverse_device_tree(binaries, self.src_path, arch,
+                    root, message
+                )
+
+                if arch not in root.arches:
+                    # All binaries are absent/useless.
+                    message.insert(0,
+                        "Device Tree for %s isn't created:\n" % arch
                     )
-                except Exception as e:
-                    message.extend([
-                        "\n",
-                        "Failure for binary '%s':\n" % qemu_exec,
-                        "\n",
-                    ])
-                    if isinstance(e, (CancelledCallee, FailedCallee)):
-                        message.extend(e.callee.traceback_lines)
-                    else:
-                        message.extend(format_exception(*exc_info()))
-                else:
-                    root.arches.add(arch)
-                    # Stop on first successful update.
-                    break
-            else:
-                # All binaries are absent/useless.
-                message.insert(0, "Device Tree for %s isn't created:\n" % arch)
-                print("".join(message))
+                    print("".join(message))
 
         if not root.children:
             # Device Tree was not built
@@ -876,6 +1346,49 @@ class QemuVersionDescription(object):
         yield self.co_add_dt_macro(self.qvc.device_tree.children, t2m)
         print("Macros were added to device tree")
 
+    def co_init_device_tree_parallel(self, root, arches_binaries, jobs):
+        """ Device trees of architectures are built concurrently by `jobs`
+processes (see `reverse_device_tree`) and merged into `root` in given order.
+        """
+
+        pool = Pool(jobs, maxtasksperchild = 1)
+        try:
+            results = []
+            for i, (arch, binaries) in enumerate(arches_binaries):
+                # Each process looks for a free port in its own range.
+                results.append(pool.apply_async(reverse_device_tree,
+                    (binaries, self.src_path, arch,
+                        QVD_DT_PORT_START + i * QVD_DT_PORTS_PER_JOB
+                    )
+                ))
+            pool.close()
+
+            for (arch, _), res in zip(arches_binaries, results):
+                while not res.ready():
+                    yield True
+                    res.wait(0.05)
+
+                try:
+                    data, message = res.get()
+                except Exception:
+                    data = None
+                    message = format_exception(*exc_info())
+
+                if data is None:
+                    message.insert(0,
+                        "Device Tree for %s isn't created:\n" % arch
+                    )
+                    print("".join(message))
+                    continue
+
+                merge_device_tree(root, data, arch)
+                root.arches.add(arch)
+
+                yield True
+        finally:
+            pool.terminate()
+            pool.join()
+
     def co_text2macros(self, text2macros):
         """
             Creates text-to-macros `text2macros` dictionary.
@@ -888,15 +1401,15 @@ class QemuVersionDescription(object):
         i2y = QVD_DTM_IBY
         print("Building text to macros mapping...")
 
-        for t in self.qvc.stc.reg_type.values():
+        # Macros of the header index are not created.
+        for name, _, text in self.qvc.stc.iter_macros():
             if i2y == 0:
                 yield True
                 i2y = QVD_DTM_IBY
             else:
                 i2y -= 1
 
-            if isinstance(t, Macro):
-                text2macros[t.text].append(t.name)
+            text2macros[text].append(name)
 
         print("The mapping was built")
 
@@ -5,25 +5,33 @@ from argparse import (
     ArgumentParser
 )
 from os.path import (
+    abspath,
     isdir
 )
-from qemu import (
-    qvd_load_with_cache
-)
 from common import (
+    code_names,
+    compile_cached,
+    daemon_request,
+    daemon_socket_path,
+    ee,
     execfile
 )
 from traceback import (
     print_exc
 )
-import qdt
+import sys
+
+
+# Use QEMU Device Creator daemon (see qdc-daemon.py) if it's running.
+QDC_USE_DAEMON = ee("QDT_QDC_DAEMON", "True")
+QDC_DAEMON_NAME = "qdc-daemon"
 
 def arg_type_directory(string):
     if not isdir(string):
         raise ArgumentTypeError(string + " is not directory")
     return string
 
-def main():
+def build_parser():
     parser = ArgumentParser(
         description = "QEMU Project Generator\n"
         "The tool generates source files inside QEMU source tree according to"
@@ -59,17 +67,46 @@ def main():
         "generated source."
     )
 
+    parser.add_argument(
+        "--jobs", "-j",
+        default = None,
+        type = int,
+        metavar = "N",
+        help = "Generate devices by N processes (0 is for a process per CPU,"
+        " QDT_GEN_JOBS by default)."
+    )
+
     parser.add_argument(
         "script",
         help = "A Python script containing definition of a project to generate."
     )
 
-    arguments = parser.parse_args()
+    return parser
+
+def run(argv, on_qvd = None):
+    """ Generates the project according to command line arguments.
+
+:param on_qvd: called with build path and version of QVD used
+    """
+    arguments = build_parser().parse_args(argv)
+
+    # Those imports are long. They are not required when the daemon is used.
+    from qemu import (
+        qvd_get
+    )
+    import qdt
 
     script = arguments.script
 
     loaded = dict(qdt.__dict__)
     try:
+        # GUI classes are only required by scripts saved by the GUI. Other
+        # scripts are loaded without Tk.
+        names = code_names(compile_cached(script))
+        for name in qdt.__all__:
+            if name not in loaded and name in names:
+                loaded[name] = getattr(qdt, name)
+
         execfile(script, loaded)
     except:
         print("Cannot load configuration from '%s'" % script)
@@ -91,28 +128,49 @@ def main():
     if not qemu_build_path: # None, empty
         qemu_build_path = "."
 
+    if on_qvd is not None:
+        # Working directory of the caller may be different.
+        qemu_build_path = abspath(qemu_build_path)
+
     version = arguments.target_version
 
     if version is None:
         version = getattr(project, "target_version", None)
 
     try:
-        qvd = qvd_load_with_cache(qemu_build_path, version = version)
+        qvd = qvd_get(qemu_build_path, version = version)
+        # QVC may be ready in daemon
+        if not qvd.qvc_is_ready:
+            qvd.init_cache()
     except:
         print("QVD loading failed")
         print_exc()
         return -1
 
+    if on_qvd is not None:
+        on_qvd(qemu_build_path, qvd.commit_sha)
+
     qvd.use()
 
     if arguments.gen_header_tree is not None:
         qvd.qvc.stc.gen_header_inclusion_dot_file(arguments.gen_header_tree)
 
     project.gen_all(qvd.src_path,
-        with_chunk_graph = arguments.gen_chunk_graphs
+        with_chunk_graph = arguments.gen_chunk_graphs,
+        jobs = arguments.jobs
     )
 
     return 0
 
+def main():
+    argv = sys.argv[1:]
+
+    if QDC_USE_DAEMON:
+        code = daemon_request(daemon_socket_path(QDC_DAEMON_NAME), argv)
+        if code is not None:
+            return code
+
+    return run(argv)
+
 if __name__ == "__main__":
     exit(main())
@@ -0,0 +1,43 @@
+#!/usr/bin/python
+
+# Converts pythonized QEMU version caches (qvc_<sha>.py) to binary format.
+from argparse import (
+    ArgumentParser
+)
+from os.path import (
+    splitext
+)
+from traceback import (
+    print_exc
+)
+from qemu import (
+    convert_qvc
+)
+
+def main():
+    parser = ArgumentParser(
+        description = "Converts pythonized QVC files to binary format."
+    )
+
+    parser.add_argument("caches",
+        nargs = "+",
+        metavar = "qvc_<sha>.py",
+        help = "Legacy QVC file. Binary one is saved near it (*.qvc)."
+    )
+
+    arguments = parser.parse_args()
+
+    ret = 0
+    for legacy_path in arguments.caches:
+        path = splitext(legacy_path)[0] + ".qvc"
+        print("%s -> %s" % (legacy_path, path))
+        try:
+            convert_qvc(legacy_path, path)
+        except:
+            print_exc()
+            ret = -1
+
+    return ret
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,108 @@
+__all__ = [
+    "directives_only"
+]
+
+from re import (
+    compile
+)
+
+# Lexemes those affect block comment recognition. Literals can contain
+# comment delimiters.
+re_lexeme = compile(r'''"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*'|/\*|//''')
+re_space = compile(r"\s*")
+
+
+def _is_directive(line, pos):
+    "Does `line` starting from `pos` begin with `#` (after comments)?"
+
+    while True:
+        pos = re_space.match(line, pos).end()
+        if not line.startswith("/*", pos):
+            return line.startswith("#", pos)
+        end = line.find("*/", pos + 2)
+        if end < 0:
+            return False
+        pos = end + 2
+
+
+def _opens_comment(line, pos):
+    "Does a block comment remain open after the end of `line`?"
+
+    while True:
+        m = re_lexeme.search(line, pos)
+        if m is None:
+            return False
+
+        lexeme = m.group()
+        if lexeme == "//":
+            return False
+        if lexeme == "/*":
+            end = line.find("*/", m.end())
+            if end < 0:
+                return True
+            pos = end + 2
+        else:
+            pos = m.end()
+
+
+def directives_only(text):
+    """ Replaces lines of C `text` those are not preprocessor directives with
+empty lines. Preprocessing of the result defines same macros and includes same
+files because other lines only affect the output token stream.
+
+Lines are split and continued as `ply.cpp` does it. Block comments started on
+a directive line are kept too.
+
+:returns: the new text or `None` if it cannot be done reliably (trigraphs,
+    a directive right after a multi-line comment)
+    """
+
+    if "??" in text:
+        # trigraphs are replaced before line splitting
+        return None
+
+    physical = text.splitlines()
+    lines = list(l.rstrip() for l in physical)
+    total = len(lines)
+
+    res = []
+    # where currently open block comment was started: "directive", "other" or
+    # `None` if no block comment is open
+    comment = None
+
+    i = 0
+    while i < total:
+        # joining of continued lines
+        line = lines[i]
+        j = i + 1
+        while line.endswith("\\") and j < total:
+            line = line[:-1] + lines[j]
+            j += 1
+
+        if comment == "directive":
+            keep = True
+            end = line.find("*/")
+            if end >= 0 and not _opens_comment(line, end + 2):
+                comment = None
+        elif comment == "other":
+            keep = False
+            end = line.find("*/")
+            if end >= 0:
+                # Preprocessor starts next line after a multi-line comment.
+                if _is_directive(line, end + 2):
+                    return None
+                if not _opens_comment(line, end + 2):
+                    comment = None
+        else:
+            keep = _is_directive(line, 0)
+            if _opens_comment(line, 0):
+                comment = "directive" if keep else "other"
+
+        if keep:
+            res.extend(physical[i:j])
+        else:
+            res.extend([""] * (j - i))
+
+        i = j
+
+    return "\n".join(res)
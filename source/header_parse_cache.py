@@ -0,0 +1,180 @@
+__all__ = [
+    "HeaderParseCache"
+  , "git_blob_sha"
+]
+
+from hashlib import (
+    sha1
+)
+from os import (
+    getpid,
+    remove
+)
+from os.path import (
+    isfile
+)
+from six.moves.cPickle import (
+    HIGHEST_PROTOCOL,
+    dump,
+    load
+)
+
+try:
+    from os import (
+        replace
+    )
+except ImportError: # Py2
+    from os import (
+        rename
+    )
+
+    def replace(src, dst):
+        if isfile(dst):
+            remove(dst)
+        rename(src, dst)
+
+
+HEADER_PARSE_CACHE_VERSION = 1
+
+# Number of results kept per header. Results differ when headers included by
+# the header differ.
+HEADER_PARSE_CACHE_VARIANTS = 4
+
+# Results not used by that number of last sessions are dropped.
+HEADER_PARSE_CACHE_AGE = 16
+
+
+def git_blob_sha(data):
+    "SHA1 of `bytes` as Git computes it for a blob."
+    h = sha1(b"blob %d\0" % len(data))
+    h.update(data)
+    return h.hexdigest()
+
+
+class HeaderParseCache(object):
+    """ Persistent results of header parsing (preprocessor events, see
+`parse_header`).
+
+A result depends on the header itself, preprocessor configuration (start
+directory and search paths) and all files read by the preprocessor
+including files those have not been found. So, a result is stored with
+blob SHA1s of those files (`None` for absent ones) and is only used if all
+of them are same.
+
+Same file names, SHA1s and events are shared by results. It reduces the
+file size because the pickle stores shared objects once.
+    """
+
+    def __init__(self, path = None):
+        self.path = path
+        # key -> list of [generation, dependencies, events], most recently
+        # used first
+        self.entries = {}
+        # incremented on each load
+        self.generation = 0
+        self.interned = {}
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(klass, path):
+        "Loads cache from file if possible. Else, returns an empty one."
+
+        self = klass(path)
+
+        if not isfile(path):
+            return self
+
+        try:
+            with open(path, "rb") as f:
+                version, generation, entries = load(f)
+        except Exception as e:
+            print("Bad header parse cache %s: %s" % (path, e))
+            return self
+
+        if version != HEADER_PARSE_CACHE_VERSION:
+            return self
+
+        self.generation = generation + 1
+        self.entries = entries
+
+        intern = self.intern
+        for variants in entries.values():
+            for variant in variants:
+                variant[1] = intern(tuple(intern(d) for d in variant[1]))
+                variant[2] = intern(tuple(intern(e) for e in variant[2]))
+
+        return self
+
+    def save(self):
+        oldest = self.generation - HEADER_PARSE_CACHE_AGE
+        entries = {}
+        for key, variants in self.entries.items():
+            variants = list(v for v in variants if v[0] > oldest)
+            if variants:
+                entries[key] = variants
+
+        tmp_path = "%s.%d.tmp" % (self.path, getpid())
+        with open(tmp_path, "wb") as f:
+            dump((HEADER_PARSE_CACHE_VERSION, self.generation, entries), f,
+                HIGHEST_PROTOCOL
+            )
+        replace(tmp_path, self.path)
+
+    def intern(self, obj):
+        return self.interned.setdefault(obj, obj)
+
+    @staticmethod
+    def key(prefix, sha, start_dir, search_paths):
+        "Key of results of header `prefix` with blob `sha`."
+
+        h = sha1()
+        for part in (prefix, sha or "", start_dir) + tuple(search_paths):
+            h.update(part.encode("utf-8") + b"\0")
+        return h.hexdigest()
+
+    def lookup(self, key, blob_sha):
+        """ Returns events of the header if its dependencies are same.
+
+:param blob_sha: returns current SHA1 of file by its name
+        """
+
+        variants = self.entries.get(key, [])
+
+        for idx, variant in enumerate(variants):
+            for name, sha in variant[1]:
+                if blob_sha(name) != sha:
+                    break
+            else:
+                variant[0] = self.generation
+                if idx:
+                    del variants[idx]
+                    variants.insert(0, variant)
+                self.hits += 1
+                return list(
+                    # `Macro` arguments are stored as `tuple`.
+                    e[:3] + (None if e[3] is None else list(e[3]),) + e[4:]
+                        if e[0] == "d" else e
+                    for e in variant[2]
+                )
+
+        self.misses += 1
+        return None
+
+    def account(self, key, dependencies, events):
+        """
+:param dependencies: [(file name, SHA1 or `None`)]
+        """
+
+        intern = self.intern
+        dependencies = intern(tuple(intern(d) for d in sorted(dependencies)))
+        events = intern(tuple(
+            intern(
+                e[:3] + (None if e[3] is None else tuple(e[3]),) + e[4:]
+                    if e[0] == "d" else e
+            ) for e in events
+        ))
+
+        variants = self.entries.setdefault(key, [])
+        variants.insert(0, [self.generation, dependencies, events])
+        del variants[HEADER_PARSE_CACHE_VARIANTS:]
@@ -0,0 +1,136 @@
+__all__ = [
+    "InclusionClosure"
+]
+
+from common import (
+    iter_sccs
+)
+from weakref import (
+    WeakSet
+)
+
+
+class InclusionClosure(object):
+    """ Transitive closure of header inclusion graph. Inclusion cycles are
+collapsed to components. A component has a bit set (`int`) of components
+reachable from it (including itself).
+
+Headers are indexed on first query together with headers they include
+(transitively). So, the closure is computed once for many queries (e.g.,
+all files of a project being generated). Inclusions added to indexed
+headers are accounted incrementally (see `Source.add_inclusion`).
+    """
+
+    # Instances to be notified about new inclusions.
+    instances = WeakSet()
+
+    def __init__(self):
+        self.reset()
+        InclusionClosure.instances.add(self)
+
+    def reset(self):
+        # header -> component
+        self.components = {}
+        # component -> bit set of reachable components
+        self.closures = []
+        # (includer, inclusion) added after includer was indexed
+        self.pending = []
+
+    @staticmethod
+    def on_inclusion(includer, inclusion):
+        for closure in InclusionClosure.instances:
+            if includer in closure.components:
+                closure.pending.append((includer, inclusion))
+
+    def reaches(self, header, inclusion):
+        "Whether `header` includes `inclusion` transitively (or is it)."
+
+        self._update()
+
+        components = self.components
+        if header not in components:
+            self._index(header)
+        if inclusion not in components:
+            self._index(inclusion)
+
+        return bool(
+            self.closures[components[header]] >> components[inclusion] & 1
+        )
+
+    def reaches_avoiding(self, header, inclusion, avoid):
+        """ Whether `header` includes `inclusion` transitively not through
+headers from `avoid` set. Only headers including `inclusion` are visited.
+        """
+
+        if not self.reaches(header, inclusion):
+            return False
+
+        visited = set([header])
+        stack = [header]
+        while stack:
+            for i in stack.pop().inclusions.values():
+                if i is inclusion:
+                    return True
+                if i in avoid or i in visited:
+                    continue
+                visited.add(i)
+                if self.reaches(i, inclusion):
+                    stack.append(i)
+
+        return False
+
+    def _index(self, header):
+        components = self.components
+        closures = self.closures
+
+        def inclusions(h):
+            for i in h.inclusions.values():
+                if i not in components:
+                    yield i
+
+        # Components reachable from a component are indexed before it.
+        for component in iter_sccs([header], inclusions):
+            c = len(closures)
+            bits = 1 << c
+
+            for h in component:
+                components[h] = c
+
+            for h in component:
+                for i in h.inclusions.values():
+                    ic = components[i]
+                    if ic != c:
+                        bits |= closures[ic]
+
+            closures.append(bits)
+
+    def _update(self):
+        pending = self.pending
+        if not pending:
+            return
+        self.pending = []
+
+        components = self.components
+        closures = self.closures
+
+        for includer, inclusion in pending:
+            if inclusion not in components:
+                self._index(inclusion)
+
+            uc = components[includer]
+            ic = components[inclusion]
+
+            if closures[uc] >> ic & 1:
+                # already reachable
+                continue
+
+            if closures[ic] >> uc & 1:
+                # A new cycle. Components must be merged. It's rare.
+                self.reset()
+                return
+
+            mask = 1 << uc
+            bits = closures[ic]
+            for c, cbits in enumerate(closures):
+                if cbits & mask:
+                    closures[c] = cbits | bits
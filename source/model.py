@@ -35,6 +35,7 @@ __all__ = [
       , "OpaqueChunk"
   , "SourceFile"
   , "SourceTreeContainer"
+  , "mount_tree"
   , "TypeReferencesVisitor"
   , "NodeVisitor"
   , "ANC"
@@ -46,16 +47,24 @@ __all__ = [
 from os import (
     listdir
 )
+from errno import (
+    ENOENT
+)
 from os.path import (
     basename,
     splitext,
     join,
     isdir,
-    dirname
+    dirname,
+    normpath,
+    sep
 )
 from copy import (
     copy
 )
+from contextlib import (
+    contextmanager
+)
 import sys
 
 from re import (
@@ -67,6 +76,9 @@ from itertools import (
 )
 from common import (
     ee,
+    fork_pool,
+    has_fork,
+    iter_sccs,
     path2tuple,
     pypath,
     OrderedSet,
@@ -91,7 +103,9 @@ from six import (
     add_metaclass,
     string_types,
     text_type,
-    binary_type
+    binary_type,
+    PY3,
+    StringIO
 )
 from collections import (
     defaultdict,
@@ -100,9 +114,21 @@ from collections import (
 from .tools import (
     get_cpp_search_paths
 )
+from .cpp_directives import (
+    directives_only
+)
+from .header_parse_cache import (
+    git_blob_sha
+)
+from .inclusion_closure import (
+    InclusionClosure
+)
 from collections import (
     deque
 )
+from multiprocessing import (
+    cpu_count
+)
 
 
 # List of coding style specific code generation settings.
@@ -117,6 +143,15 @@ OPTIMIZE_INCLUSIONS = ee("QDT_OPTIMIZE_INCLUSIONS", "True")
 # "qemu/osdep.h".
 SKIP_GLOBAL_HEADERS = ee("QDT_SKIP_GLOBAL_HEADERS", "True")
 
+# Number of processes parsing headers. 1 is for parsing in the current process
+# only. 0 is for a process per CPU. Processes are forked, headers are parsed in
+# the current process if `fork` is not supported.
+PARSE_JOBS = ee("QDT_PARSE_JOBS", "1")
+
+# Only preprocessor directives of headers are passed to the preprocessor
+# because the header DB does not depend on other lines, see `directives_only`.
+PARSE_DIRECTIVES_ONLY = ee("QDT_PARSE_DIRECTIVES_ONLY", "True")
+
 
 # Used for sys.stdout recovery
 sys_stdout_recovery = sys.stdout
@@ -134,6 +169,158 @@ re_nbs = compile(common_re % NBS)
 re_nss = compile(common_re % NSS)
 re_clr = compile("@(.|$)")
 
+# Replacements of markup sequences by `clear_markup`. Other escaped characters
+# are kept as is.
+markup_clearing = {
+    ANC[1] : "",
+    CAN[1] : "",
+    NBS[1] : " ",
+    NSS[1] : " ",
+}
+
+
+def _clear_markup_sequence(match):
+    c = match.group(1)
+    return markup_clearing.get(c, c)
+
+
+def clear_markup(line):
+    "Removes markup from the line in a single pass."
+    if "@" in line:
+        return re_clr.sub(_clear_markup_sequence, line)
+    return line
+
+
+# Chunks with same code are common (e.g. headers are generated for each
+# including file). So, results of `fix_cols` are cached. The cache is dropped
+# when it grows too big.
+FIX_COLS_CACHE_SIZE = 1 << 16
+fix_cols_cache = {}
+
+
+def fix_cols(code, max_cols = 80, indent = "    "):
+    """ Applies markup to `code` breaking lines longer than `max_cols`
+characters. See `SourceChunk.check_cols_fix_up`.
+    """
+
+    key = (code, max_cols, indent)
+    try:
+        return fix_cols_cache[key]
+    except KeyError:
+        pass
+
+    lines = code.split('\n')
+    # Resulting lines. Parts of the current broken line are accumulated in
+    # `cur`. Concatenation of strings is quadratic for long code.
+    res = []
+    last_line = len(lines) - 1
+
+    for idx1, line in enumerate(lines):
+        if idx1 == last_line and len(line) == 0:
+            break
+
+        clear_line = clear_markup(line)
+
+        if len(clear_line) <= max_cols:
+            res.append(clear_line.rstrip(' '))
+            continue
+
+        line_no_indent_len = len(line) - len(line.lstrip(' '))
+        line_indent = line[:line_no_indent_len]
+        indents = []
+        indents.append(len(indent))
+        tmp_indent = indent
+
+        """
+        1. cut off indent of the line
+        2. surround non-slash spaces with ' ' moving them to separated
+           words
+        3. split the line onto words
+        4. replace any non-breaking space with a regular space in each word
+        """
+        words = list(filter(None, map(
+            lambda a: re_nbs.sub("\\1 ", a),
+            re_nss.sub("\\1 " + NSS + ' ', line.lstrip(' ')).split(' ')
+        )))
+
+        cur = []
+        ll = 0 # line length
+        last_word = len(words) - 1
+        for idx2, word in enumerate(words):
+            if word == NSS:
+                slash = False
+                continue
+
+            """ split the word onto anchor control sequences and n-grams
+            around them """
+            subwords = list(filter(None, chain(*map(
+                lambda a: re_can.split(a),
+                re_anc.split(word)
+            ))))
+            word = ""
+            subword_indents = []
+            for subword in subwords:
+                if subword == ANC:
+                    subword_indents.append(len(word))
+                elif subword == CAN:
+                    if subword_indents:
+                        subword_indents.pop()
+                    else:
+                        try:
+                            indents.pop()
+                        except IndexError:
+                            raise RuntimeError("Trying to pop indent"
+                                " anchor from empty stack"
+                            )
+                else:
+                    word += re_clr.sub("\\1", subword)
+
+            if ll > 0:
+                # The variable r reserves characters for " \\"
+                # that can be added after current word
+                if idx2 == last_word or words[idx2 + 1] == NSS:
+                    r = 0
+                else:
+                    r = 2
+                """ If the line will be broken _after_ this word,
+its length may be still longer than max_cols because of safe breaking (' \').
+If so, brake the line _before_ this word. Safe breaking is presented by
+'r' variable in the expression which is 0 if safe breaking is not required
+after this word.
+                """
+                if ll + 1 + len(word) + r > max_cols:
+                    if slash:
+                        cur.append(" \\")
+                    res.append("".join(cur).rstrip(' '))
+                    cur = [line_indent, tmp_indent, word]
+                    ll = len(line_indent) + len(tmp_indent) + len(word)
+                else:
+                    cur.append(' ')
+                    cur.append(word)
+                    ll += 1 + len(word)
+            else:
+                cur.append(line_indent)
+                cur.append(word)
+                ll += len(line_indent) + len(word)
+
+            word_indent = ll - len(line_indent) - len(word)
+            for ind in subword_indents:
+                indents.append(word_indent + ind)
+            tmp_indent = " " * indents[-1] if indents else ""
+            slash = True
+
+        res.append("".join(cur).rstrip(' '))
+
+    # trailing new line
+    res.append("")
+    code = '\n'.join(res)
+
+    if len(fix_cols_cache) >= FIX_COLS_CACHE_SIZE:
+        fix_cols_cache.clear()
+    fix_cols_cache[key] = code
+
+    return code
+
 
 APPEND_NL_AFTER_HEADERS = not ee("QDT_NO_NL_AFTER_HEADERS")
 
@@ -371,15 +558,21 @@ class Source(object):
         if header.path not in self.inclusions:
             self.inclusions[header.path] = header
 
-            for t in header.types.values():
-                try:
-                    if isinstance(t, TypeReference):
-                        self._add_type_recursive(TypeReference(t.type))
-                    else:
-                        self._add_type_recursive(TypeReference(t))
-                except AddTypeRefToDefinerException:
-                    # inclusion cycles will cause this exceptions
-                    pass
+            InclusionClosure.on_inclusion(self, header)
+
+            deferred = Header.deferred
+            if deferred is None:
+                for t in header.types.values():
+                    try:
+                        if isinstance(t, TypeReference):
+                            self._add_type_recursive(TypeReference(t.type))
+                        else:
+                            self._add_type_recursive(TypeReference(t))
+                    except AddTypeRefToDefinerException:
+                        # inclusion cycles will cause this exceptions
+                        pass
+            else:
+                deferred.add(self)
 
             if self in header.includers:
                 raise RuntimeError("Header %s is among includers of %s but"
@@ -412,6 +605,49 @@ class Source(object):
         self.types[type_ref.name] = type_ref
         return True
 
+    def _add_inclusions_types(self):
+        "Adds references to types of inclusions. Returns whether any added."
+
+        types = self.types
+        references = self.references
+        added = False
+
+        for i in self.inclusions.values():
+            for t in i.types.values():
+                name = t.name
+                if isinstance(t, TypeReference):
+                    t = t.type
+                if t.definer is self:
+                    # inclusion cycle
+                    continue
+
+                # adding a type may satisfy a dependency
+                if t in references:
+                    references.remove(t)
+
+                try:
+                    cur = types[name]
+                except KeyError:
+                    pass
+                else:
+                    # To check incomplete type case
+                    if (isinstance(cur, TypeReference)
+                        and cur.type.definer is not t.definer
+                    ):
+                        raise RuntimeError("Conflict reference to type %s"
+                            " found in source %s. The type is defined both in"
+                            " %s and %s" % (cur, self.path, t.definer.path,
+                                cur.type.definer.path
+                            )
+                        )
+                    # Either already referenced or defined by self
+                    continue
+
+                types[name] = TypeReference(t)
+                added = True
+
+        return added
+
     def add_types(self, types):
         for t in types:
             self.add_type(t)
@@ -639,6 +875,11 @@ References:
 class Header(Source):
     reg = {}
 
+    # Sources whose type references are not propagated yet and number of
+    # active contexts, see `bulk_registration`.
+    deferred = None
+    bulk_depth = 0
+
     def __init__(self, path, is_global = False, protection = True):
         """
 :param path: it is used in #include statements, as unique identifier and
@@ -675,31 +916,64 @@ class Header(Source):
         if "__FILE__" == macro.name:
             return
 
+        Header._define(definer, *macro_fields(macro))
+
+    @staticmethod
+    def _define(definer, name, args, text):
         h = Header[definer]
 
         try:
-            m = Type[macro.name]
+            m = Type[name]
             if not m.definer.path == definer:
                 print("Info: multiple definitions of macro %s in %s and %s" % (
-                    macro.name, m.definer.path, definer
+                    name, m.definer.path, definer
                 ))
         except:
-            m = Macro(
-                name = macro.name,
-                args = (
-                    None if macro.arglist is None else list(macro.arglist)
-                ),
-                text = "".join(tok.value for tok in macro.value)
-            )
+            m = Macro(name = name, args = args, text = text)
             h.add_type(m)
 
+    @staticmethod
+    def _iter_header_files(start_dir, prefix, recursive):
+        "Yields headers in same order as `_build_inclusions` visits them."
+
+        full_name = join(start_dir, prefix)
+        if fs_isdir(full_name):
+            if not recursive:
+                return
+            for entry in fs_listdir(full_name):
+                for h in Header._iter_header_files(
+                    start_dir,
+                    join(prefix, entry),
+                    True
+                ):
+                    yield h
+        elif splitext(prefix)[1] == ".h":
+            yield prefix
+
+    @staticmethod
+    def _get_header_to_parse(prefix):
+        "Returns the header if it's not parsed yet."
+
+        if path2tuple(prefix) not in Header.reg:
+            h = Header(path = prefix, is_global = False)
+            h.parsed = False
+        else:
+            h = Header[prefix]
+
+        if h.parsed:
+            return None
+
+        h.parsed = True
+        print("Info: parsing " + prefix)
+        return h
+
     @staticmethod
     def _build_inclusions(start_dir, prefix, recursive):
         full_name = join(start_dir, prefix)
-        if isdir(full_name):
+        if fs_isdir(full_name):
             if not recursive:
                 return
-            for entry in listdir(full_name):
+            for entry in fs_listdir(full_name):
                 yield Header._build_inclusions(
                     start_dir,
                     join(prefix, entry),
@@ -708,36 +982,33 @@ class Header(Source):
         else:
             (name, ext) = splitext(prefix)
             if ext == ".h":
-                if path2tuple(prefix) not in Header.reg:
-                    h = Header(path = prefix, is_global = False)
-                    h.parsed = False
-                else:
-                    h = Header[prefix]
-
-                if not h.parsed:
-                    h.parsed = True
-                    print("Info: parsing " + prefix)
+                if Header._get_header_to_parse(prefix) is not None:
+                    session = HeaderParsingSession.current
 
-                    p = Preprocessor(lex())
-                    p.add_path(start_dir)
+                    events = session.lookup(start_dir, prefix,
+                        cpp_search_paths
+                    )
+                    if events is not None:
+                        apply_header_events(events)
+                        Header.yields_per_header.append(0)
+                        return
 
-                    global cpp_search_paths
-                    for path in cpp_search_paths:
-                        p.add_path(path)
+                    key = session.key
+                    session.begin()
 
-                    p.on_include = Header._on_include
-                    p.on_define.append(Header._on_define)
+                    p = new_preprocessor(start_dir, cpp_search_paths)
 
-                    if sys.version_info[0] == 3:
-                        header_input = (
-                            open(full_name, "r", encoding = "UTF-8").read()
-                        )
+                    if key is None:
+                        p.on_include = Header._on_include
+                        p.on_define.append(Header._on_define)
                     else:
-                        header_input = (
-                            open(full_name, "rb").read().decode("UTF-8")
-                        )
+                        events = HeaderEvents()
+                        p.on_include = events.on_include
+                        p.on_define.append(events.on_define)
 
-                    p.parse(input = header_input, source = prefix)
+                    p.parse(input = read_header_to_parse(full_name),
+                        source = prefix
+                    )
 
                     yields_per_current_header = 0
 
@@ -752,10 +1023,118 @@ class Header(Source):
                         else:
                             tokens_before_yield -= 1
 
+                    if events is not None:
+                        session.account(key, events, session.dependencies())
+                        apply_header_events(events)
+
                     Header.yields_per_header.append(yields_per_current_header)
 
     @staticmethod
-    def co_build_inclusions(dname, recursive):
+    def _co_build_inclusions_parallel(start_dir, entries, recursive, jobs):
+        """ Headers are parsed by `jobs` processes (see `parse_header`). Their
+results are handled in same order as `_build_inclusions` parses the headers.
+So, the outcome is same.
+
+A header is not sent to a process if it's already parsed as an inclusion
+by the moment. Else, it's parsed speculatively because its includer can be
+being parsed by another process. Then, the result is ignored.
+        """
+
+        prefixes = deque()
+        for entry in entries:
+            prefixes.extend(Header._iter_header_files(start_dir, entry,
+                recursive
+            ))
+
+        # Limits speculative parsing.
+        max_pending = jobs * 4
+
+        session = HeaderParsingSession.current
+
+        # Processes use the state of the parsing session (cached files,
+        # Git tree, patched `open` of the preprocessor).
+        pool = fork_pool(jobs)
+        try:
+            # (prefix, cache key, cached events or result) in parsing order
+            pending = deque()
+
+            while prefixes or pending:
+                while prefixes and len(pending) < max_pending:
+                    prefix = prefixes.popleft()
+
+                    tpath = path2tuple(prefix)
+                    if tpath in Header.reg and Header.reg[tpath].parsed:
+                        continue
+
+                    events = session.lookup(start_dir, prefix,
+                        cpp_search_paths
+                    )
+                    if events is None:
+                        res = pool.apply_async(parse_header,
+                            (start_dir, prefix, cpp_search_paths)
+                        )
+                    else:
+                        res = events
+
+                    pending.append((prefix, session.key, res))
+
+                prefix, key, res = pending.popleft()
+
+                yields_per_current_header = 0
+
+                if isinstance(res, list):
+                    events = res
+                else:
+                    while not res.ready():
+                        yields_per_current_header += 1
+                        # Waiting must not block other coroutines.
+                        yield False
+
+                    events, dependencies = res.get()
+
+                    if dependencies is not None:
+                        session.account(key, events, dependencies)
+
+                if Header._get_header_to_parse(prefix) is None:
+                    continue
+
+                apply_header_events(events)
+
+                Header.yields_per_header.append(yields_per_current_header)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    @staticmethod
+    def co_build_inclusions(dname, recursive,
+        entries = None,
+        jobs = None,
+        tree = None,
+        cache = None
+    ):
+        """ Parses headers in `dname` directory.
+
+:param entries: paths (relative to `dname`) of files and folders to parse
+    instead of whole `dname` content
+:param jobs: number of processes to parse headers, see `PARSE_JOBS`
+:param tree: files are read from that tree (e.g., `GitTree`) instead of file
+    system, see `mount_tree`
+:param cache: `HeaderParseCache`, results of headers parsed earlier are
+    reused
+        """
+
+        if tree is not None:
+            prev_tree = mount_tree(tree)
+            try:
+                yield Header.co_build_inclusions(dname, recursive,
+                    entries = entries,
+                    jobs = jobs,
+                    cache = cache
+                )
+            finally:
+                mount_tree(prev_tree)
+            return
+
         # Default include search folders should be specified to
         # locate and parse standard headers.
         # parse `cpp -v` output to get actual list of default
@@ -771,14 +1150,34 @@ class Header(Source):
         for h in Header.reg.values():
             h.parsed = False
 
-        for entry in listdir(dname):
-            yield Header._build_inclusions(dname, entry, recursive)
+        if entries is None:
+            entries = fs_listdir(dname)
+
+        if jobs is None:
+            jobs = PARSE_JOBS
+        if jobs == 0:
+            jobs = cpu_count()
+
+        # Type references are propagated once after parsing.
+        with Header.bulk_registration(), HeaderParsingSession(cache = cache):
+            if jobs > 1 and has_fork:
+                yield Header._co_build_inclusions_parallel(dname, entries,
+                    recursive, jobs
+                )
+            else:
+                for entry in entries:
+                    yield Header._build_inclusions(dname, entry, recursive)
 
         for h in Header.reg.values():
             del h.parsed
 
         sys.stdout = sys_stdout_recovery
 
+        if not Header.yields_per_header:
+            print("No headers were parsed in " + dname)
+            del Header.yields_per_header
+            return
+
         yields_total = sum(Header.yields_per_header)
 
         print("""Header inclusions build statistic:
@@ -831,12 +1230,70 @@ class Header(Source):
     def add_type(self, _type):
         super(Header, self).add_type(_type)
 
-        # Auto add type references to self includers
-        for s in self.includers:
-            s._add_type_recursive(TypeReference(_type))
+        deferred = Header.deferred
+        if deferred is None:
+            # Auto add type references to self includers
+            for s in self.includers:
+                s._add_type_recursive(TypeReference(_type))
+        else:
+            deferred.add(self)
 
         return self
 
+    @staticmethod
+    @contextmanager
+    def bulk_registration():
+        """ Within the context, `add_type` and `add_inclusion` only record
+new types and inclusions. Type references are propagated to includers once
+at the end of the context. It's much faster for many headers (e.g., during
+parsing) because a type is not propagated over the inclusion graph each time
+a header is added.
+
+Contexts can be nested or interleaved (by coroutines). Each context
+propagates all recorded changes at its end because caller may rely on them.
+        """
+
+        if Header.deferred is None:
+            Header.deferred = set()
+        Header.bulk_depth += 1
+        try:
+            yield
+        finally:
+            deferred = Header.deferred
+            Header.bulk_depth -= 1
+            Header.deferred = set() if Header.bulk_depth else None
+            Header._propagate_deferred(deferred)
+
+    @staticmethod
+    def _propagate_deferred(sources):
+        """ Adds type references to `sources` and their includers
+(transitively) as immediate `add_type` and `add_inclusion` would do.
+        """
+
+        affected = set()
+        stack = list(sources)
+        while stack:
+            s = stack.pop()
+            if s in affected:
+                continue
+            affected.add(s)
+            if isinstance(s, Header):
+                stack.extend(s.includers)
+
+        def inclusions(s):
+            return (i for i in s.inclusions.values() if i in affected)
+
+        # Inclusions are handled before includers. A component is an inclusion
+        # cycle. Its sources are handled until nothing is added.
+        for component in iter_sccs(affected, inclusions):
+            while True:
+                added = False
+                for s in component:
+                    if s._add_inclusions_types():
+                        added = True
+                if not added or len(component) == 1:
+                    break
+
     def __hash__(self):
         # key contains of 'g' or 'l' and header path
         # 'g' and 'l' are used to distinguish global and local
@@ -863,7 +1320,9 @@ transitively includes definer of ref)"""
 
     @staticmethod
     def propagate_references():
-        for h in Header.reg.values():
+        # Only created headers can have references. Also, iteration over a
+        # `LazyRegistry` would create all headers.
+        for h in dict.values(Header.reg):
             if not isinstance(h, Header):
                 continue
 
@@ -877,6 +1336,321 @@ transitively includes definer of ref)"""
                         continue
                     Header._propagate_reference(u, ref)
 
+def macro_fields(macro):
+    "Converts ply.cpp.Macro to `Macro.__init__` arguments."
+    return (
+        macro.name,
+        None if macro.arglist is None else list(macro.arglist),
+        "".join(tok.value for tok in macro.value)
+    )
+
+
+# Lexer construction is relatively long. So, the lexer is built once and
+# cloned for each preprocessor.
+cpp_lexer = None
+
+
+def new_preprocessor(start_dir, search_paths):
+    global cpp_lexer
+
+    if cpp_lexer is None:
+        cpp_lexer = lex()
+
+    p = Preprocessor(cpp_lexer.clone())
+    p.add_path(start_dir)
+
+    for path in search_paths:
+        p.add_path(path)
+
+    return p
+
+
+# The tree of files those are used instead of real files during header
+# parsing, see `mount_tree`.
+mounted_tree = None
+
+ply_cpp = sys.modules[Preprocessor.__module__]
+
+
+def mount_tree(tree):
+    """ Makes header parsing use files of `tree` instead of files under
+`tree.root` folder. The `tree` provides `isdir`, `listdir` and `read` methods
+accepting paths relative to `tree.root` separated with "/", see `GitTree`.
+Files out of `tree.root` are still read from file system.
+
+Preprocessor's `open` is replaced to handle inclusions.
+
+:param tree: `None` un-mounts current tree
+:returns: previously mounted tree
+    """
+
+    global mounted_tree
+
+    prev = mounted_tree
+    mounted_tree = tree
+
+    if tree is None:
+        if "open" in ply_cpp.__dict__:
+            del ply_cpp.open
+    else:
+        ply_cpp.open = tree_open
+
+    return prev
+
+
+def tree_path(full_name):
+    "Returns path in mounted tree or `None` if `full_name` is out of it."
+
+    if mounted_tree is None:
+        return None
+
+    full_name = normpath(full_name)
+    root = normpath(mounted_tree.root)
+
+    if full_name == root:
+        return ""
+    if full_name.startswith(root + sep):
+        return full_name[len(root) + 1:].replace(sep, "/")
+    return None
+
+
+def fs_isdir(full_name):
+    path = tree_path(full_name)
+    if path is None:
+        return isdir(full_name)
+    return mounted_tree.isdir(path)
+
+
+def fs_listdir(full_name):
+    path = tree_path(full_name)
+    if path is None:
+        return listdir(full_name)
+    return mounted_tree.listdir(path)
+
+
+def tree_open(full_name, mode = "r", *args, **kw):
+    "`open` replacement for the preprocessor."
+
+    path = tree_path(full_name)
+    if path is None:
+        return open(full_name, mode, *args, **kw)
+
+    data = mounted_tree.read(path)
+    if PY3:
+        data = data.decode("UTF-8")
+    return StringIO(data)
+
+
+def read_header(full_name):
+    path = tree_path(full_name)
+    if path is not None:
+        return mounted_tree.read(path).decode("UTF-8")
+
+    if sys.version_info[0] == 3:
+        return open(full_name, "r", encoding = "UTF-8").read()
+    else:
+        return open(full_name, "rb").read().decode("UTF-8")
+
+
+class HeaderParsingSession(object):
+    """ Caches files read during header parsing. Headers of a QEMU tree
+include same files (system headers especially) many times. Absence of files
+is cached too because the preprocessor tries each search path.
+
+Text passed to the preprocessor is reduced by `directives_only` (if enabled).
+
+If `cache` (`HeaderParseCache`) is given, files read while a header is being
+parsed are recorded. They are dependencies of the parsing result.
+
+Usage: with HeaderParsingSession(): ...
+    """
+
+    current = None
+
+    def __init__(self, directives = None, cache = None):
+        if directives is None:
+            directives = PARSE_DIRECTIVES_ONLY
+        self.directives = directives
+        self.cache = cache
+        # full name -> text or `None` if it cannot be read
+        self.files = {}
+        # full name -> blob SHA1 or `None` if there is no such file
+        self.shas = {}
+        # names of files read by the preprocessor during recording
+        self.record = None
+        # cache key of header passed to last `lookup`
+        self.key = None
+
+    def blob_sha(self, full_name):
+        try:
+            return self.shas[full_name]
+        except KeyError:
+            pass
+
+        path = tree_path(full_name)
+        if path is None:
+            try:
+                with open(full_name, "rb") as f:
+                    sha = git_blob_sha(f.read())
+            except (IOError, OSError):
+                sha = None
+        else:
+            sha = mounted_tree.blobs.get(path)
+
+        self.shas[full_name] = sha
+        return sha
+
+    def lookup(self, start_dir, prefix, search_paths):
+        """ Returns events (see `HeaderEvents`) of the header from `cache` or
+`None`. Cache key of the header is assigned to `key` (`None` if there is no
+cache).
+        """
+
+        cache = self.cache
+        if cache is None:
+            self.key = None
+            return None
+
+        self.key = cache.key(prefix,
+            self.blob_sha(join(start_dir, prefix)), start_dir, search_paths
+        )
+        return cache.lookup(self.key, self.blob_sha)
+
+    def begin(self):
+        "Starts recording of files read (if there is a cache)."
+
+        if self.cache is not None:
+            self.record = set()
+
+    def dependencies(self):
+        "Stops recording and returns [(file name, SHA1)] or `None`."
+
+        record = self.record
+        if record is None:
+            return None
+        self.record = None
+        return list((name, self.blob_sha(name)) for name in record)
+
+    def account(self, key, events, dependencies):
+        self.cache.account(key, dependencies, events)
+
+    def read(self, full_name, reader = read_header):
+        if self.record is not None:
+            self.record.add(full_name)
+
+        try:
+            text = self.files[full_name]
+        except KeyError:
+            try:
+                text = reader(full_name)
+            except (IOError, OSError):
+                text = None
+            else:
+                if self.directives:
+                    directives = directives_only(text)
+                    if directives is not None:
+                        text = directives
+            self.files[full_name] = text
+
+        if text is None:
+            raise IOError(ENOENT, "Cannot read file", full_name)
+        return text
+
+    def open(self, full_name, mode = "r", *args, **kw):
+        "`open` replacement for the preprocessor."
+
+        return StringIO(self.read(full_name,
+            reader = lambda n: self.prev_open(n, mode, *args, **kw).read()
+        ))
+
+    def __enter__(self):
+        self.prev_session = HeaderParsingSession.current
+        HeaderParsingSession.current = self
+
+        # Note that `mount_tree` also replaces `open`.
+        self.prev_open = ply_cpp.__dict__.get("open", open)
+        ply_cpp.open = self.open
+        return self
+
+    def __exit__(self, *_):
+        if self.prev_open is open:
+            del ply_cpp.open
+        else:
+            ply_cpp.open = self.prev_open
+
+        HeaderParsingSession.current = self.prev_session
+
+
+def read_header_to_parse(full_name):
+    session = HeaderParsingSession.current
+    if session is None:
+        return read_header(full_name)
+    return session.read(full_name)
+
+
+class HeaderEvents(list):
+    """ Preprocessor events (`tuple`s), in order:
+    ("i", includer, inclusion, is_global) for `Header._on_include` and
+    ("d", definer, name, args, text) for `Header._define`. Repeated events are
+    omitted because they have no effect on the header DB.
+    """
+
+    def __init__(self):
+        super(HeaderEvents, self).__init__()
+        self.seen = set()
+
+    def on_include(self, includer, inclusion, is_global):
+        key = ("i", includer, inclusion)
+        if key not in self.seen:
+            self.seen.add(key)
+            self.append(("i", includer, inclusion, is_global))
+
+    def on_define(self, definer, macro):
+        if "__FILE__" == macro.name:
+            return
+
+        key = ("d", definer, macro.name)
+        if key not in self.seen:
+            self.seen.add(key)
+            self.append(("d", definer) + macro_fields(macro))
+
+
+def apply_header_events(events):
+    for event in events:
+        if event[0] == "d":
+            Header._define(*event[1:])
+        else:
+            Header._on_include(*event[1:])
+
+
+def parse_header(start_dir, prefix, search_paths):
+    """ Parses a header in a separate process.
+
+:returns: `HeaderEvents` and dependencies (see
+    `HeaderParsingSession.dependencies`) if recording
+    """
+
+    session = HeaderParsingSession.current
+    if session is not None:
+        session.begin()
+
+    events = HeaderEvents()
+
+    p = new_preprocessor(start_dir, search_paths)
+    p.on_include = events.on_include
+    p.on_define.append(events.on_define)
+
+    p.parse(input = read_header_to_parse(join(start_dir, prefix)),
+        source = prefix
+    )
+
+    while p.token():
+        pass
+
+    if session is None:
+        return list(events), None
+    return list(events), session.dependencies()
+
 # Type models
 
 
@@ -897,6 +1671,21 @@ class TypeNotRegistered(RuntimeError):
 class Type(object):
     reg = {}
 
+    # A header DB has a lot of macros and references to them. Slots make those
+    # objects several times smaller. `__dict__` is only allocated for
+    # attributes not listed in `__slots__` (e.g., by subclasses without own
+    # `__slots__`).
+    __slots__ = (
+        "__dict__",
+        "__weakref__",
+        "is_named",
+        "incomplete",
+        "definer",
+        "base",
+        "name",
+        "c_name",
+    )
+
     @staticmethod
     def lookup(name):
         if name not in Type.reg:
@@ -1025,6 +1814,11 @@ class Type(object):
 
 class TypeReference(Type):
 
+    __slots__ = (
+        "type",
+        "definer_references",
+    )
+
     def __init__(self, _type):
         if isinstance(_type, TypeReference):
             raise ValueError("Attempt to create type reference to"
@@ -1628,6 +2422,11 @@ HDB_MACRO_ARGS = "args"
 
 class Macro(Type):
 
+    __slots__ = (
+        "args",
+        "text",
+    )
+
     # args is list of strings
     def __init__(self, name, args = None, text = None):
         super(Macro, self).__init__(name = name, incomplete = False)
@@ -2139,104 +2938,7 @@ class SourceChunk(object):
             self.del_reference(r)
 
     def check_cols_fix_up(self, max_cols = 80, indent = "    "):
-        lines = self.code.split('\n')
-        code = ""
-        last_line = len(lines) - 1
-
-        for idx1, line in enumerate(lines):
-            if idx1 == last_line and len(line) == 0:
-                break;
-
-            clear_line = re_clr.sub("\\1", re_anc.sub("\\1", re_can.sub("\\1",
-                         re_nbs.sub("\\1 ", re_nss.sub("\\1 ", line)))))
-
-            if len(clear_line) <= max_cols:
-                code += clear_line + '\n'
-                continue
-
-            line_no_indent_len = len(line) - len(line.lstrip(' '))
-            line_indent = line[:line_no_indent_len]
-            indents = []
-            indents.append(len(indent))
-            tmp_indent = indent
-
-            """
-            1. cut off indent of the line
-            2. surround non-slash spaces with ' ' moving them to separated
-               words
-            3. split the line onto words
-            4. replace any non-breaking space with a regular space in each word
-            """
-            words = list(filter(None, map(
-                lambda a: re_nbs.sub("\\1 ", a),
-                re_nss.sub("\\1 " + NSS + ' ', line.lstrip(' ')).split(' ')
-            )))
-
-            ll = 0 # line length
-            last_word = len(words) - 1
-            for idx2, word in enumerate(words):
-                if word == NSS:
-                    slash = False
-                    continue
-
-                """ split the word onto anchor control sequences and n-grams
-                around them """
-                subwords = list(filter(None, chain(*map(
-                    lambda a: re_can.split(a),
-                    re_anc.split(word)
-                ))))
-                word = ""
-                subword_indents = []
-                for subword in subwords:
-                    if subword == ANC:
-                        subword_indents.append(len(word))
-                    elif subword == CAN:
-                        if subword_indents:
-                            subword_indents.pop()
-                        else:
-                            try:
-                                indents.pop()
-                            except IndexError:
-                                raise RuntimeError("Trying to pop indent"
-                                    " anchor from empty stack"
-                                )
-                    else:
-                        word += re_clr.sub("\\1", subword)
-
-                if ll > 0:
-                    # The variable r reserves characters for " \\"
-                    # that can be added after current word
-                    if idx2 == last_word or words[idx2 + 1] == NSS:
-                        r = 0
-                    else:
-                        r = 2
-                    """ If the line will be broken _after_ this word,
-its length may be still longer than max_cols because of safe breaking (' \').
-If so, brake the line _before_ this word. Safe breaking is presented by
-'r' variable in the expression which is 0 if safe breaking is not required
-after this word.
-                    """
-                    if ll + 1 + len(word) + r > max_cols:
-                        if slash:
-                            code += " \\"
-                        code += '\n' + line_indent + tmp_indent + word
-                        ll = len(line_indent) + len(tmp_indent) + len(word)
-                    else:
-                        code += ' ' + word
-                        ll += 1 + len(word)
-                else:
-                    code += line_indent + word
-                    ll += len(line_indent) + len(word)
-
-                word_indent = ll - len(line_indent) - len(word)
-                for ind in subword_indents:
-                    indents.append(word_indent + ind)
-                tmp_indent = " " * indents[-1] if indents else ""
-                slash = True
-
-            code += '\n'
-
-        self.code = '\n'.join(map(lambda a: a.rstrip(' '), code.split('\n')))
+        self.code = fix_cols(self.code, max_cols = max_cols, indent = indent)
 
     def __lt__(self, other):
         sw = self.weight
@@ -2668,25 +3370,36 @@ def depth_first_sort(chunk, new_chunks):
     # 0 - not visited
     # 1 - visited
     # 2 - added to new_chunks
+
+    # The recursion is emulated because chains of references can be longer
+    # than Python recursion limit.
     chunk.visited = 1
-    for ch in sorted(chunk.references):
-        if ch.visited == 2:
-            continue
-        if ch.visited == 1:
-            msg = "A loop is found in source chunk references on chunk: %s" % (
-                chunk.name
-            )
-            if isinstance(ch, HeaderInclusion):
-                # XXX: Allow loop of header inclusions and hope that they
-                # will eat each other during inclusion optimization pass.
-                print(msg)
+    stack = [(chunk, iter(sorted(chunk.references)))]
+
+    while stack:
+        chunk, references = stack[-1]
+
+        for ch in references:
+            if ch.visited == 2:
                 continue
-            else:
-                raise RuntimeError(msg)
-        depth_first_sort(ch, new_chunks)
+            if ch.visited == 1:
+                msg = "A loop is found in source chunk references on chunk:" \
+                    " %s" % chunk.name
+                if isinstance(ch, HeaderInclusion):
+                    # XXX: Allow loop of header inclusions and hope that they
+                    # will eat each other during inclusion optimization pass.
+                    print(msg)
+                    continue
+                else:
+                    raise RuntimeError(msg)
 
-    chunk.visited = 2
-    new_chunks.add(chunk)
+            ch.visited = 1
+            stack.append((ch, iter(sorted(ch.references))))
+            break
+        else:
+            stack.pop()
+            chunk.visited = 2
+            new_chunks.add(chunk)
 
 
 class SourceFile(object):
@@ -2835,9 +3548,6 @@ digraph Chunks {
             (self.name, "h" if self.is_header else "c")
         ))
 
-        for h in Header.reg.values():
-            h.root = None
-
         # Dictionary is used for fast lookup HeaderInclusion by Header.
         # Assuming only one inclusion per header.
         included_headers = {}
@@ -2850,79 +3560,82 @@ digraph Chunks {
                         " before inclusion optimization."
                     )
                 included_headers[h] = ch
-                # root is originally included header.
-                h.root = h
 
         log("Originally included:\n"
             + "\n".join(h.path for h in included_headers)
         )
 
+        stc = SourceTreeContainer.current
+        if stc is not None and stc.reg_header is Header.reg:
+            closure = stc.inclusion_closure
+        else:
+            # Header registry is not managed by a container (e.g., in tests).
+            closure = InclusionClosure()
+
         # Sorting criteria:
         # 1) Headers with a larger number of users are preferable to use for
         #    substitution since the number of references will probably decrease
         #    faster.
         # 2) Headers with a same number of users ordered by its chunks.
-        stack = list(sorted(included_headers,
+        order = sorted(included_headers,
             key = lambda header: (
                 -len(included_headers[header].users),
                 included_headers[header]
-            ),
-            reverse = True
-        ))
+            )
+        )
 
-        while stack:
-            h = stack.pop()
-
-            for sp in h.inclusions:
-                s = Header[sp]
-                if s in included_headers:
-                    """ If an originally included header (s) is transitively
-included from another one (h.root) then inclusion of s is redundant and must
-be deleted. All references to it must be redirected to inclusion of h (h.root).
-                    """
-                    redundant = included_headers[s]
-                    substitution = included_headers[h.root]
-
-                    """ Because the header inclusion graph is not acyclic,
-a header can (transitively) include itself. Then nothing is to be substituted.
-                    """
-                    if redundant is substitution:
-                        log("Cycle: " + s.path)
-                        continue
+        for h_root in order:
+            for s in order:
+                if s is h_root or not closure.reaches(h_root, s):
+                    continue
 
-                    if redundant.origin is not s:
-                        # inclusion of s was already removed as redundant
-                        log("%s includes %s which already substituted by "
-                            "%s" % (h.root.path, s.path, redundant.origin.path)
-                        )
-                        continue
+                """ If an originally included header (s) is transitively
+included from another one (h_root) then inclusion of s is redundant and must
+be deleted. All references to it must be redirected to inclusion of h_root.
+                """
+                redundant = included_headers[s]
+                substitution = included_headers[h_root]
+
+                """ Because the header inclusion graph is not acyclic,
+headers can (transitively) include each other. Then nothing is to be
+substituted.
+                """
+                if redundant is substitution:
+                    log("Cycle: " + s.path)
+                    continue
 
-                    log("%s includes %s, substitute %s with %s" % (
-                        h.root.path, s.path, redundant.origin.path,
-                        substitution.origin.path
-                    ))
+                if redundant.origin is not s:
+                    # inclusion of s was already removed as redundant
+                    log("%s includes %s which already substituted by "
+                        "%s" % (h_root.path, s.path, redundant.origin.path)
+                    )
+                    continue
+
+                """ If s is only included through another originally included
+header (h) then s is substituted when h is handled. It matters for the choice
+of substitution for s.
+                """
+                if not closure.reaches_avoiding(h_root, s, included_headers):
+                    continue
+
+                log("%s includes %s, substitute %s with %s" % (
+                    h_root.path, s.path, redundant.origin.path,
+                    substitution.origin.path
+                ))
 
-                    self.remove_dup_chunk(substitution, redundant)
+                self.remove_dup_chunk(substitution, redundant)
 
-                    """ The inclusion of s was removed but s could transitively
+                """ The inclusion of s was removed but s could transitively
 include another header (s0) too. Then inclusion of any s0 must be removed and
-all references to it must be redirected to inclusion of h. Hence, reference to
-inclusion of h must be remembered. This algorithm keeps it in included_headers
-replacing reference to removed inclusion of s. If s was processed before h then
-there could be several references to inclusion of s in included_headers. All of
-them must be replaced with reference to h. """
-                    for hdr, chunk in included_headers.items():
-                        if chunk is redundant:
-                            included_headers[hdr] = substitution
-
-                if s.root is None:
-                    stack.append(s)
-                    # Keep reference to originally included header.
-                    s.root = h.root
-
-        # Clear runtime variables
-        for h in Header.reg.values():
-            del h.root
+all references to it must be redirected to inclusion of h_root. Hence,
+reference to inclusion of h_root must be remembered. This algorithm keeps it in
+included_headers replacing reference to removed inclusion of s. If s was
+processed before h_root then there could be several references to inclusion of
+s in included_headers. All of them must be replaced with reference to h_root.
+                """
+                for hdr, chunk in included_headers.items():
+                    if chunk is redundant:
+                        included_headers[hdr] = substitution
 
         log("-= inclusion optimization ended =-")
 
@@ -3042,12 +3755,71 @@ HDB_HEADER_INCLUSIONS = "inclusions"
 HDB_HEADER_MACROS = "macros"
 
 
+class LazyRegistry(dict):
+    """ A registry (like `Header.reg`) whose entries are created on first
+access.
+
+:param has: returns `True` if an entry not created yet can be created for
+    the key
+:param load: creates the entry (and, possibly, others) adding it to the
+    registry
+:param load_all: creates all entries
+
+Iteration over the registry creates all entries. `dict` methods (e.g.,
+`dict.values(reg)`) give access to already created entries only.
+    """
+
+    def __init__(self, has, load, load_all, *args, **kw):
+        super(LazyRegistry, self).__init__(*args, **kw)
+        self._has = has
+        self._load = load
+        self._load_all = load_all
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or self._has(key)
+
+    def __missing__(self, key):
+        if not self._has(key):
+            raise KeyError(key)
+        self._load(key)
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default = None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        self._load_all()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        self._load_all()
+        return dict.__len__(self)
+
+    def keys(self):
+        self._load_all()
+        return dict.keys(self)
+
+    def values(self):
+        self._load_all()
+        return dict.values(self)
+
+    def items(self):
+        self._load_all()
+        return dict.items(self)
+
+
 class SourceTreeContainer(object):
     current = None
 
     def __init__(self):
         self.reg_header = {}
         self.reg_type = {}
+        self.header_index = None
+        # It's shared by all files generated within the container.
+        self.inclusion_closure = InclusionClosure()
 
         # add preprocessor macros those are always defined
         prev = self.set_cur_stc()
@@ -3126,18 +3898,142 @@ digraph HeaderInclusion {
                 pass
 
         # Set up inclusions
-        for dict_h in list_headers:
-            yield
+        with Header.bulk_registration():
+            for dict_h in list_headers:
+                yield
 
-            path = dict_h[HDB_HEADER_PATH]
-            h = self.header_lookup(path)
+                path = dict_h[HDB_HEADER_PATH]
+                h = self.header_lookup(path)
+
+                for inc in dict_h[HDB_HEADER_INCLUSIONS]:
+                    i = self.header_lookup(inc)
+                    h.add_inclusion(i)
+
+                for m in dict_h[HDB_HEADER_MACROS]:
+                    h.add_type(Macro.new_from_dict(m))
+
+    def load_header_index(self, index):
+        """ Makes headers and macros from `index` available. Unlike
+`co_load_header_db`, a header is only created on first access to it or to
+a macro it defines. Inclusions of the header are created too.
+
+`index` identifies headers by integers from `range(index.header_count())`
+and provides:
+
+- find_header(tpath): identifier of the header with path `tpath` (a tuple,
+    see `path2tuple`) or `None`
+- find_macro(name): identifier of the header defining macro `name` or `None`
+- header(hid): tuple (path, is_global, inclusions, macros), where
+    `inclusions` are identifiers and `macros` are tuples (name, args, text)
+- macros(hid): `macros` of the header only
+
+Headers and macros are created in the order `co_load_header_db` would
+create them.
+        """
+
+        self.header_index = index
+        # identifier -> `Header`
+        self.loaded_headers = {}
+
+        self.reg_header = LazyRegistry(
+            self._header_exists,
+            self._load_header,
+            self._load_all_headers,
+            self.reg_header
+        )
+        self.reg_type = LazyRegistry(
+            self._macro_exists,
+            self._load_macro,
+            self._load_all_headers,
+            self.reg_type
+        )
+
+        if SourceTreeContainer.current is self:
+            self.set_cur_stc()
+
+    def _header_exists(self, tpath):
+        hid = self.header_index.find_header(tpath)
+        return hid is not None and hid not in self.loaded_headers
+
+    def _macro_exists(self, name):
+        hid = self.header_index.find_macro(name)
+        return hid is not None and hid not in self.loaded_headers
+
+    def _load_header(self, tpath):
+        self._load_headers([self.header_index.find_header(tpath)])
+
+    def _load_macro(self, name):
+        self._load_headers([self.header_index.find_macro(name)])
 
-            for inc in dict_h[HDB_HEADER_INCLUSIONS]:
-                i = self.header_lookup(inc)
-                h.add_inclusion(i)
+    def _load_all_headers(self):
+        self._load_headers(range(self.header_index.header_count()))
+
+    def _load_headers(self, hids):
+        index = self.header_index
+        loaded = self.loaded_headers
+
+        # Get all headers to be created: given ones and their inclusions
+        # (transitively).
+        new = {}
+        stack = list(hids)
+        while stack:
+            hid = stack.pop()
+            if hid in loaded or hid in new:
+                continue
+            new[hid] = desc = index.header(hid)
+            stack.extend(desc[2])
+
+        if not new:
+            return
+
+        # Headers must be created within this container.
+        prev = self.set_cur_stc()
+
+        new_hids = sorted(new)
+
+        # The registries treat a header (and its macros) as existing (and
+        # try to load it) until it's in `loaded`.
+        for hid in new_hids:
+            loaded[hid] = None
+
+        for hid in new_hids:
+            path, is_global = new[hid][:2]
+            loaded[hid] = Header(path = path, is_global = is_global)
+
+        with Header.bulk_registration():
+            for hid in new_hids:
+                h = loaded[hid]
+                _, _, inclusions, macros = new[hid]
+
+                for i in inclusions:
+                    h.add_inclusion(loaded[i])
+
+                for name, args, text in macros:
+                    h.add_type(Macro(name = name, args = args, text = text))
+
+        if prev is not None:
+            prev.set_cur_stc()
+
+    def iter_macros(self):
+        """ Yields tuples (name, args, text) of all macros. Unlike iteration
+over `reg_type`, it does not create headers and macros of the header index.
+        """
+
+        index = self.header_index
+        # Headers can be loaded during the iteration.
+        loaded = set() if index is None else set(self.loaded_headers)
+
+        for t in list(dict.values(self.reg_type)):
+            if isinstance(t, Macro):
+                yield t.name, t.args, t.text
+
+        if index is None:
+            return
 
-            for m in dict_h[HDB_HEADER_MACROS]:
-                h.add_type(Macro.new_from_dict(m))
+        for hid in range(index.header_count()):
+            if hid not in loaded:
+                for fields in index.macros(hid):
+                    yield fields
 
     def create_header_db(self):
         list_headers = []
@@ -43,7 +43,9 @@ def get_cpp_search_paths():
         if l.startswith(b"#include <...>"):
             break
 
-    paths = set()
+    # Order is kept because it's the order of search. Also, it's a part of
+    # `HeaderParseCache` key.
+    paths = []
     for l in liter:
         # All include paths are indented but list terminator is not:
         # ^End of search list.
@@ -51,6 +53,7 @@ def get_cpp_search_paths():
             break
         raw = l.strip()
         p = raw.decode("utf8") if py_version[0] != 2 else raw
-        paths.add(p)
+        if p not in paths:
+            paths.append(p)
 
     return tuple(paths)
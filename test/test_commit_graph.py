@@ -0,0 +1,280 @@
+from unittest import (
+    TestCase,
+    main
+)
+from os.path import (
+    join
+)
+from types import (
+    GeneratorType
+)
+from shutil import (
+    rmtree
+)
+from tempfile import (
+    mkdtemp
+)
+from common import (
+    CommitGraph,
+    callco
+)
+from qemu.heuristic_cache import (
+    HeuristicCache
+)
+from qemu.heuristic_propagation import (
+    HeuristicPropagation,
+    group_heuristics,
+    heuristic_key
+)
+from qemu.version import (
+    QEMUVersionParameterDescription
+)
+from git import (
+    Repo
+)
+
+
+def run(co):
+    "Runs coroutine without `CoDispatcher` which intercepts exceptions."
+    stack = [co]
+    while stack:
+        try:
+            ret = next(stack[-1])
+        except StopIteration:
+            stack.pop()
+        else:
+            if isinstance(ret, GeneratorType):
+                stack.append(ret)
+
+
+class TestCommitGraph(TestCase):
+
+    def setUp(self):
+        self.tmp = tmp = mkdtemp(prefix = "qdt-test-graph-")
+        self.repo = repo = Repo.init(tmp)
+        git = repo.git
+        git.config("user.name", "a")
+        git.config("user.email", "a@a")
+
+        def commit(msg):
+            git.commit("--allow-empty", "-m", msg)
+            return repo.head.commit.hexsha
+
+        self.commit = commit
+
+        self.r0 = commit("r0")
+        # default branch name depends on Git configuration
+        self.main = repo.active_branch.name
+        git.checkout("-b", "side")
+        self.s1 = commit("s1")
+        git.checkout("-")
+        self.r1 = commit("r1")
+        git.merge("--no-ff", "-m", "m", "side")
+        self.m = repo.head.commit.hexsha
+        git.checkout("--orphan", "other")
+        self.o = commit("o")
+
+    def tearDown(self):
+        rmtree(self.tmp)
+
+    def test_graph(self):
+        graph = CommitGraph()
+        callco(graph.co_build(self.repo))
+
+        self.assertEqual(len(graph), 5)
+        idx = graph.index
+
+        for sha in (self.r0, self.s1, self.r1, self.m, self.o):
+            self.assertIn(sha, graph)
+            self.assertEqual(graph.shas[idx[sha]], sha)
+
+        self.assertEqual(list(graph.iter_parents(idx[self.r0])), [])
+        self.assertEqual(list(graph.iter_parents(idx[self.m])),
+            [idx[self.r1], idx[self.s1]]
+        )
+        self.assertEqual(sorted(graph.iter_children(idx[self.r0])),
+            sorted([idx[self.r1], idx[self.s1]])
+        )
+        self.assertEqual(list(graph.iter_children(idx[self.o])), [])
+
+        # topological numbering
+        for i in range(len(graph)):
+            for p in graph.iter_parents(i):
+                self.assertLess(p, i)
+
+    def test_count_ancestors(self):
+        graph = CommitGraph()
+        callco(graph.co_build(self.repo))
+        idx = graph.index
+
+        self.assertEqual(graph.count_ancestors([
+            idx[self.m], idx[self.s1], idx[self.o]
+        ]), {
+            # m, r1
+            1 : 2,
+            # s1, r0
+            3 : 2,
+            # o
+            4 : 1
+        })
+        self.assertEqual(graph.count_ancestors([idx[self.r1], idx[self.r1]]),
+            # r1, r0
+            { 3 : 2 }
+        )
+        self.assertEqual(graph.count_ancestors([]), {})
+
+    def test_extension(self):
+        path = join(self.tmp, "graph")
+
+        graph = CommitGraph()
+        callco(graph.co_build(self.repo))
+        graph.save(path)
+
+        git = self.repo.git
+        git.checkout(self.main)
+        new = self.commit("new")
+        git.checkout("-b", "side2", self.s1)
+        new2 = self.commit("new2")
+
+        loaded = CommitGraph.load(path)
+        self.assertEqual(loaded.shas, graph.shas)
+        callco(loaded.co_build(self.repo))
+
+        self.assertEqual(len(loaded), 7)
+        # old commits keep numbers
+        self.assertEqual(loaded.shas[:5], graph.shas)
+
+        idx = loaded.index
+        self.assertEqual(list(loaded.iter_parents(idx[new])), [idx[self.m]])
+        self.assertEqual(list(loaded.iter_children(idx[self.m])), [idx[new]])
+        self.assertEqual(sorted(loaded.iter_children(idx[self.s1])),
+            sorted([idx[self.m], idx[new2]])
+        )
+
+        fresh = CommitGraph()
+        callco(fresh.co_build(self.repo))
+        self.assertEqual(set(fresh.shas), set(loaded.shas))
+
+    def propagate(self, vd):
+        graph = CommitGraph()
+        callco(graph.co_build(self.repo))
+
+        groups = group_heuristics(vd)
+        hp = HeuristicPropagation(graph, groups, sorted(groups))
+        run(hp.co_propagate())
+
+        return graph, hp
+
+    def test_propagation(self):
+        graph, hp = self.propagate({
+            self.s1 : [QEMUVersionParameterDescription("a", "new", "old")]
+        })
+
+        values = {}
+        for i, sha in enumerate(graph.shas):
+            values[sha] = hp.rows[hp.row_index[i]]
+
+        # codes: 1 - "new", 2 - "old"
+        self.assertEqual(values[self.r0], (0, 2))
+        self.assertEqual(values[self.s1], (1, 0))
+        self.assertEqual(values[self.r1], (0, 2))
+        self.assertEqual(values[self.m], (1, 0))
+        # unrelated history
+        self.assertEqual(values[self.o], (0, 0))
+
+    def cache(self, graph, groups):
+        names = sorted(groups)
+        hp = HeuristicPropagation(graph, groups, names)
+        run(hp.co_propagate())
+
+        cache = HeuristicCache(graph)
+        cache.update(set(), list(
+            (name, heuristic_key(name, groups[name])) for name in names
+        ), hp)
+        return cache
+
+    def values(self, graph, cache, groups):
+        return dict(
+            (sha, dict(cache.iter_values(i, groups)))
+                for i, sha in enumerate(graph.shas)
+        )
+
+    def test_cache_extension(self):
+        groups = group_heuristics({
+            self.s1 : [QEMUVersionParameterDescription("a", "new", "old")],
+            self.r0 : [QEMUVersionParameterDescription("b", 1, 0)]
+        })
+
+        graph = CommitGraph()
+        callco(graph.co_build(self.repo))
+        cache = self.cache(graph, groups)
+
+        git = self.repo.git
+        git.checkout(self.main)
+        self.commit("new")
+        git.checkout("-b", "side2", self.s1)
+        self.commit("new2")
+        git.checkout(self.main)
+        git.merge("--no-ff", "-m", "m2", "side2")
+
+        callco(graph.co_build(self.repo))
+        self.assertFalse(cache.matches(graph))
+        run(cache.co_extend(graph, groups, set(groups)))
+        self.assertTrue(cache.matches(graph))
+
+        full = CommitGraph()
+        callco(full.co_build(self.repo))
+
+        self.assertEqual(self.values(graph, cache, groups),
+            self.values(full, self.cache(full, groups), groups)
+        )
+
+        # A merge of a commit with new value of "a" and a commit with old
+        # one.
+        git.checkout("-b", "side3", self.r0)
+        self.commit("x")
+        git.checkout(self.main)
+        git.merge("--no-ff", "-m", "m3", "side3")
+
+        callco(graph.co_build(self.repo))
+        self.assertRaises(ValueError, run,
+            cache.co_extend(graph, groups, set(groups))
+        )
+
+    def test_cache_extension_definition(self):
+        "Definition in a new commit changes values of old commits."
+
+        graph = CommitGraph()
+        callco(graph.co_build(self.repo))
+
+        git = self.repo.git
+        git.checkout(self.main)
+        new = self.commit("new")
+
+        groups = group_heuristics({
+            new : [QEMUVersionParameterDescription("a", "new", "old")]
+        })
+        cache = self.cache(graph, groups)
+
+        callco(graph.co_build(self.repo))
+        self.assertRaises(ValueError, run,
+            cache.co_extend(graph, groups, set(groups))
+        )
+        # The parameter is not checked.
+        run(cache.co_extend(graph, groups, set()))
+        self.assertTrue(cache.matches(graph))
+
+    def test_contradiction(self):
+        with self.assertRaises(Exception) as ctx:
+            self.propagate({
+                self.s1 : [QEMUVersionParameterDescription("b", 2, 0)],
+                self.r1 : [QEMUVersionParameterDescription("b", 1, 0)]
+            })
+
+        self.assertIn("Contradictory definition of param 'b' in commit "
+            + self.m, str(ctx.exception)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+from unittest import (
+    TestCase,
+    main,
+    skipUnless
+)
+from os import (
+    environ
+)
+from os.path import (
+    join
+)
+from shutil import (
+    rmtree
+)
+from tempfile import (
+    mkdtemp
+)
+from common import (
+    callco
+)
+from source import (
+    Header,
+    SourceTreeContainer,
+    directives_only
+)
+import source.model
+
+
+class TestDirectivesOnly(TestCase):
+
+    def test_lines(self):
+        self.assertEqual(directives_only("""\
+#ifndef A_H
+#define A_H
+int a; /* comment
+#define NOT_A_MACRO
+*/ int b;
+  /* c */ # define B(x) \\
+    (x + 1) /* multi-line
+comment */ int c;
+#include "b.h" // "comment"
+char *s = "/*";
+#endif
+"""), """\
+#ifndef A_H
+#define A_H
+
+
+
+  /* c */ # define B(x) \\
+    (x + 1) /* multi-line
+comment */ int c;
+#include "b.h" // "comment"
+
+#endif""")
+
+    def test_unreliable(self):
+        # trigraph
+        self.assertIsNone(directives_only("??=define A\n"))
+        # directive after multi-line comment is not on a new line
+        self.assertIsNone(directives_only("/*\n*/ #define A\n"))
+
+
+# Synthetic headers, path -> content. Lines those are not directives are
+# tricky for `directives_only`.
+HEADERS = {
+    "a.h" : """\
+#ifndef A_H
+#define A_H
+#include "b.h"
+#define HDR(name) #name
+#include HDR(c.h)
+#define INC "d.h"
+#include INC
+int a; /* comment
+#define NOT_A_MACRO_1
+*/ int b;
+char *s = "/* #define NOT_A_MACRO_2 */";
+char *q = "\\" /*";
+#define AFTER_STRING 1
+#if defined(B) && B(1) > 1
+#define B_WORKS 1
+#elif C
+#define C_WORKS 1
+#else
+#define NO_B 1
+#endif
+#endif /* A_H */
+""",
+    "b.h" : """\
+#pragma once
+#define B(x) \\
+    ((x) + \\
+     1)
+struct b { int f; }; # define NOT_A_MACRO_3
+  /* c */ # define CONT 1 /* multi-line
+#define NOT_A_MACRO_4
+comment */ int c;
+#ifdef UNDEFINED
+#define UNDEF_BRANCH 1
+#else
+#define DEF_BRANCH 1
+#endif
+""",
+    "c.h" : """\
+#ifndef C_H
+#define C_H
+#define C (1 + \\
+2)
+#undef CONT
+#define CONT 2 // comment #define NOT_A_MACRO_5
+#endif
+""",
+    "d.h" : """\
+// #define NOT_A_MACRO_6
+#define D(a, ...) a(__VA_ARGS__)
+#if C > 2
+#  include "e.h"
+#endif
+""",
+    "e.h" : """\
+#define E 1
+""",
+}
+
+
+class HeaderDBTestHelper(object):
+    "Header DB built in both modes must be same."
+
+    def build_header_db(self, root, directives):
+        prev_mode = source.model.PARSE_DIRECTIVES_ONLY
+        source.model.PARSE_DIRECTIVES_ONLY = directives
+
+        stc = SourceTreeContainer()
+        prev_stc = stc.set_cur_stc()
+        try:
+            callco(Header.co_build_inclusions(root, True, jobs = 1))
+        finally:
+            prev_stc.set_cur_stc()
+            source.model.PARSE_DIRECTIVES_ONLY = prev_mode
+
+        return sorted(stc.create_header_db(), key = lambda h : h["path"])
+
+    def assertSameHeaderDB(self, root):
+        full = self.build_header_db(root, False)
+        self.assertTrue(full)
+        self.assertEqual(full, self.build_header_db(root, True))
+        return full
+
+
+class TestDirectivesOnlySyntheticHeaderDB(HeaderDBTestHelper, TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp(prefix = "qdt-test-cpp-directives-")
+        for path, content in HEADERS.items():
+            with open(join(self.root, path), "w") as f:
+                f.write(content)
+
+    def tearDown(self):
+        rmtree(self.root)
+
+    def test(self):
+        db = self.assertSameHeaderDB(self.root)
+
+        macros = set()
+        for h in db:
+            macros.update(m["name"] for m in h["macros"])
+
+        for m in ["A_H", "AFTER_STRING", "B", "B_WORKS", "C", "CONT", "D",
+            "DEF_BRANCH", "HDR", "INC"
+        ]:
+            self.assertIn(m, macros)
+        for m in ["C_WORKS", "NO_B", "UNDEF_BRANCH"] + list(
+            "NOT_A_MACRO_%d" % i for i in range(1, 7)
+        ):
+            self.assertNotIn(m, macros)
+
+
+QEMU_SRC = environ.get("QDT_TEST_QEMU_SRC", "")
+
+
+@skipUnless(QEMU_SRC, "QDT_TEST_QEMU_SRC is not set")
+class TestDirectivesOnlyHeaderDB(HeaderDBTestHelper, TestCase):
+    "Header DB of QEMU tree must not depend on directives only parsing."
+
+    def test(self):
+        self.assertSameHeaderDB(join(QEMU_SRC, "include"))
+
+
+if __name__ == "__main__":
+    main()
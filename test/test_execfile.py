@@ -4,12 +4,21 @@ from unittest import (
 )
 from os.path import (
     dirname,
+    isfile,
     join
 )
+from shutil import (
+    rmtree
+)
+from tempfile import (
+    mkdtemp
+)
 from common import (
     stdlog,
-    execfile
+    execfile,
+    code_cache_path
 )
+import common.code_cache
 from path import (
     Path
 )
@@ -76,5 +85,42 @@ class TestExecfile(TestCase):
         )
 
 
+class TestCodeCache(TestCase):
+
+    def setUp(self):
+        self.tmp = mkdtemp(prefix = "qdt-test-code-cache-")
+        self.script = join(self.tmp, "script.py")
+
+        self.prev_dir = common.code_cache.CODE_CACHE_DIR
+        common.code_cache.CODE_CACHE_DIR = join(self.tmp, "cache")
+
+    def tearDown(self):
+        common.code_cache.CODE_CACHE_DIR = self.prev_dir
+        rmtree(self.tmp)
+
+    def ex(self, text = None):
+        if text is not None:
+            with open(self.script, "w") as f:
+                f.write(text)
+        loaded = {}
+        execfile(self.script, loaded)
+        return loaded["value"]
+
+    def test(self):
+        self.assertEqual(self.ex("value = 1\n"), 1)
+        self.assertTrue(isfile(code_cache_path(self.script)))
+
+        def no_compile(*_):
+            raise AssertionError("cached code is not used")
+
+        common.code_cache.compile = no_compile
+        try:
+            self.assertEqual(self.ex(), 1)
+        finally:
+            del common.code_cache.compile
+
+        self.assertEqual(self.ex("value = 22\n"), 22)
+
+
 if __name__ == "__main__":
     main()
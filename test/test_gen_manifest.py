@@ -0,0 +1,94 @@
+from unittest import (
+    TestCase,
+    main
+)
+from os import (
+    makedirs
+)
+from os.path import (
+    join
+)
+from shutil import (
+    rmtree
+)
+from tempfile import (
+    mkdtemp
+)
+from qemu import (
+    GenManifest,
+    SysBusDeviceDescription,
+    packages_hash
+)
+
+
+class TestGenManifest(TestCase):
+
+    def setUp(self):
+        self.src = mkdtemp()
+        self.path = join(self.src, "manifest.json")
+
+        self.files = [("dev.h", False, "#define DEV\n", None)]
+        with open(join(self.src, "dev.h"), "w") as f:
+            f.write("#define DEV\n")
+
+    def tearDown(self):
+        rmtree(self.src)
+
+    def test_fingerprint(self):
+        m = GenManifest(self.path, "salt")
+        dev = SysBusDeviceDescription(name = "dev", directory = "misc")
+        fp = m.fingerprint(dev)
+
+        self.assertEqual(fp, m.fingerprint(
+            SysBusDeviceDescription(name = "dev", directory = "misc")
+        ))
+        self.assertNotEqual(fp, m.fingerprint(dev, "extra"))
+        self.assertNotEqual(fp, GenManifest(self.path, "other").fingerprint(
+            dev
+        ))
+        self.assertNotEqual(fp, m.fingerprint(
+            SysBusDeviceDescription(name = "dev", directory = "misc",
+                mmio_num = 2
+            )
+        ))
+
+    def test_lookup(self):
+        m = GenManifest(self.path, "salt")
+        m.account("dev", "fp", self.files, [("dev.h", [], [])])
+        m.save()
+
+        m = GenManifest.load(self.path, "salt")
+        self.assertIsNotNone(m.lookup("dev", "fp", self.src))
+        self.assertIsNone(m.lookup("dev", "fp2", self.src))
+        self.assertIsNone(m.lookup("dev2", "fp", self.src))
+
+        # modified by user
+        with open(join(self.src, "dev.h"), "w") as f:
+            f.write("#define DEV 1\n")
+
+        self.assertIsNone(m.lookup("dev", "fp", self.src))
+
+    def test_packages_hash(self):
+        sub_dir = join(self.src, "pkg", "sub")
+        makedirs(join(self.src, "pkg", "__pycache__"))
+        makedirs(sub_dir)
+
+        def write(path, text):
+            with open(join(self.src, path), "w") as f:
+                f.write(text)
+
+        write(join("pkg", "__init__.py"), "")
+        write(join("pkg", "sub", "mod.py"), "A = 1\n")
+
+        h = packages_hash(self.src, ["pkg"])
+
+        write(join("pkg", "__pycache__", "mod.py"), "")
+        self.assertEqual(h, packages_hash(self.src, ["pkg"]))
+
+        # nested module is changed
+        write(join("pkg", "sub", "mod.py"), "A = 2\n")
+        self.assertNotEqual(h, packages_hash(self.src, ["pkg"]))
+
+
+if __name__ == "__main__":
+    main()
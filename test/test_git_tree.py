@@ -0,0 +1,111 @@
+from unittest import (
+    TestCase,
+    main
+)
+from os import (
+    makedirs
+)
+from os.path import (
+    join
+)
+from shutil import (
+    rmtree
+)
+from tempfile import (
+    mkdtemp
+)
+from common import (
+    GitTree
+)
+from common.git_tools import (
+    GitCatFile
+)
+from git import (
+    Repo
+)
+
+
+class TestGitTree(TestCase):
+
+    def setUp(self):
+        self.tmp = tmp = mkdtemp(prefix = "qdt-test-git-tree-")
+        self.repo = repo = Repo.init(tmp)
+        git = repo.git
+        git.config("user.name", "a")
+        git.config("user.email", "a@a")
+
+        makedirs(join(tmp, "include", "hw", "pci"))
+        for path, content in [
+            ("README", b"readme\n"),
+            ("include/a.h", b"#define A 1\n"),
+            ("include/hw/pci/pci.h", b"#define PCI 2\n"),
+            ("include/hw/b.h", b""),
+        ]:
+            with open(join(tmp, path), "wb") as f:
+                f.write(content)
+
+        git.add("-A")
+        git.commit("-m", "1")
+        self.sha = repo.head.commit.hexsha
+
+        # working directory content does not matter
+        with open(join(tmp, "include", "a.h"), "wb") as f:
+            f.write(b"changed")
+
+        self.trees = []
+
+    def tearDown(self):
+        for tree in self.trees:
+            tree.close()
+        self.repo.close()
+        rmtree(self.tmp)
+
+    def tree(self, *a, **kw):
+        tree = GitTree(self.repo, self.sha, *a, **kw)
+        self.trees.append(tree)
+        return tree
+
+    def test_dirs(self):
+        t = self.tree()
+        self.assertEqual(t.root, self.repo.working_tree_dir)
+        self.assertEqual(sorted(t.listdir("")), ["README", "include"])
+        self.assertEqual(sorted(t.listdir("include")), ["a.h", "hw"])
+        self.assertEqual(sorted(t.listdir("include/hw")), ["b.h", "pci"])
+        self.assertEqual(t.listdir("include/hw/pci"), ["pci.h"])
+
+        self.assertTrue(t.isdir("include/hw"))
+        self.assertFalse(t.isdir("include/a.h"))
+        self.assertTrue(t.isfile("include/hw/pci/pci.h"))
+        self.assertFalse(t.isfile("include/hw"))
+
+        self.assertRaises(OSError, t.listdir, "src")
+
+    def test_paths(self):
+        t = self.tree(paths = ["include/hw"], root = "/qemu")
+        self.assertEqual(t.root, "/qemu")
+        self.assertEqual(t.listdir(""), ["include"])
+        self.assertEqual(t.listdir("include"), ["hw"])
+        self.assertFalse(t.isfile("README"))
+
+    def test_read(self):
+        t = self.tree()
+        self.assertEqual(t.read("include/a.h"), b"#define A 1\n")
+        self.assertEqual(t.read("include/hw/pci/pci.h"), b"#define PCI 2\n")
+        self.assertEqual(t.read("include/hw/b.h"), b"")
+        self.assertEqual(t.read("README"), b"readme\n")
+
+        self.assertRaises(IOError, t.read, "include/c.h")
+
+    def test_missing_object(self):
+        cat_file = GitCatFile(self.repo.git_dir)
+        try:
+            self.assertRaises(IOError, cat_file.read, "0" * 40)
+            # the process is still usable
+            blob = self.tree().blobs["README"]
+            self.assertEqual(cat_file.read(blob), b"readme\n")
+        finally:
+            cat_file.close()
+
+
+if __name__ == "__main__":
+    main()
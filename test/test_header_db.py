@@ -0,0 +1,124 @@
+from unittest import (
+    TestCase,
+    main
+)
+from os import (
+    makedirs
+)
+from os.path import (
+    dirname,
+    join
+)
+from shutil import (
+    rmtree
+)
+from tempfile import (
+    mkdtemp
+)
+from common import (
+    callco
+)
+from source import (
+    Header,
+    SourceTreeContainer
+)
+
+
+# path -> content
+HEADERS = {
+    "a.h" : """\
+#ifndef A_H
+#define A_H
+#include "b.h"
+#include "c/d.h"
+/* redefinition */
+#undef R
+#define R 2
+#define A 1
+#define HDR "c/f.h"
+#include HDR
+#endif
+""",
+    "b.h" : """\
+#ifndef B_H
+#define B_H
+#define R 1
+#define B(x) ((x) + 1)
+#endif
+""",
+    "c/d.h" : """\
+#include "e.h"
+#define D(a, b) \\
+    (a * b)
+""",
+    "c/e.h" : """\
+#ifdef A
+#define E 1
+#else
+#define E 0
+#endif
+/* #define NOT_A_MACRO
+ */
+""",
+    "c/f.h" : """\
+#if defined(B_H) && R > 0
+#define F "yes"
+#else
+# define F "no"
+#endif
+""",
+}
+
+
+def write_headers(root):
+    for path, content in HEADERS.items():
+        full_path = join(root, path)
+        try:
+            makedirs(dirname(full_path))
+        except OSError:
+            pass # exists
+        with open(full_path, "w") as f:
+            f.write(content)
+
+
+def build_header_db(root, jobs):
+    stc = SourceTreeContainer()
+    prev_stc = stc.set_cur_stc()
+    try:
+        callco(Header.co_build_inclusions(root, True, jobs = jobs))
+    finally:
+        prev_stc.set_cur_stc()
+
+    return sorted(stc.create_header_db(), key = lambda h : h["path"])
+
+
+class HeaderDBTestHelper(object):
+
+    def setUp(self):
+        self.root = mkdtemp(prefix = "qdt-test-header-db-")
+        write_headers(self.root)
+
+    def tearDown(self):
+        rmtree(self.root)
+
+    def assertHeaderDB(self, db):
+        # Inclusions are also registered by names used in `#include`.
+        self.assertTrue(set(HEADERS) <= set(h["path"] for h in db))
+
+        macros = set()
+        for h in db:
+            macros.update(m["name"] for m in h["macros"])
+        self.assertTrue(set(["A", "B", "D", "E", "F", "R"]) <= macros)
+        self.assertNotIn("NOT_A_MACRO", macros)
+
+
+class TestParallelHeaderDB(HeaderDBTestHelper, TestCase):
+
+    def test(self):
+        serial = build_header_db(self.root, 1)
+        self.assertHeaderDB(serial)
+        self.assertEqual(serial, build_header_db(self.root, 4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+from unittest import (
+    TestCase,
+    main
+)
+from os.path import (
+    join
+)
+from shutil import (
+    rmtree
+)
+from tempfile import (
+    mkdtemp
+)
+from source import (
+    HeaderParseCache,
+    git_blob_sha
+)
+
+
+class TestHeaderParseCache(TestCase):
+
+    def setUp(self):
+        self.tmp = mkdtemp()
+        self.path = join(self.tmp, "cache")
+        self.shas = {
+            "a.h" : git_blob_sha(b"#include <b.h>\n"),
+            "b.h" : git_blob_sha(b"#define B(x) x\n"),
+        }
+        self.events = [
+            ("i", "a.h", "b.h", True),
+            ("d", "b.h", "B", ["x"], "x"),
+        ]
+
+    def tearDown(self):
+        rmtree(self.tmp)
+
+    def test_blob_sha(self):
+        # `git hash-object` of empty file
+        self.assertEqual(git_blob_sha(b""),
+            "e69de29bb2d1d6434b8b29ae775ad8c2e48c5391"
+        )
+
+    def test_lookup(self):
+        key = HeaderParseCache.key("a.h", self.shas["a.h"], "/src", ["/inc"])
+        self.assertNotEqual(key,
+            HeaderParseCache.key("a.h", self.shas["a.h"], "/src", ["/inc2"])
+        )
+
+        c = HeaderParseCache(self.path)
+        c.account(key, [
+            ("a.h", self.shas["a.h"]),
+            ("b.h", self.shas["b.h"]),
+            ("c.h", None),
+        ], self.events)
+        c.save()
+
+        c = HeaderParseCache.load(self.path)
+        self.assertEqual(c.lookup(key, self.shas.get), self.events)
+        self.assertIsNone(c.lookup("other", self.shas.get))
+
+        # included header is changed
+        self.shas["b.h"] = git_blob_sha(b"#define B(x) (x)\n")
+        self.assertIsNone(c.lookup(key, self.shas.get))
+
+        self.assertEqual((c.hits, c.misses), (1, 2))
+
+
+if __name__ == "__main__":
+    main()
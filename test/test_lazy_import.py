@@ -0,0 +1,108 @@
+from os.path import (
+    abspath,
+    dirname,
+    isdir,
+    join
+)
+from unittest import (
+    TestCase,
+    main,
+    skipIf
+)
+from subprocess import (
+    PIPE,
+    Popen
+)
+from importlib import (
+    import_module
+)
+from common import (
+    code_names,
+    iter_submodules,
+    pythonpath
+)
+from common.pypath import (
+    static_exports
+)
+import sys
+
+
+root_dir = dirname(dirname(abspath(__file__)))
+
+
+def run_python(code):
+    proc = Popen([sys.executable, "-c", code],
+        cwd = root_dir,
+        stdout = PIPE,
+        stderr = PIPE
+    )
+    out, err = proc.communicate()
+    if proc.returncode:
+        raise RuntimeError(err.decode("utf-8"))
+    return out.decode("utf-8").split()
+
+
+@skipIf(sys.version_info < (3, 7), "lazy import requires PEP 562")
+class TestLazyImport(TestCase):
+
+    def assertNoGUIModules(self, code):
+        res = run_python(code + """
+for name in ("tkinter", "Tkinter", "widgets"):
+    print(name in sys.modules)
+""")
+        self.assertEqual(res, ["False"] * 3)
+
+    def test_startup(self):
+        self.assertNoGUIModules("""\
+import sys
+import qdt
+""")
+
+    def test_headless(self):
+        self.assertNoGUIModules("""\
+import sys
+import qdt
+qdt.QProject, qdt.SysBusDeviceDescription, qdt.MachineDescription
+""")
+
+    def test_code_names(self):
+        names = code_names(compile("""\
+from qdt import *
+def f():
+    class A:
+        x = GUIProject
+    return A
+p = QProject([])
+s = "MachineDescription"
+""", "script", "exec"))
+
+        self.assertIn("GUIProject", names)
+        self.assertIn("QProject", names)
+        self.assertNotIn("MachineDescription", names)
+
+    def test_static_exports(self):
+        "Statically found names must be same as actually exported ones."
+
+        for pkg in ("common", "source", "qemu", "debug"):
+            pkg_dir = join(root_dir, pkg)
+            for mod in iter_submodules(pkg_dir):
+                mod_path = join(pkg_dir, mod)
+                if not isdir(mod_path):
+                    mod_path += ".py"
+
+                names = static_exports(mod_path)
+                if names is None:
+                    continue
+
+                with pythonpath(join(root_dir, "debug", "pyelftools")):
+                    module = import_module(pkg + "." + mod)
+
+                self.assertEqual(
+                    set(names),
+                    set(getattr(module, "__all__", names)),
+                    pkg + "." + mod
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -26,11 +26,23 @@ from source import (
     Call,
     Pointer,
     Enumeration,
+    TypeReference,
+    InclusionClosure,
+    SourceChunk,
+    SourceFile,
     add_base_types
 )
+from source.model import (
+    fix_cols,
+    fix_cols_cache
+)
 from common import (
+    OrderedSet,
     ee
 )
+from sys import (
+    getrecursionlimit
+)
 from os.path import (
     join,
     dirname
@@ -723,5 +735,126 @@ void another_test_func(void);
         ]
 
 
+class TestDeepChunkReferences(TestCase):
+
+    def test(self):
+        # longer than Python recursion limit
+        n = getrecursionlimit() * 2
+
+        chain = [SourceChunk(None, "chunk 0", "")]
+        for i in range(1, n):
+            chain.append(SourceChunk(None, "chunk %d" % i, "",
+                references = [chain[-1]]
+            ))
+
+        sf = SourceFile(Source("deep.c"))
+        sf.chunks = OrderedSet(reversed(chain))
+        sf.sort_needed = True
+        sf.sort_chunks()
+
+        self.assertEqual(list(sf.chunks), chain)
+
+
+class TestBulkRegistration(TestCase):
+    """ Type references propagated by `Header.bulk_registration` must be same
+as ones added immediately.
+    """
+
+    def build(self, bulk):
+        Type.reg = {}
+        Header.reg = {}
+
+        a, b, c, d = (Header(name + ".h") for name in "abcd")
+        src = Source("user.c")
+
+        def register():
+            # a <- b <-> c <- d <- user.c
+            a.add_type(Macro("A"))
+            b.add_inclusion(a)
+            c.add_inclusion(b)
+            b.add_inclusion(c)
+            src.add_inclusion(d)
+            d.add_inclusion(c)
+            c.add_type(Macro("C"))
+            d.add_type(Macro("D"))
+            a.add_type(Macro("A2"))
+
+        if bulk:
+            with Header.bulk_registration():
+                register()
+        else:
+            register()
+
+        res = {}
+        for s in (a, b, c, d, src):
+            res[s.path] = dict(
+                (name, (t.type.definer.path, True)
+                    if isinstance(t, TypeReference)
+                    else (t.definer.path, False)
+                ) for name, t in s.types.items()
+            )
+        return res
+
+    def test(self):
+        immediate = self.build(False)
+        self.assertEqual(immediate, self.build(True))
+        self.assertEqual(set(immediate["user.c"]), set(["A", "A2", "C", "D"]))
+        self.assertEqual(immediate["b.h"]["C"], ("c.h", True))
+
+
+class TestInclusionClosure(TestCase):
+
+    def setUp(self):
+        Type.reg = {}
+        Header.reg = {}
+
+    def test(self):
+        a, b, c, d = (Header(name + ".h") for name in "abcd")
+        b.add_inclusion(a)
+
+        closure = InclusionClosure()
+        self.assertTrue(closure.reaches(b, a))
+        self.assertFalse(closure.reaches(a, b))
+
+        # accounted incrementally
+        c.add_inclusion(b)
+        d.add_inclusion(c)
+        self.assertTrue(closure.reaches(d, a))
+        self.assertFalse(closure.reaches_avoiding(d, a, set([b])))
+
+        # cycle
+        a.add_inclusion(d)
+        self.assertTrue(closure.reaches(a, c))
+        self.assertTrue(closure.reaches(c, d))
+
+
+class TestFixCols(TestCase):
+
+    code = (
+        "    x = call(@aarg_one, arg_two, arg_three,@barg_four);\n"
+        "short @b line  \n"
+    )
+    expected = (
+        "    x = call(arg_one, \\\n"
+        "             arg_two, \\\n"
+        "             arg_three, arg_four);\n"
+        "short   line\n"
+    )
+
+    def setUp(self):
+        fix_cols_cache.clear()
+
+    def test(self):
+        self.assertEqual(fix_cols(self.code, max_cols = 30), self.expected)
+        self.assertEqual(fix_cols(""), "")
+
+    def test_cache(self):
+        res = fix_cols(self.code, max_cols = 30)
+        self.assertIs(fix_cols(self.code, max_cols = 30), res)
+        # other parameters are other keys
+        self.assertNotEqual(fix_cols(self.code, max_cols = 80), res)
+        self.assertEqual(len(fix_cols_cache), 2)
+
+
 if __name__ == "__main__":
     main()
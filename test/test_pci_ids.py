@@ -0,0 +1,110 @@
+from unittest import (
+    TestCase,
+    main
+)
+from common import (
+    callco,
+    trie_add,
+    trie_prefixes
+)
+from source import (
+    SourceTreeContainer
+)
+from qemu import (
+    PCIId,
+    PCIClassification
+)
+
+
+class TestTriePrefixes(TestCase):
+
+    def test(self):
+        trie = {}
+        for path in ["A", "AB", "ABCD", "X"]:
+            trie_add(trie, tuple(path), path)
+
+        self.assertEqual(list(trie_prefixes(trie, tuple("ABCDE"))), [
+            ("A", tuple("BCDE")),
+            ("AB", tuple("CDE")),
+            ("ABCD", tuple("E"))
+        ])
+        self.assertEqual(list(trie_prefixes(trie, tuple("ABC"))), [
+            ("A", tuple("BC")),
+            ("AB", tuple("C"))
+        ])
+        self.assertEqual(list(trie_prefixes(trie, ())), [])
+        self.assertEqual(list(trie_prefixes(trie, tuple("Y"))), [])
+
+
+class TestPCIClassification(TestCase):
+
+    def setUp(self):
+        macros = [
+            ("PCI_VENDOR_ID_REDHAT", "0x1b36"),
+            ("PCI_VENDOR_ID_REDHAT_QUMRANET", "0x1af4"),
+            ("PCI_VENDOR_ID_INTEL", "0x8086"),
+            ("PCI_DEVICE_ID_REDHAT_SERIAL", "0x0000"),
+            ("PCI_DEVICE_ID_REDHAT_QUMRANET_X", "0x1000"),
+            ("PCI_DEVICE_ID_INTEL_82801AA_5", "0x2415"),
+            ("PCI_DEVICE_ID_UNKNOWN_DEV", "0x0001"),
+            ("PCI_CLASS_NETWORK_ETHERNET", "0x0200"),
+        ]
+
+        self.stc = stc = SourceTreeContainer()
+        prev_stc = stc.set_cur_stc()
+        self.prev_db = PCIId.db
+        PCIId.db = self.db = PCIClassification()
+        try:
+            callco(stc.co_load_header_db([{
+                "path" : "hw/pci/pci_ids.h",
+                "is_global" : False,
+                "inclusions" : [],
+                "macros" : list(
+                    { "name" : name, "text" : text } for name, text in macros
+                )
+            }]))
+            PCIClassification.build()
+        finally:
+            prev_stc.set_cur_stc()
+
+    def tearDown(self):
+        PCIId.db = self.prev_db
+
+    def test_build(self):
+        db = self.db
+        self.assertTrue(db.built)
+        self.assertEqual(sorted(db.vendors),
+            ["INTEL", "REDHAT", "REDHAT_QUMRANET"]
+        )
+        # longest vendor name prefix wins
+        self.assertEqual(sorted(db.devices), [
+            "INTEL_82801AA_5",
+            "REDHAT_QUMRANET_X",
+            "REDHAT_SERIAL",
+        ])
+        self.assertIs(db.devices["REDHAT_QUMRANET_X"].vendor,
+            db.vendors["REDHAT_QUMRANET"]
+        )
+        self.assertIn("NETWORK_ETHERNET", db.classes)
+
+    def test_lookup(self):
+        db = self.db
+        self.assertIs(db.get_vendor(vid = "0x8086"), db.vendors["INTEL"])
+        self.assertIs(db.get_vendor(vid = "0X1AF4"),
+            db.vendors["REDHAT_QUMRANET"]
+        )
+        self.assertIs(db.get_device(did = "0x2415"),
+            db.devices["INTEL_82801AA_5"]
+        )
+        self.assertIs(db.get_class(cid = "0x0200"),
+            db.classes["NETWORK_ETHERNET"]
+        )
+
+    def test_uniq_ids(self):
+        db = self.db
+        self.assertEqual(db.gen_uniq_vid(), "0x0")
+        self.assertEqual(db.gen_uniq_did(), "0x1")
+
+
+if __name__ == "__main__":
+    main()
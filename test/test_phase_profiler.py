@@ -0,0 +1,60 @@
+from unittest import (
+    TestCase,
+    main
+)
+from json import (
+    load
+)
+from os import (
+    close,
+    remove
+)
+from tempfile import (
+    mkstemp
+)
+from common import (
+    PhaseProfiler
+)
+
+
+class TestPhaseProfiler(TestCase):
+
+    def test_phases(self):
+        profile = PhaseProfiler()
+
+        with profile.phase("first") as p:
+            sum(range(100000))
+            p.count("items", 100000)
+
+        with profile.phase("second"):
+            pass
+
+        self.assertEqual(["first", "second"],
+            list(p.name for p in profile.phases)
+        )
+
+        first = profile.phases[0]
+        self.assertGreaterEqual(first.wall, 0)
+        self.assertGreaterEqual(first.cpu, 0)
+        self.assertEqual(first.counts, dict(items = 100000))
+
+    def test_dump(self):
+        profile = PhaseProfiler()
+        with profile.phase("only"):
+            pass
+
+        fd, path = mkstemp(suffix = ".json")
+        close(fd)
+        try:
+            profile.dump(path, commit_sha = "0" * 40)
+            with open(path) as f:
+                data = load(f)
+        finally:
+            remove(path)
+
+        self.assertEqual(data["commit_sha"], "0" * 40)
+        self.assertEqual(data["phases"][0]["name"], "only")
+
+
+if __name__ == "__main__":
+    main()
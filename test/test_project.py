@@ -0,0 +1,165 @@
+from unittest import (
+    TestCase,
+    main
+)
+from os import (
+    makedirs,
+    walk
+)
+from os.path import (
+    join,
+    relpath
+)
+from shutil import (
+    rmtree
+)
+from tempfile import (
+    mkdtemp
+)
+from common import (
+    CoDispatcher
+)
+from source import (
+    add_base_types,
+    Function,
+    Header,
+    Macro,
+    Source,
+    Type
+)
+from qemu import (
+    MachineDescription,
+    QProject
+)
+
+
+class TestDeviceType(object):
+
+    def __init__(self, name):
+        self.name = name
+
+    def co_gen_sources(self):
+        name = self.name
+        h = Header(join("include", "hw", "misc", name + ".h"))
+        h.add_type(Macro("TYPE_" + name.upper(), text = '"%s"' % name))
+        h.add_type(Function(name = name + "_reset"))
+
+        yield True
+
+        c = Source(join("hw", "misc", name + ".c"))
+        c.add_type(Function(
+            name = name + "_init",
+            body = "    %s_reset();\n" % name,
+            used_types = [Type[name + "_reset"]]
+        ))
+
+        self.sources = [h, c]
+
+
+class TestDeviceDescription(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.directory = "misc"
+        self.project = None
+
+    def gen_type(self):
+        return TestDeviceType(self.name)
+
+
+class TestMachineType(object):
+
+    def __init__(self, name, devices):
+        self.name = name
+        self.devices = devices
+
+    def co_gen_sources(self):
+        yield True
+
+        c = Source(join("hw", "misc", self.name + ".c"))
+        c.add_type(Function(
+            name = self.name + "_init",
+            body = "".join(
+                "    object_new(TYPE_%s);\n" % d.upper() for d in self.devices
+            ),
+            # Macros only, models of devices are created by other processes.
+            used_types = list(Type["TYPE_" + d.upper()] for d in self.devices)
+        ))
+
+        self.sources = [c]
+
+
+class TestMachineDescription(MachineDescription):
+
+    def __init__(self, name, devices):
+        self.name = name
+        self.directory = "misc"
+        self.devices = devices
+        self.project = None
+
+    def link(self):
+        pass
+
+    def gen_type(self):
+        return TestMachineType(self.name, self.devices)
+
+
+def read_tree(root):
+    "Returns {path : content} of all files under `root`."
+
+    tree = {}
+    for cur, _, files in walk(root):
+        for name in files:
+            path = join(cur, name)
+            with open(path, "rb") as f:
+                tree[relpath(path, root)] = f.read()
+    return tree
+
+
+class TestParallelGeneration(TestCase):
+
+    def setUp(self):
+        self.tmp = mkdtemp(prefix = "qdt-test-project-")
+
+    def tearDown(self):
+        rmtree(self.tmp)
+
+    def gen(self, jobs):
+        src = join(self.tmp, str(jobs))
+        makedirs(join(src, "hw", "misc"))
+        for mf in [("hw",), ("hw", "misc")]:
+            open(join(src, *(mf + ("Makefile.objs",))), "w").close()
+
+        Type.reg = {}
+        Header.reg = {}
+        add_base_types()
+
+        devices = ["dev_a", "dev_b", "dev_c"]
+        project = QProject(
+            list(TestDeviceDescription(d) for d in devices) +
+            [TestMachineDescription("mach", devices)]
+        )
+
+        disp = CoDispatcher()
+        disp.enqueue(project.co_gen_all(src, jobs = jobs,
+            with_chunk_graph = True
+        ))
+        disp.dispatch_all()
+        self.assertFalse(disp.failed_tasks)
+
+        return read_tree(src)
+
+    def test(self):
+        serial = self.gen(1)
+
+        self.assertIn(join("hw", "misc", "mach.c"), serial)
+        self.assertIn(join("hw", "misc", "dev_a.c.chunks.gv"), serial)
+        self.assertIn(b'#include "hw/misc/dev_b.h"',
+            serial[join("hw", "misc", "mach.c")]
+        )
+
+        self.assertEqual(serial, self.gen(2))
+
+
+if __name__ == "__main__":
+    main()
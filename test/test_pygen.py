@@ -18,6 +18,9 @@ from traceback import (
 from collections import (
     namedtuple
 )
+from sys import (
+    getrecursionlimit
+)
 import qdt
 from os.path import (
     join,
@@ -206,5 +209,49 @@ class TestNotifier(TestCase, PyGeneratorTestHelper):
         self._namespace = dict(ANotifier = ANotifier)
 
 
+class TestStrings(TestCase, PyGeneratorTestHelper):
+
+    def setUp(self):
+        self._namespace = {}
+        self._original = dict(
+            multiline = [u"first line\n  second line\r\n", "\n"],
+            quotes = ["'\"'", "\"'\"", "\\'\\"],
+            control = "\x00\x07\t\x1f\x7f",
+            non_ascii = u"\xff\u0436\U0001F600",
+            long = "a\\" * (1 << 16)
+        )
+
+
+class Link(object):
+
+    __pygen_deps__ = ("next",)
+
+    def __init__(self, next = None):
+        self.next = next
+
+    def __gen_code__(self, g):
+        g.gen_code(self)
+
+    def __same__(self, o):
+        # iteratively because the chain is deep
+        a, b = self, o
+        while a is not None:
+            if type(a) is not type(b):
+                return False
+            a, b = a.next, b.next
+        return b is None
+
+
+class TestDeepDependencies(TestCase, PyGeneratorTestHelper):
+
+    def setUp(self):
+        self._namespace = dict(Link = Link)
+
+        link = None
+        for _ in range(getrecursionlimit() * 2):
+            link = Link(link)
+        self._original = link
+
+
 if __name__ == "__main__":
     main()
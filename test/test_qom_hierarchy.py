@@ -0,0 +1,113 @@
+from unittest import (
+    TestCase,
+    main
+)
+from common import (
+    callco
+)
+from qemu import (
+    merge_device_tree,
+    QType
+)
+from qemu.qom_hierarchy import (
+    co_fill_children,
+    qtype_to_data
+)
+
+
+class TypeNode(object):
+    "Mimics a node of QOM tree built by `QOMTreeReverser`."
+
+    def __init__(self, name, *children):
+        self.name = name
+        self.children = list(children)
+
+
+# QOM trees of device types of two architectures with overlapping subtrees
+ARCH_TREES = {
+    "arm" : TypeNode("device",
+        TypeNode("sys-bus-device",
+            TypeNode("pl011"),
+            TypeNode("arm-gic")
+        ),
+        TypeNode("pci-device",
+            TypeNode("e1000")
+        )
+    ),
+    "i386" : TypeNode("device",
+        TypeNode("sys-bus-device",
+            TypeNode("hpet")
+        ),
+        TypeNode("pci-device",
+            TypeNode("e1000",
+                TypeNode("e1000-82544gc")
+            )
+        ),
+        TypeNode("isa-device")
+    ),
+}
+
+
+def qtype_desc(root):
+    "Comparable description of QType tree: {name : (arches, children)}."
+
+    return dict(
+        (name, (sorted(c.arches), qtype_desc(c)))
+            for name, c in root.children.items()
+    )
+
+
+def sorted_data(data):
+    name, children = data
+    return (name, sorted(sorted_data(c) for c in children))
+
+
+class TestMergeDeviceTree(TestCase):
+
+    def test_round_trip(self):
+        root = QType("device")
+        callco(co_fill_children(ARCH_TREES["i386"], root, "i386"))
+        data = qtype_to_data(root)
+
+        restored = QType("device")
+        merge_device_tree(restored, data, "i386")
+
+        self.assertEqual(sorted_data(data),
+            sorted_data(qtype_to_data(restored))
+        )
+        self.assertEqual(qtype_desc(root), qtype_desc(restored))
+
+    def test_merge(self):
+        # Device trees are built in the current process...
+        serial = QType("device")
+        for arch, tree in sorted(ARCH_TREES.items()):
+            callco(co_fill_children(tree, serial, arch))
+
+        # ... and in separate processes, then merged.
+        merged = QType("device")
+        for arch, tree in sorted(ARCH_TREES.items()):
+            data = QType("device")
+            callco(co_fill_children(tree, data, arch))
+            merge_device_tree(merged, qtype_to_data(data), arch)
+
+        self.assertEqual(qtype_desc(serial), qtype_desc(merged))
+
+        desc = qtype_desc(merged)
+        self.assertEqual(desc["sys-bus-device"][0], ["arm", "i386"])
+        self.assertEqual(sorted(desc["sys-bus-device"][1]),
+            ["arm-gic", "hpet", "pl011"]
+        )
+        self.assertEqual(desc["isa-device"][0], ["i386"])
+
+        e1000 = desc["pci-device"][1]["e1000"]
+        self.assertEqual(e1000[0], ["arm", "i386"])
+        self.assertEqual(e1000[1], { "e1000-82544gc" : (["i386"], {}) })
+
+        # parent links are consistent
+        for node in merged.descendants():
+            for c in node.children.values():
+                self.assertIs(c.parent, node)
+
+
+if __name__ == "__main__":
+    main()
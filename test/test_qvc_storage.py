@@ -0,0 +1,263 @@
+from unittest import (
+    TestCase,
+    main
+)
+from os.path import (
+    join
+)
+from shutil import (
+    rmtree
+)
+from tempfile import (
+    mkdtemp
+)
+from common import (
+    pythonize,
+    callco
+)
+from source import (
+    Header,
+    Type,
+    TypeReference,
+    SourceTreeContainer
+)
+from qemu import (
+    QType,
+    PCIId,
+    PCIVendorId,
+    PCIDeviceId,
+    PCIClassId,
+    PCIClassification,
+    QVCFormatError,
+    convert_qvc,
+    patch_header_db
+)
+from qemu.version_description import (
+    QemuVersionCache
+)
+from qemu.version import (
+    QVHDict
+)
+
+
+def dt2tuple(node):
+    return (
+        node.name,
+        node.macros,
+        node.arches,
+        list(dt2tuple(c) for c in node.children.values())
+    )
+
+
+class TestQVCStorage(TestCase):
+
+    def setUp(self):
+        self.tmp = mkdtemp(prefix = "qdt-test-qvc-")
+
+        self.qvc = qvc = QemuVersionCache(
+            list_headers = [
+                {
+                    "path" : "hw/a.h",
+                    "is_global" : False,
+                    "inclusions" : ["b.h"],
+                    "macros" : [
+                        { "name" : "A", "text" : "1" },
+                        { "name" : "F", "args" : ["x", "y"], "text" : "x+y" },
+                        { "name" : "E", "args" : [] }
+                    ]
+                },
+                {
+                    "path" : "b.h",
+                    "is_global" : True,
+                    "inclusions" : ["c.h"],
+                    "macros" : [
+                        { "name" : u"B", "text" : u"\"б\"" }
+                    ]
+                },
+                {
+                    "path" : "c.h",
+                    "is_global" : True,
+                    # inclusion cycle
+                    "inclusions" : ["b.h"],
+                    "macros" : [
+                        { "name" : "C" }
+                    ]
+                }
+            ],
+            known_targets = set(["x86_64", "arm"]),
+            version_desc = QVHDict()
+        )
+
+        qvc.version_desc["flag"] = True
+        qvc.version_desc["path"] = "hw/b.h"
+        qvc.version_desc["none"] = None
+
+        root = qvc.device_tree = QType("device", arches = set(["x86_64"]))
+        bus = QType("sys-bus-device",
+            parent = root,
+            macros = ["TYPE_SYS_BUS_DEVICE"],
+            arches = set(["x86_64", "arm"])
+        )
+        QType("dev", parent = bus)
+
+        prev = PCIId.db
+        PCIId.db = qvc.pci_c
+        try:
+            PCIVendorId("INTEL", "0x8086")
+            PCIDeviceId("INTEL", "E1000", "0x100e")
+            PCIClassId("NETWORK_ETHERNET", "0x0200")
+        finally:
+            PCIId.db = prev
+
+    def tearDown(self):
+        rmtree(self.tmp)
+
+    def check(self, loaded):
+        qvc = self.qvc
+
+        self.assertIsNone(loaded.list_headers)
+        self.assertEqual(loaded.header_index.to_list_headers(),
+            qvc.list_headers
+        )
+        self.assertEqual(loaded.known_targets, qvc.known_targets)
+        self.assertEqual(dict(loaded.version_desc), dict(qvc.version_desc))
+        self.assertEqual(loaded.version_desc["flag"], True)
+        self.assertEqual(dt2tuple(loaded.device_tree),
+            dt2tuple(qvc.device_tree)
+        )
+
+        pci_c = loaded.pci_c
+        self.assertIsInstance(pci_c, PCIClassification)
+        self.assertEqual(pci_c.vendors["INTEL"].id, "0x8086")
+        self.assertIs(pci_c.devices["INTEL_E1000"].vendor,
+            pci_c.vendors["INTEL"]
+        )
+        self.assertEqual(pci_c.classes["NETWORK_ETHERNET"].id, "0x0200")
+
+    def test_round_trip(self):
+        path = join(self.tmp, "qvc_test.qvc")
+        self.qvc.save(path)
+        self.check(QemuVersionCache.load(path))
+
+    def test_legacy_conversion(self):
+        legacy_path = join(self.tmp, "qvc_test.py")
+        path = join(self.tmp, "qvc_test.qvc")
+
+        pythonize(self.qvc, legacy_path)
+        convert_qvc(legacy_path, path)
+
+        self.check(QemuVersionCache.load(path))
+
+    def test_lazy_header_db(self):
+        path = join(self.tmp, "qvc_test.qvc")
+        self.qvc.save(path)
+
+        eager = SourceTreeContainer()
+        lazy = SourceTreeContainer()
+        lazy.load_header_index(QemuVersionCache.load(path).header_index)
+
+        prev = eager.set_cur_stc()
+        try:
+            callco(eager.co_load_header_db(self.qvc.list_headers))
+
+            lazy.set_cur_stc()
+
+            self.assertFalse(dict.values(Header.reg))
+            self.assertEqual(sorted(lazy.iter_macros()),
+                sorted(eager.iter_macros())
+            )
+            self.assertFalse(dict.values(Header.reg))
+            self.assertIn("B", Type.reg)
+            self.assertNotIn("D", Type.reg)
+            self.assertFalse(dict.values(Header.reg))
+
+            self.assertTrue(Type.exists("B"))
+            self.assertFalse(Type.exists("D"))
+            self.assertEqual(Type["B"].text, u"\"б\"")
+            self.assertEqual(sorted(dict.keys(Header.reg)),
+                [("b.h",), ("c.h",)]
+            )
+            self.assertIsInstance(Header["c.h"].types["B"], TypeReference)
+
+            self.assertEqual(Type["F"].args, ["x", "y"])
+            self.assertEqual(Header["hw/a.h"].includers, [])
+
+            for tpath, h in eager.reg_header.items():
+                lh = lazy.reg_header[tpath]
+                self.assertEqual(lh.is_global, h.is_global)
+                self.assertEqual(set(lh.inclusions), set(h.inclusions))
+                self.assertEqual(set(lh.types), set(h.types))
+                self.assertEqual(
+                    set(i.path for i in lh.includers),
+                    set(i.path for i in h.includers)
+                )
+            self.assertEqual(set(lazy.reg_type), set(eager.reg_type))
+        finally:
+            prev.set_cur_stc()
+
+    def test_bad_file(self):
+        path = join(self.tmp, "qvc_test.qvc")
+        with open(path, "wb") as f:
+            f.write(b"QVC\x00\xff\x00\x00\x00")
+
+        self.assertRaises(QVCFormatError, QemuVersionCache.load, path)
+
+
+def h(path, inclusions, *macros):
+    return {
+        "path" : path,
+        "is_global" : False,
+        "inclusions" : list(inclusions),
+        "macros" : list({ "name" : m } for m in macros)
+    }
+
+
+class TestHeaderDBPatch(TestCase):
+
+    def test_patch(self):
+        old = [
+            h("a.h", ["b.h", "c.h"], "A", "X"),
+            h("b.h", [], "B", "M"),
+            # defines nothing, so its removal can be patched
+            h("c.h", []),
+            h("d.h", ["c.h"], "D")
+        ]
+        fresh = [
+            # "d.h" is included by modified "b.h" before defining "M" and
+            # defines it first now
+            h("d.h", [], "D", "M"),
+            # "b.h" is modified and includes new "e.h"
+            h("b.h", ["e.h", "d.h"], "B", "B2", "X"),
+            h("e.h", [], "E"),
+        ]
+
+        new = patch_header_db(old, fresh, ["b.h"], ["c.h"])
+
+        self.assertEqual(new, [
+            h("a.h", ["b.h"], "A", "X"),
+            h("d.h", [], "D", "M"),
+            h("b.h", ["e.h", "d.h"], "B", "B2"),
+            h("e.h", [], "E")
+        ])
+        # original DB is not changed
+        self.assertEqual(old[0], h("a.h", ["b.h", "c.h"], "A", "X"))
+        self.assertEqual(old[3], h("d.h", ["c.h"], "D"))
+
+    def test_lost_macro(self):
+        old = [
+            h("a.h", [], "A", "X"),
+            h("b.h", [], "B"),
+        ]
+        # "a.h" does not define "X" now but an unknown header may
+        fresh = [
+            h("a.h", [], "A"),
+        ]
+
+        self.assertIsNone(patch_header_db(old, fresh, ["a.h"], []))
+
+        # removed header
+        self.assertIsNone(patch_header_db(old, [], [], ["b.h"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+from unittest import (
+    TestCase,
+    main
+)
+from os import (
+    utime
+)
+from os.path import (
+    isfile,
+    join
+)
+from shutil import (
+    rmtree
+)
+from tempfile import (
+    mkdtemp
+)
+from common import (
+    callco
+)
+from qemu import (
+    QVCStore
+)
+
+
+class TestQVCStore(TestCase):
+
+    def setUp(self):
+        self.tmp = mkdtemp(prefix = "qdt-test-store-")
+        self.store = QVCStore(join(self.tmp, "store"), 100)
+
+    def tearDown(self):
+        rmtree(self.tmp)
+
+    def make_file(self, name, size):
+        path = join(self.tmp, name)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        return path
+
+    def test_publish_fetch(self):
+        store = self.store
+        dst = join(self.tmp, "local.qvc")
+
+        self.assertFalse(store.fetch("a.qvc", dst))
+        self.assertFalse(isfile(dst))
+
+        store.publish("a.qvc", self.make_file("a", 10))
+        self.assertTrue(store.fetch("a.qvc", dst))
+
+        with open(dst, "rb") as f:
+            self.assertEqual(f.read(), b"x" * 10)
+
+    def test_eviction(self):
+        store = self.store
+
+        store.publish("a.qvc", self.make_file("a", 40))
+        store.publish("b.qvc", self.make_file("b", 40))
+        # "a" is used recently, "b" is least recently used
+        utime(store.entry_path("a.qvc"), (0, 1000))
+        utime(store.entry_path("b.qvc"), (0, 0))
+        store.fetch("a.qvc", join(self.tmp, "local.qvc"))
+
+        store.publish("c.qvc", self.make_file("c", 40))
+
+        self.assertTrue(isfile(store.entry_path("a.qvc")))
+        self.assertFalse(isfile(store.entry_path("b.qvc")))
+        self.assertTrue(isfile(store.entry_path("c.qvc")))
+
+    def test_lock(self):
+        store = self.store
+
+        lock = store.try_lock("a.qvc")
+        self.assertIsNotNone(lock)
+        # held by alive process (this one)
+        self.assertIsNone(store.try_lock("a.qvc"))
+
+        store.publish("a.qvc", self.make_file("a", 10))
+
+        # waiting ends because the entry is published
+        holder = []
+        callco(store.co_lock("a.qvc", holder))
+        self.assertEqual(holder, [None])
+
+        lock.release()
+
+        holder = []
+        callco(store.co_lock("b.qvc", holder))
+        self.assertIsNotNone(holder[0])
+        holder[0].release()
+
+    def test_stale_lock(self):
+        store = self.store
+
+        with open(store.entry_path("a.qvc.lock"), "w") as f:
+            f.write("host-of-dead-process 1")
+        utime(store.entry_path("a.qvc.lock"), (0, 0))
+
+        lock = store.try_lock("a.qvc")
+        self.assertIsNotNone(lock)
+        lock.release()
+
+
+if __name__ == "__main__":
+    main()
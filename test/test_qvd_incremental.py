@@ -0,0 +1,181 @@
+from unittest import (
+    TestCase,
+    main
+)
+from os import (
+    environ,
+    makedirs
+)
+from os.path import (
+    join
+)
+from shutil import (
+    rmtree
+)
+from tempfile import (
+    mkdtemp
+)
+import sys
+from common import (
+    callco
+)
+from qemu import (
+    QemuVersionDescription
+)
+from qemu.version_description import (
+    QemuVersionCache
+)
+from source import (
+    SourceTreeContainer
+)
+from git import (
+    Repo
+)
+
+
+# Those variables redirect Git commands to another repository. E.g., other
+# tests may leave them set.
+GIT_ENVIRON = ("GIT_DIR", "GIT_WORK_TREE", "GIT_INDEX_FILE")
+
+
+class BrokenTree(object):
+    "Mimics `GitTree` whose files cannot be read."
+
+    def __init__(self, root):
+        self.root = root
+        self.blobs = {}
+
+    def isdir(self, path):
+        raise RuntimeError("broken tree")
+
+    listdir = read = isdir
+
+
+class TestIncrementalQVC(TestCase):
+
+    def setUp(self):
+        git_environ = dict(
+            (name, environ.pop(name)) for name in GIT_ENVIRON
+                if name in environ
+        )
+        self.addCleanup(environ.update, git_environ)
+
+        self.tmp = tmp = mkdtemp(prefix = "qdt-test-qvd-")
+        self.src = src = join(tmp, "src")
+        self.build = build = join(tmp, "build")
+
+        makedirs(join(src, "include", "hw"))
+        makedirs(build)
+
+        with open(join(build, "config-host.mak"), "w") as f:
+            f.write("SRC_PATH=%s\nTARGET_DIRS=x86_64-softmmu\n" % src)
+
+        self.repo = repo = Repo.init(src)
+        git = repo.git
+        git.config("user.name", "a")
+        git.config("user.email", "a@a")
+
+        def commit(path, content):
+            with open(join(src, path), "w") as f:
+                f.write(content)
+            git.add("-A")
+            git.commit("-m", path)
+            return repo.head.commit.hexsha
+
+        with open(join(src, "VERSION"), "w") as f:
+            f.write("1.0.0\n")
+
+        self.c0 = commit("include/a.h", "#define A 0\n")
+        self.c1 = commit("include/a.h", "#define A 1\n")
+        self.c2 = commit("include/hw/b.h", "#define B 2\n")
+        self.c3 = commit("README", "3\n")
+        git.checkout("-b", "side", self.c0)
+        self.s = commit("include/a.h", "#define A 4\n")
+
+    def tearDown(self):
+        self.repo.close()
+        rmtree(self.tmp)
+
+    def qvd(self, sha):
+        qvd = QemuVersionDescription(self.build, version = sha)
+        callco(qvd.co_init_commit_graph())
+        return qvd
+
+    def add_qvcs(self, *shas):
+        for sha in shas:
+            open(join(self.build, "qvc_%s.qvc" % sha), "w").close()
+
+    def nearest(self, qvd):
+        nearest = qvd.find_nearest_qvc()
+        if nearest is None:
+            return None
+        path, sha = nearest
+        self.assertEqual(path, join(self.build, "qvc_%s.qvc" % sha))
+        return sha
+
+    def test_nearest(self):
+        qvd = self.qvd(self.c1)
+        self.assertIsNone(self.nearest(qvd))
+
+        # neither ancestor nor descendant, unknown commit
+        self.add_qvcs(self.s, "f" * 40)
+        self.assertIsNone(self.nearest(qvd))
+
+        # descendant
+        self.add_qvcs(self.c3)
+        self.assertEqual(self.nearest(qvd), self.c3)
+
+        # nearer ancestor
+        self.add_qvcs(self.c0)
+        self.assertEqual(self.nearest(qvd), self.c0)
+
+        # the commit itself is ignored
+        self.add_qvcs(self.c1)
+        self.assertEqual(self.nearest(qvd), self.c0)
+
+    def test_changed_headers(self):
+        qvd = self.qvd(self.c1)
+        self.assertEqual(qvd.get_changed_headers(self.c0),
+            ({ "include" : ["a.h"], "tcg" : [] }, [], [])
+        )
+
+        qvd = self.qvd(self.c3)
+        self.assertEqual(qvd.get_changed_headers(self.c1),
+            ({ "include" : [], "tcg" : [] }, [join("hw", "b.h")], [])
+        )
+        self.assertEqual(qvd.get_changed_headers(self.s), (
+            { "include" : ["a.h"], "tcg" : [] }, [join("hw", "b.h")], []
+        ))
+
+        qvd = self.qvd(self.c1)
+        self.assertEqual(qvd.get_changed_headers(self.c3),
+            ({ "include" : [], "tcg" : [] }, [], [join("hw", "b.h")])
+        )
+
+    def test_added_header(self):
+        "Header DB is not patched if a header is added."
+
+        qvd = self.qvd(self.c3)
+        qvd.qvc = QemuVersionCache()
+        callco(qvd.co_update_header_db(self.src, None, [], self.c1))
+        self.assertIsNone(qvd.qvc.header_index)
+        self.assertIsNone(qvd.qvc.list_headers)
+
+    def test_parsing_failure(self):
+        "Source tree container of QVC is restored if header parsing fails."
+
+        # parsing replaces `sys.stdout` and does not restore it on failure
+        self.addCleanup(setattr, sys, "stdout", sys.stdout)
+
+        qvd = self.qvd(self.c1)
+        qvd.qvc = QemuVersionCache()
+        qvd.qvc.stc.set_cur_stc()
+        callco(qvd.co_update_header_db(self.src, BrokenTree(self.src), [],
+            self.c0
+        ))
+        self.assertIs(SourceTreeContainer.current, qvd.qvc.stc)
+        self.assertIsNone(qvd.qvc.header_index)
+
+
+if __name__ == "__main__":
+    main()
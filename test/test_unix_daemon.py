@@ -0,0 +1,131 @@
+from unittest import (
+    TestCase,
+    main,
+    skipUnless
+)
+from os import (
+    _exit,
+    close,
+    environ,
+    fork,
+    kill,
+    pipe,
+    read,
+    stat,
+    waitpid,
+    write
+)
+from os.path import (
+    join
+)
+from shutil import (
+    rmtree
+)
+from signal import (
+    SIGTERM
+)
+from tempfile import (
+    mkdtemp
+)
+from common import (
+    UnixDaemon,
+    daemon_request
+)
+from common.unix_daemon import (
+    UNIX_DAEMON_SUPPORTED
+)
+
+
+class ExitCodeDaemon(UnixDaemon):
+
+    def __init__(self, path, ready_w):
+        super(ExitCodeDaemon, self).__init__(path)
+        self.ready_w = ready_w
+
+    def on_listening(self):
+        write(self.ready_w, b"1")
+
+    def handle(self, argv, report):
+        report(argv)
+        return int(environ.get(argv[0], argv[0]))
+
+    def on_report(self, data):
+        if data == ["7"]:
+            self.dispatcher.enqueue(self.co_endless())
+
+    def co_endless(self):
+        while True:
+            yield True
+
+
+@skipUnless(UNIX_DAEMON_SUPPORTED, "Unix daemon is not supported")
+class TestUnixDaemon(TestCase):
+
+    def setUp(self):
+        self.tmp = mkdtemp(prefix = "qdt-test-daemon-")
+        self.path = join(self.tmp, "daemon.sock")
+        self.pid = None
+
+    def tearDown(self):
+        if self.pid is not None:
+            kill(self.pid, SIGTERM)
+            waitpid(self.pid, 0)
+        rmtree(self.tmp)
+
+    def test_no_daemon(self):
+        self.assertIsNone(daemon_request(self.path, ["1"]))
+
+    def start(self):
+        ready_r, ready_w = pipe()
+        self.pid = fork()
+        if self.pid == 0:
+            try:
+                ExitCodeDaemon(self.path, ready_w).serve_forever()
+            finally:
+                _exit(0)
+
+        close(ready_w)
+        read(ready_r, 1)
+        close(ready_r)
+
+    def test_request(self):
+        self.start()
+
+        self.assertEqual(stat(self.path).st_mode & 0o777, 0o600)
+        self.assertEqual(daemon_request(self.path, ["0"]), 0)
+        self.assertEqual(daemon_request(self.path, ["42"]), 42)
+
+    def test_busy(self):
+        self.start()
+
+        self.assertEqual(daemon_request(self.path, ["7"]), 7)
+        # The daemon is iterating the coroutine but serves requests.
+        self.assertEqual(daemon_request(self.path, ["8"]), 8)
+
+    def test_environ(self):
+        environ["QDT_TEST_DAEMON_CODE"] = "3"
+        environ["TEST_DAEMON_CODE"] = "4"
+        try:
+            self.start()
+
+            # the environment of the client is used
+            environ["TEST_DAEMON_CODE"] = "5"
+            self.assertEqual(daemon_request(self.path, ["TEST_DAEMON_CODE"]),
+                5
+            )
+            self.assertEqual(
+                daemon_request(self.path, ["QDT_TEST_DAEMON_CODE"]), 3
+            )
+
+            # values read by the daemon can differ
+            environ["QDT_TEST_DAEMON_CODE"] = "6"
+            self.assertIsNone(
+                daemon_request(self.path, ["QDT_TEST_DAEMON_CODE"])
+            )
+        finally:
+            del environ["QDT_TEST_DAEMON_CODE"]
+            del environ["TEST_DAEMON_CODE"]
+
+
+if __name__ == "__main__":
+    main()